@@ -0,0 +1,275 @@
+"""
+Воспроизводимый бенчмарк поиска и сквозной задержки.
+
+Для каждого размера синтетического корпуса (synthetic_corpus.py):
+  1. сборка индекса штатным build_faiss_index.py — время и пиковая память процесса, размер файлов;
+  2. задержка эмбеддинга одного запроса и поиска FAISS (p50/p99), прирост памяти при загрузке индекса;
+  3. пропускная способность и задержка /ask под конкурентной нагрузкой — API запускается
+     через uvicorn, GigaChat заменён локальной заглушкой (stub_gigachat.py) с фиксированной задержкой.
+
+Результаты пишутся в JSON (benchmarks/results/<время>.json) вместе с коммитом и параметрами запуска,
+чтобы прогоны до и после изменения можно было сравнить. Рабочие файлы — в benchmarks/work/.
+
+    python benchmarks/run_benchmarks.py --sizes 10000,100000
+    python benchmarks/run_benchmarks.py --sizes 1000000 --index-factory IVF4096,SQ8 --skip-e2e
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import shutil
+import socket
+import subprocess
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List
+
+import numpy as np
+
+BENCH_DIR = Path(__file__).resolve().parent
+REPO_DIR = BENCH_DIR.parent
+SRC_DIR = REPO_DIR / "src"
+sys.path.append(str(SRC_DIR))
+
+from synthetic_corpus import make_queries, write_corpus  # noqa: E402
+
+READY_TIMEOUT = 600  # с: API загружает модель и индекс перед первым ответом
+
+def percentiles(samples_ms: List[float]) -> Dict[str, float]:
+    values = np.asarray(samples_ms)
+    return {
+        "p50_ms": round(float(np.percentile(values, 50)), 3),
+        "p99_ms": round(float(np.percentile(values, 99)), 3),
+        "mean_ms": round(float(values.mean()), 3),
+    }
+
+def rss_mb() -> float:
+    """Текущая резидентная память процесса (Linux)"""
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def file_sizes_mb(index_dir: Path) -> Dict[str, float]:
+    return {
+        name: round((index_dir / name).stat().st_size / 2**20, 2)
+        for name in ("faiss.index", "metadata.jsonl", "bm25.npz")
+        if (index_dir / name).exists()
+    }
+
+# === 1. СБОРКА ИНДЕКСА ===
+def build_index(workdir: Path, index_factory: str) -> dict:
+    """Полная сборка в отдельном процессе: время и пиковая RSS именно индексатора"""
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, str(SRC_DIR / "data_pipeline" / "build_faiss_index.py"),
+         "--full", "--index-factory", index_factory],
+        cwd=workdir,
+    )
+    # rusage конкретного процесса: RUSAGE_CHILDREN дал бы максимум по всем детям, включая API и заглушку
+    _, status, usage = os.wait4(process.pid, 0)
+    elapsed = time.perf_counter() - started
+    process.returncode = os.waitstatus_to_exitcode(status)
+    if process.returncode != 0:
+        raise subprocess.CalledProcessError(process.returncode, process.args)
+    return {
+        "wall_s": round(elapsed, 2),
+        "peak_rss_mb": round(usage.ru_maxrss / 1024, 1),  # ru_maxrss в КиБ (Linux)
+        "files_mb": file_sizes_mb(workdir / "data" / "index"),
+    }
+
+# === 2. ЭМБЕДДИНГ ЗАПРОСА И ПОИСК ===
+def measure_search(workdir: Path, queries: List[str], k: int) -> dict:
+    import faiss
+    from embedding_backends import EMBED_BACKEND, load_embedder
+
+    embedder = load_embedder()
+    embedder.encode(queries[:8], batch_size=8)  # прогрев
+
+    rss_before = rss_mb()
+    started = time.perf_counter()
+    index = faiss.read_index(str(workdir / "data" / "index" / "faiss.index"))
+    load_s = time.perf_counter() - started
+    index_rss_mb = rss_mb() - rss_before
+
+    embed_ms, search_ms = [], []
+    for query in queries:
+        started = time.perf_counter()
+        vector = embedder.encode([query], batch_size=1)
+        embed_ms.append((time.perf_counter() - started) * 1000)
+        started = time.perf_counter()
+        index.search(np.asarray(vector, dtype=np.float32), k)
+        search_ms.append((time.perf_counter() - started) * 1000)
+
+    return {
+        "embed_backend": EMBED_BACKEND,
+        "index_vectors": index.ntotal,
+        "index_load_s": round(load_s, 3),
+        "index_rss_mb": round(index_rss_mb, 1),
+        "query_embedding": percentiles(embed_ms),
+        "faiss_search": {"k": k, **percentiles(search_ms)},
+    }
+
+# === 3. СКВОЗНАЯ НАГРУЗКА НА /ask ===
+def start_server(args: List[str], cwd: Path, env: dict, log_path: Path) -> subprocess.Popen:
+    log = open(log_path, "w", encoding="utf-8")
+    return subprocess.Popen(args, cwd=cwd, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+def stop_server(process: subprocess.Popen):
+    process.terminate()
+    try:
+        process.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+async def wait_ready(url: str, process: subprocess.Popen, timeout: float):
+    import httpx
+
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise RuntimeError(f"Сервер завершился с кодом {process.returncode}")
+            try:
+                await client.get(url, timeout=2)
+                return
+            except httpx.HTTPError:
+                await asyncio.sleep(0.5)
+    raise TimeoutError(f"{url} не ответил за {timeout} с")
+
+async def load_test(api_url: str, queries: List[str], requests: int, concurrency: int) -> dict:
+    import httpx
+
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, errors = [], 0
+
+    async def one(client: httpx.AsyncClient, query: str):
+        nonlocal errors
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                response = await client.get(f"{api_url}/ask", params={"query": query})
+                response.raise_for_status()
+                latencies.append((time.perf_counter() - started) * 1000)
+            except httpx.HTTPError:
+                errors += 1
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(timeout=120, limits=limits) as client:
+        await one(client, queries[0])  # прогрев: первый запрос получает токен и открывает соединения
+        latencies.clear()
+        started = time.perf_counter()
+        await asyncio.gather(*(one(client, queries[i % len(queries)]) for i in range(requests)))
+        elapsed = time.perf_counter() - started
+
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "errors": errors,
+        "throughput_rps": round(len(latencies) / elapsed, 2),
+        **(percentiles(latencies) if latencies else {}),
+    }
+
+def measure_e2e(workdir: Path, queries: List[str], args) -> dict:
+    stub_port, api_port = free_port(), free_port()
+    env = dict(os.environ)
+    env.update({
+        "STUB_LATENCY_MS": str(args.stub_latency_ms),
+        "GIGACHAT_OAUTH_URL": f"http://127.0.0.1:{stub_port}/api/v2/oauth",
+        "GIGACHAT_API_URL": f"http://127.0.0.1:{stub_port}/api/v1/chat/completions",
+        "GIGACHAT_ALLOWED_HOSTS": "127.0.0.1",
+        "GIGACHAT_AUTH_KEY": env.get("GIGACHAT_AUTH_KEY", "Basic stub"),
+        # Кэш ответов отключён: иначе повторяющиеся вопросы измеряли бы только его
+        "ANSWER_CACHE_ENABLED": "0",
+        "TELEGRAM_WEBHOOK": "0",
+    })
+    uvicorn = [sys.executable, "-m", "uvicorn", "--host", "127.0.0.1", "--log-level", "warning"]
+    stub = start_server(uvicorn + ["stub_gigachat:app", "--app-dir", str(BENCH_DIR), "--port", str(stub_port)],
+                        workdir, env, workdir / "stub.log")
+    api = None
+    try:
+        api = start_server(uvicorn + ["api.main:app", "--app-dir", str(SRC_DIR), "--port", str(api_port),
+                                      "--workers", str(args.api_workers)],
+                           workdir, env, workdir / "api.log")
+        api_url = f"http://127.0.0.1:{api_port}"
+        asyncio.run(wait_ready(f"http://127.0.0.1:{stub_port}/docs", stub, 30))
+        asyncio.run(wait_ready(f"{api_url}/metrics", api, READY_TIMEOUT))
+        result = asyncio.run(load_test(api_url, queries, args.e2e_requests, args.concurrency))
+        result.update({"stub_latency_ms": args.stub_latency_ms, "api_workers": args.api_workers})
+        return result
+    finally:
+        if api is not None:
+            stop_server(api)
+        stop_server(stub)
+
+# === ЗАПУСК ===
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=REPO_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+def run_size(size: int, args, queries: List[str]) -> dict:
+    workdir = args.workdir / str(size)
+    clean_dir = workdir / "data" / "clean"
+    if args.fresh and workdir.exists():
+        shutil.rmtree(workdir)
+    print(f"=== {size} чанков ===")
+
+    started = time.perf_counter()
+    n_files = write_corpus(clean_dir, size, seed=args.seed) if not clean_dir.exists() else None
+    result = {"chunks": size, "corpus_files": n_files, "corpus_s": round(time.perf_counter() - started, 2)}
+
+    result["build"] = build_index(workdir, args.index_factory)
+    print("сборка:", result["build"])
+    result["search"] = measure_search(workdir, queries, args.k)
+    print("поиск:", result["search"])
+    if not args.skip_e2e:
+        result["e2e"] = measure_e2e(workdir, queries, args)
+        print("/ask:", result["e2e"])
+    return result
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Бенчмарк сборки индекса, поиска и /ask на синтетическом корпусе")
+    parser.add_argument("--sizes", default="10000", help="размеры корпуса в чанках через запятую, напр. 10000,100000,1000000")
+    parser.add_argument("--index-factory", default="Flat", help="тип индекса FAISS для сборки")
+    parser.add_argument("--queries", type=int, default=200, help="запросов для замера эмбеддинга и поиска")
+    parser.add_argument("--k", type=int, default=20, help="кандидатов в поиске FAISS")
+    parser.add_argument("--e2e-requests", type=int, default=500, help="запросов к /ask в нагрузочном тесте")
+    parser.add_argument("--concurrency", type=int, default=16, help="одновременных запросов к /ask")
+    parser.add_argument("--api-workers", type=int, default=1, help="воркеров uvicorn для API")
+    parser.add_argument("--stub-latency-ms", type=float, default=300, help="задержка ответа заглушки GigaChat")
+    parser.add_argument("--skip-e2e", action="store_true", help="не запускать сквозной нагрузочный тест")
+    parser.add_argument("--seed", type=int, default=0, help="seed генерации корпуса")
+    parser.add_argument("--fresh", action="store_true", help="пересоздать корпус, даже если он уже сгенерирован")
+    parser.add_argument("--workdir", type=Path, default=BENCH_DIR / "work")
+    parser.add_argument("--output", type=Path, default=None,
+                        help="файл результатов (по умолчанию benchmarks/results/<время>.json)")
+    args = parser.parse_args()
+    args.workdir = args.workdir.resolve()
+
+    started_at = datetime.now()
+    queries = make_queries(args.queries)
+    report = {
+        "started": started_at.isoformat(timespec="seconds"),
+        "git_commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "config": {k: str(v) if isinstance(v, Path) else v for k, v in vars(args).items()},
+        "results": [run_size(int(size), args, queries) for size in args.sizes.split(",")],
+    }
+
+    output = args.output or BENCH_DIR / "results" / f"{started_at:%Y%m%d-%H%M%S}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"Результаты: {output}")
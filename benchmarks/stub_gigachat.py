@@ -0,0 +1,51 @@
+"""
+Локальная заглушка GigaChat (OAuth + chat/completions) для нагрузочных тестов без внешнего API.
+
+Отвечает с фиксированной задержкой, поддерживает stream: true (SSE, как GigaChat).
+
+    uvicorn stub_gigachat:app --app-dir benchmarks --port 9443
+    GIGACHAT_OAUTH_URL=http://127.0.0.1:9443/api/v2/oauth \
+    GIGACHAT_API_URL=http://127.0.0.1:9443/api/v1/chat/completions \
+    GIGACHAT_ALLOWED_HOSTS=127.0.0.1 uvicorn src.api.main:app
+"""
+
+import asyncio
+import json
+import os
+import time
+import uuid
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+STUB_LATENCY_MS = float(os.getenv("STUB_LATENCY_MS", "300"))  # время «генерации» ответа
+STUB_ANSWER_WORDS = int(os.getenv("STUB_ANSWER_WORDS", "60"))
+
+ANSWER = " ".join(["Паи", "фонда", "можно", "погасить", "через", "управляющую", "компанию."] * 20)
+
+app = FastAPI(title="GigaChat stub")
+
+@app.post("/api/v2/oauth")
+async def oauth():
+    return {"access_token": uuid.uuid4().hex, "expires_at": int((time.time() + 1800) * 1000)}
+
+@app.post("/api/v1/chat/completions")
+async def completions(request: Request):
+    payload = await request.json()
+    words = ANSWER.split()[:STUB_ANSWER_WORDS]
+
+    if not payload.get("stream"):
+        await asyncio.sleep(STUB_LATENCY_MS / 1000)
+        return JSONResponse({"choices": [{"message": {"role": "assistant", "content": " ".join(words)}}]})
+
+    async def events():
+        # Задержка распределяется по токенам: первый приходит примерно через 1/10 общего времени
+        await asyncio.sleep(STUB_LATENCY_MS / 10000)
+        step = STUB_LATENCY_MS / 1000 * 0.9 / max(len(words), 1)
+        for word in words:
+            chunk = {"choices": [{"delta": {"content": word + " "}}]}
+            yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+            await asyncio.sleep(step)
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
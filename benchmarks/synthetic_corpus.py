@@ -0,0 +1,86 @@
+"""
+Синтетический русскоязычный корпус для бенчмарков.
+
+Тексты собираются из шаблонов предметной области (фонды, паи, налоги, отчётность) с номерами
+и датами, поэтому чанки уникальны (дедупликация их не схлопывает), а в BM25 есть и частые,
+и редкие термины. Генерация детерминирована (seed): корпус одного размера одинаков между запусками.
+
+Формат совпадает с data/clean: <name>.txt с первой строкой "[URL] ..." и <name>.meta.json.
+"""
+
+import json
+import random
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import List
+
+SENTENCES_PER_CHUNK = 5  # как CHUNK_SIZE в build_faiss_index.py
+CHUNKS_PER_FILE = 50
+
+FUNDS = ["ЗПИФ недвижимости", "ОПИФ облигаций", "ОПИФ акций", "ИПИФ смешанных инвестиций", "БПИФ денежного рынка",
+         "ЗПИФ комбинированный", "ОПИФ рыночных финансовых инструментов"]
+SUBJECTS = ["Управляющая компания", "Специализированный депозитарий", "Пайщик", "Квалифицированный инвестор",
+            "Регистратор", "Банк России", "Агент по выдаче паёв", "Инвестиционный комитет"]
+VERBS = ["рассчитывает", "публикует", "утверждает", "погашает", "выдаёт", "раскрывает", "проверяет", "обменивает"]
+OBJECTS = ["стоимость чистых активов", "расчётную стоимость пая", "правила доверительного управления",
+           "отчёт о приросте имущества", "заявку на погашение", "справку о доходах", "перечень имущества фонда",
+           "требования к структуре активов", "вознаграждение управляющей компании", "налоговую базу пайщика"]
+CIRCUMSTANCES = ["ежедневно", "в течение трёх рабочих дней", "по окончании отчётного квартала", "не позднее 15 числа",
+                 "после решения общего собрания", "при выплате промежуточного дохода", "в соответствии с 156-ФЗ",
+                 "на сайте компании", "по запросу пайщика", "с учётом налогового вычета"]
+QUESTION_TEMPLATES = [
+    "Как {subject} {verb} {object}?",
+    "Кто {verb} {object} для {fund}?",
+    "Когда {verb_impersonal} {object}?",
+    "Что такое {object} в {fund}?",
+    "Где узнать {object} фонда {reg}?",
+]
+IMPERSONAL = {"рассчитывает": "рассчитывают", "публикует": "публикуют", "утверждает": "утверждают",
+              "погашает": "погашают", "выдаёт": "выдают", "раскрывает": "раскрывают",
+              "проверяет": "проверяют", "обменивает": "обменивают"}
+
+def _registration(rng: random.Random) -> str:
+    return f"{rng.randint(1000, 9999)}-{rng.randint(10000000, 99999999)}"
+
+def make_sentence(rng: random.Random) -> str:
+    fund = rng.choice(FUNDS)
+    date = (datetime(2015, 1, 1) + timedelta(days=rng.randint(0, 3650))).strftime("%d.%m.%Y")
+    pattern = rng.randrange(3)
+    if pattern == 0:
+        return (f"{rng.choice(SUBJECTS)} {rng.choice(VERBS)} {rng.choice(OBJECTS)} {fund} "
+                f"{rng.choice(CIRCUMSTANCES)}.")
+    if pattern == 1:
+        return (f"Правила {fund} № {_registration(rng)} зарегистрированы {date}, "
+                f"{rng.choice(SUBJECTS).lower()} {rng.choice(VERBS)} {rng.choice(OBJECTS)}.")
+    return f"По состоянию на {date} {rng.choice(OBJECTS)} {fund} составляет {rng.randint(1, 9_999_999)} рублей."
+
+def make_chunk(rng: random.Random) -> str:
+    return " ".join(make_sentence(rng) for _ in range(SENTENCES_PER_CHUNK))
+
+def make_queries(n: int, seed: int = 1) -> List[str]:
+    rng = random.Random(seed)
+    queries = []
+    for _ in range(n):
+        verb = rng.choice(VERBS)
+        queries.append(rng.choice(QUESTION_TEMPLATES).format(
+            subject=rng.choice(SUBJECTS).lower(), verb=verb, verb_impersonal=IMPERSONAL[verb],
+            object=rng.choice(OBJECTS), fund=rng.choice(FUNDS), reg=_registration(rng),
+        ))
+    return queries
+
+def write_corpus(out_dir: Path, n_chunks: int, seed: int = 0) -> int:
+    """Пишет корпус из n_chunks чанков в out_dir (формат data/clean); возвращает число файлов"""
+    rng = random.Random(seed)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    timestamp = datetime(2025, 1, 1).isoformat()
+    n_files = 0
+    for start in range(0, n_chunks, CHUNKS_PER_FILE):
+        name = f"synthetic_{n_files:06d}"
+        url = f"https://sfn-am.ru/synthetic/{n_files}"
+        chunks = [make_chunk(rng) for _ in range(min(CHUNKS_PER_FILE, n_chunks - start))]
+        with open(out_dir / f"{name}.txt", "w", encoding="utf-8") as f:
+            f.write(f"[URL] {url}\n" + "\n".join(chunks) + "\n")
+        with open(out_dir / f"{name}.meta.json", "w", encoding="utf-8") as f:
+            json.dump({"url": url, "path": f"data/raw/{name}.html", "timestamp": timestamp}, f, ensure_ascii=False)
+        n_files += 1
+    return n_files
@@ -0,0 +1,140 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+import faiss
+import numpy as np
+
+def normalize_query(query: str) -> str:
+    """Приводит вопрос к каноническому виду для точного совпадения"""
+    text = query.lower().replace("ё", "е")
+    text = re.sub(r"\s+", " ", text).strip()
+    return text.rstrip("?!.…, ")
+
+@dataclass
+class _Entry:
+    entry_id: int
+    result: Dict
+    created_at: float
+
+class AnswerCache:
+    """Двухуровневый кэш ответов: точное совпадение + семантическое.
+
+    Второй уровень — небольшой FAISS-индекс (косинусная близость) по
+    эмбеддингам закэшированных вопросов. Записи вытесняются по LRU и TTL,
+    а при смене версии поискового индекса кэш полностью сбрасывается.
+    """
+
+    def __init__(self, dim: int, max_entries: int = 1000, ttl_seconds: float = 3600,
+                 similarity_threshold: float = 0.95):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self._dim = dim
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._keys_by_id: Dict[int, str] = {}
+        self._vectors = faiss.IndexIDMap(faiss.IndexFlatIP(dim))
+        self._next_id = 0
+        self._version: Optional[str] = None
+        self._lock = threading.Lock()
+        self._stats = {"exact_hits": 0, "semantic_hits": 0, "misses": 0, "evictions": 0, "expired": 0, "invalidations": 0}
+
+    # === ПУБЛИЧНЫЙ ИНТЕРФЕЙС ===
+    def get_exact(self, query: str, version: str) -> Optional[Dict]:
+        """Поиск по нормализованному тексту вопроса (без эмбеддинга)"""
+        key = normalize_query(query)
+        with self._lock:
+            self._check_version(version)
+            entry = self._live_entry(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            self._stats["exact_hits"] += 1
+            return entry.result
+
+    def get_semantic(self, query_vec: np.ndarray, version: str) -> Optional[Dict]:
+        """Поиск ближайшего закэшированного вопроса по косинусной близости"""
+        vec = self._normalize(query_vec)
+        with self._lock:
+            self._check_version(version)
+            if self._vectors.ntotal == 0:
+                self._stats["misses"] += 1
+                return None
+            scores, ids = self._vectors.search(vec, 1)
+            entry_id = int(ids[0][0])
+            key = self._keys_by_id.get(entry_id)
+            if entry_id < 0 or key is None or scores[0][0] < self.similarity_threshold:
+                self._stats["misses"] += 1
+                return None
+            entry = self._live_entry(key)
+            if entry is None:
+                self._stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats["semantic_hits"] += 1
+            return entry.result
+
+    def put(self, query: str, query_vec: np.ndarray, result: Dict, version: str):
+        key = normalize_query(query)
+        vec = self._normalize(query_vec)
+        with self._lock:
+            self._check_version(version)
+            if key in self._entries:
+                self._remove(key)
+            entry = _Entry(entry_id=self._next_id, result=result, created_at=time.monotonic())
+            self._next_id += 1
+            self._entries[key] = entry
+            self._keys_by_id[entry.entry_id] = key
+            self._vectors.add_with_ids(vec, np.array([entry.entry_id], dtype=np.int64))
+            while len(self._entries) > self.max_entries:
+                oldest_key = next(iter(self._entries))
+                self._remove(oldest_key)
+                self._stats["evictions"] += 1
+
+    def invalidate(self):
+        with self._lock:
+            self._clear()
+            self._stats["invalidations"] += 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {**self._stats, "size": len(self._entries)}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    # === ВНУТРЕННИЕ МЕТОДЫ (вызываются под self._lock) ===
+    def _normalize(self, query_vec: np.ndarray) -> np.ndarray:
+        vec = np.array(query_vec, dtype=np.float32).reshape(1, self._dim)
+        faiss.normalize_L2(vec)
+        return vec
+
+    def _check_version(self, version: str):
+        if self._version != version:
+            if self._version is not None:
+                self._stats["invalidations"] += 1
+            self._clear()
+            self._version = version
+
+    def _live_entry(self, key: str) -> Optional[_Entry]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if time.monotonic() - entry.created_at > self.ttl_seconds:
+            self._remove(key)
+            self._stats["expired"] += 1
+            return None
+        return entry
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key)
+        self._keys_by_id.pop(entry.entry_id, None)
+        self._vectors.remove_ids(np.array([entry.entry_id], dtype=np.int64))
+
+    def _clear(self):
+        self._entries.clear()
+        self._keys_by_id.clear()
+        self._vectors.reset()
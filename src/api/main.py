@@ -1,20 +1,94 @@
-from fastapi import FastAPI, Query, HTTPException
+from fastapi import FastAPI, Query, HTTPException, Header, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response, StreamingResponse
 from pydantic import BaseModel, Field
 from typing import List, Optional
 import sys
 import os
+import json
 import logging
+import secrets
+import time
+import importlib.util
+from contextlib import asynccontextmanager
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
-from rag_pipeline import answer_query
-from utils.logger import log_interaction
+from rag_pipeline import (
+    answer_query_async,
+    stream_answer_query_async,
+    index_manager,
+    reload_index,
+    start_background_tasks,
+    shutdown as shutdown_pipeline,
+)
+from utils.logger import log_interaction, close_interaction_log
 from utils.filters import is_valid_query
+from utils.metrics import REQUEST_LATENCY, RESPONSE_SIZE, render_metrics
 
 # Настройка логгера
 logger = logging.getLogger(__name__)
 
-app = FastAPI(title="SFN RAG Chatbot API", version="1.0")
+# Режим вебхука: Telegram присылает апдейты в этот процесс, бот отвечает через пайплайн напрямую, без HTTP до /ask
+TELEGRAM_WEBHOOK = os.getenv("TELEGRAM_WEBHOOK", "0") == "1"
+TELEGRAM_WEBHOOK_URL = os.getenv("TELEGRAM_WEBHOOK_URL")  # публичный https://.../telegram/webhook
+TELEGRAM_WEBHOOK_SECRET = os.getenv("TELEGRAM_WEBHOOK_SECRET")
+BOT_PATH = os.path.join(os.path.dirname(__file__), "..", "telegram", "bot.py")
+
+# Приложение python-telegram-bot в режиме вебхука
+telegram_app = None
+telegram_update_cls = None
+
+def load_bot_module():
+    """Загружает telegram/bot.py по пути: каталог src/telegram не должен подменять библиотеку telegram"""
+    spec = importlib.util.spec_from_file_location("sfn_telegram_bot", BOT_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+async def start_telegram_webhook():
+    global telegram_app, telegram_update_cls
+    bot = load_bot_module()
+    if not bot.TELEGRAM_TOKEN:
+        raise RuntimeError("Не найден TELEGRAM_TOKEN в .env")
+    if not TELEGRAM_WEBHOOK_SECRET:
+        raise RuntimeError("Для режима вебхука нужен TELEGRAM_WEBHOOK_SECRET")
+    bot.answer_source = stream_answer_query_async
+    telegram_update_cls = bot.Update
+    telegram_app = bot.build_application(bot.TELEGRAM_TOKEN, polling=False)
+    await telegram_app.initialize()
+    await telegram_app.start()
+    if TELEGRAM_WEBHOOK_URL:
+        await telegram_app.bot.set_webhook(
+            url=TELEGRAM_WEBHOOK_URL,
+            secret_token=TELEGRAM_WEBHOOK_SECRET,
+            allowed_updates=["message"],
+        )
+    logger.info("Telegram-бот запущен в режиме вебхука")
+
+async def stop_telegram_webhook():
+    global telegram_app
+    if telegram_app is not None:
+        await telegram_app.stop()
+        await telegram_app.shutdown()
+        telegram_app = None
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Фоновая проверка новой сборки индекса (INDEX_WATCH_INTERVAL)
+    start_background_tasks()
+    if TELEGRAM_WEBHOOK:
+        await start_telegram_webhook()
+    yield
+    await stop_telegram_webhook()
+    # Закрываем пул соединений GigaChat и пул потоков пайплайна
+    await shutdown_pipeline()
+    # Дописываем журнал запросов из очереди
+    close_interaction_log()
+
+app = FastAPI(title="SFN RAG Chatbot API", version="1.0", lifespan=lifespan)
+
+# Токен для административных эндпоинтов; если не задан — они отключены
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
 
 # БЕЗОПАСНОСТЬ: Ограниченный CORS для продакшена
 # В продакшене замените на конкретные домены
@@ -28,6 +102,26 @@ app.add_middleware(
     allow_headers=["Content-Type", "Authorization"],  # Только необходимые заголовки
 )
 
+# Эндпоинты с метриками по отдельности; остальные пути — в "other", чтобы не плодить метки
+METERED_ENDPOINTS = {"/ask", "/ask/stream", "/telegram/webhook"}
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    started = time.perf_counter()
+    response = await call_next(request)
+    endpoint = request.url.path if request.url.path in METERED_ENDPOINTS else "other"
+    # Для потоковых ответов — время до заголовков; полная длительность генерации — этап llm
+    REQUEST_LATENCY.labels(endpoint=endpoint).observe(time.perf_counter() - started)
+    content_length = response.headers.get("content-length")
+    if content_length:
+        RESPONSE_SIZE.labels(endpoint=endpoint).observe(int(content_length))
+    return response
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
 class Source(BaseModel):
     url: str = Field(..., description="URL источника", max_length=2048)
     timestamp: str = Field(..., description="Временная метка источника")
@@ -36,21 +130,34 @@ class AnswerResponse(BaseModel):
     answer: str = Field(..., description="Ответ на вопрос", max_length=10000)
     sources: List[Source] = Field(default_factory=list, description="Список источников")
 
-@app.get("/ask", response_model=AnswerResponse)
-async def ask(query: str = Query(..., description="Вопрос пользователя", min_length=5, max_length=2000)):
-    # Валидация запроса на уровне API
+class ReloadResponse(BaseModel):
+    reloaded: bool = Field(..., description="Была ли загружена новая версия индекса")
+    version: str = Field(..., description="Текущая версия индекса")
+    chunks: int = Field(..., description="Количество чанков в индексе")
+
+INVALID_QUERY_ANSWER = "Пожалуйста, задайте осмысленный вопрос."
+
+def check_query(query: str):
+    """Валидация запроса на уровне API"""
     if not query or len(query.strip()) < 5:
         raise HTTPException(status_code=400, detail="Вопрос слишком короткий")
-    
+
     # Проверка на потенциально опасные символы (базовая защита от инъекций)
     if any(char in query for char in ['\x00', '\n', '\r', '\t']):
         raise HTTPException(status_code=400, detail="Вопрос содержит недопустимые символы")
-    
+
+def sse_event(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.get("/ask", response_model=AnswerResponse)
+async def ask(query: str = Query(..., description="Вопрос пользователя", min_length=5, max_length=2000)):
+    check_query(query)
+
     if not is_valid_query(query):
-        return AnswerResponse(answer="Пожалуйста, задайте осмысленный вопрос.", sources=[])
+        return AnswerResponse(answer=INVALID_QUERY_ANSWER, sources=[])
 
     try:
-        result = answer_query(query)
+        result = await answer_query_async(query)
     except FileNotFoundError as e:
         logger.error(f"Файл индекса или метаданных не найден: {e}")
         raise HTTPException(status_code=503, detail="Сервис временно недоступен")
@@ -66,3 +173,69 @@ async def ask(query: str = Query(..., description="Вопрос пользова
     )
 
     return result
+
+@app.get("/ask/stream")
+async def ask_stream(query: str = Query(..., description="Вопрос пользователя", min_length=5, max_length=2000)):
+    """Ответ потоком Server-Sent Events: sources, затем token (фрагменты ответа), затем done (полный ответ)"""
+    check_query(query)
+
+    async def events():
+        if not is_valid_query(query):
+            yield sse_event("sources", [])
+            yield sse_event("token", INVALID_QUERY_ANSWER)
+            yield sse_event("done", {"answer": INVALID_QUERY_ANSWER, "sources": []})
+            return
+
+        try:
+            async for event, data in stream_answer_query_async(query):
+                if event == "done":
+                    log_interaction(
+                        query=query,
+                        answer=data["answer"],
+                        sources=[s["url"] for s in data["sources"]],
+                        source="api"
+                    )
+                yield sse_event(event, data)
+        except FileNotFoundError as e:
+            logger.error(f"Файл индекса или метаданных не найден: {e}")
+            yield sse_event("error", {"detail": "Сервис временно недоступен"})
+        except Exception as e:
+            logger.exception(f"Ошибка при потоковой обработке запроса: {e}")
+            yield sse_event("error", {"detail": "Внутренняя ошибка сервера"})
+
+    # X-Accel-Buffering: nginx не должен копить поток целиком
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.post("/telegram/webhook", include_in_schema=False)
+async def telegram_webhook(request: Request, x_telegram_bot_api_secret_token: Optional[str] = Header(None)):
+    if telegram_app is None:
+        raise HTTPException(status_code=404, detail="Режим вебхука отключён")
+    # БЕЗОПАСНОСТЬ: Telegram передаёт секрет, заданный в set_webhook
+    if not x_telegram_bot_api_secret_token or not secrets.compare_digest(
+        x_telegram_bot_api_secret_token, TELEGRAM_WEBHOOK_SECRET
+    ):
+        raise HTTPException(status_code=403, detail="Доступ запрещён")
+
+    # Апдейт ставится в очередь приложения и обрабатывается в фоне: Telegram получает ответ сразу
+    update = telegram_update_cls.de_json(await request.json(), telegram_app.bot)
+    await telegram_app.update_queue.put(update)
+    return {"ok": True}
+
+@app.post("/admin/reload-index", response_model=ReloadResponse)
+async def admin_reload_index(force: bool = False, x_admin_token: Optional[str] = Header(None)):
+    # БЕЗОПАСНОСТЬ: доступ только по токену, сравнение за постоянное время
+    if not ADMIN_TOKEN or not x_admin_token or not secrets.compare_digest(x_admin_token, ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Доступ запрещён")
+
+    try:
+        reloaded = await reload_index(force=force)
+    except Exception as e:
+        logger.exception(f"Ошибка перезагрузки индекса: {e}")
+        raise HTTPException(status_code=500, detail="Не удалось загрузить новую версию индекса")
+
+    snapshot = index_manager.current
+    return ReloadResponse(reloaded=reloaded, version=snapshot.version, chunks=snapshot.index.ntotal)
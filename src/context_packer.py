@@ -0,0 +1,89 @@
+"""
+Упаковка найденных чанков в контекст промпта с бюджетом токенов.
+
+Чанки идут в порядке релевантности; из каждого берутся предложения, лучше всего
+совпадающие с вопросом (по основам слов, как в BM25), предложения, уже попавшие
+в контекст из других чанков, пропускаются. Контекст заполняется, пока не исчерпан
+бюджет токенов, а не фиксированным числом чанков.
+"""
+
+import re
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Set
+
+from sparse_index import tokenize
+
+_SENTENCE_SPLIT_RE = re.compile(r"(?<=[.!?…])\s+|\n+")
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+def split_sentences(text: str) -> List[str]:
+    return [s.strip() for s in _SENTENCE_SPLIT_RE.split(text) if s and s.strip()]
+
+def _sentence_key(sentence: str) -> str:
+    return " ".join(_WORD_RE.findall(sentence.lower().replace("ё", "е")))
+
+def format_sources(chunks: List[Dict]) -> List[Dict]:
+    """Список источников ответа: все URL чанков без повторов, в порядке релевантности.
+
+    У схлопнутых почти-дубликатов в source_urls перечислены URL всех страниц группы.
+    """
+    sources, seen = [], set()
+    for chunk in chunks:
+        for url in chunk.get("source_urls") or [chunk["source_url"]]:
+            if url not in seen:
+                seen.add(url)
+                sources.append({"url": url, "timestamp": chunk["timestamp"]})
+    return sources
+
+@dataclass
+class PackedContext:
+    context: str
+    chunks: List[Dict]  # чанки, попавшие в контекст (для списка источников)
+    tokens: int
+
+class ContextPacker:
+    """Собирает контекст из чанков в пределах token_budget токенов count_tokens"""
+
+    def __init__(self, count_tokens: Callable[[str], int], token_budget: int = 1500,
+                 max_sentences_per_chunk: int = 4):
+        self.count_tokens = count_tokens
+        self.token_budget = token_budget
+        self.max_sentences_per_chunk = max_sentences_per_chunk
+
+    def _select_sentences(self, sentences: List[str], query_terms: Set[str]) -> List[str]:
+        """Предложения с наибольшим пересечением с вопросом, в исходном порядке"""
+        if len(sentences) <= self.max_sentences_per_chunk:
+            return sentences
+        scores = [len(query_terms.intersection(tokenize(s))) for s in sentences]
+        if not any(scores):
+            # Нет лексического совпадения (чанк найден по смыслу) — берём начало чанка
+            return sentences[:self.max_sentences_per_chunk]
+        best = sorted(range(len(sentences)), key=lambda i: scores[i], reverse=True)
+        keep = sorted(i for i in best[:self.max_sentences_per_chunk] if scores[i] > 0)
+        return [sentences[i] for i in keep]
+
+    def pack(self, query: str, chunks: List[Dict]) -> PackedContext:
+        query_terms = set(tokenize(query))
+        seen: Set[str] = set()
+        lines, used_chunks = [], []
+        used_tokens = 0
+
+        for chunk in chunks:
+            if used_tokens >= self.token_budget:
+                break
+            taken = []
+            for sentence in self._select_sentences(split_sentences(chunk["chunk_text"]), query_terms):
+                key = _sentence_key(sentence)
+                if not key or key in seen:
+                    continue
+                tokens = self.count_tokens(sentence) + 1  # +1 на пробел/маркер строки
+                if used_tokens + tokens > self.token_budget:
+                    continue
+                seen.add(key)
+                taken.append(sentence)
+                used_tokens += tokens
+            if taken:
+                lines.append("- " + " ".join(taken))
+                used_chunks.append(chunk)
+
+        return PackedContext(context="\n".join(lines), chunks=used_chunks, tokens=used_tokens)
@@ -0,0 +1,142 @@
+"""
+Отчёт recall@k / задержка для разных типов ANN-индексов относительно точного IndexFlatL2.
+
+Берёт векторы из текущего плоского индекса (data/index/faiss.index), строит каждый
+кандидат на тех же данных и прогоняет запросы по одному, как в сервисе.
+
+    python src/data_pipeline/ann_report.py --factories HNSW32 "IVF1024,PQ48" --k 5
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List
+
+import faiss
+import numpy as np
+import logging
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+# Настройка логгера
+logger = logging.getLogger(__name__)
+
+# === CONFIG ===
+FAISS_INDEX_FILE = Path("data/index/faiss.index")
+QUERIES_LOG = Path("logs/queries.jsonl")
+REPORT_FILE = Path("data/index/ann_report.json")
+MODEL_NAME = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
+
+DEFAULT_FACTORIES = ["HNSW32", "IVF256,Flat", "IVF256,SQ8", "IVF256,PQ48"]
+DEFAULT_NPROBE = [1, 4, 16, 64]
+DEFAULT_EF_SEARCH = [16, 32, 64, 128]
+TRAIN_SAMPLE_SIZE = 100_000
+
+def load_flat_vectors(path: Path) -> np.ndarray:
+    index = faiss.read_index(str(path))
+    inner = faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap) else index
+    if not isinstance(inner, faiss.IndexFlat):
+        raise ValueError("Для отчёта нужен точный индекс (Flat): соберите его с --index-factory Flat")
+    return inner.reconstruct_n(0, inner.ntotal)
+
+def load_queries(xb: np.ndarray, source: str, n_queries: int) -> np.ndarray:
+    """Запросы: эмбеддинги вопросов из логов или случайные векторы корпуса"""
+    if source == "logs" and QUERIES_LOG.exists():
+        from embedding_backends import EMBED_BACKEND, load_embedder
+        with open(QUERIES_LOG, "r", encoding="utf-8") as f:
+            texts = [json.loads(line)["query"] for line in f if line.strip()]
+        texts = list(dict.fromkeys(texts))[:n_queries]
+        if texts:
+            model = load_embedder(EMBED_BACKEND, MODEL_NAME)
+            return model.encode(texts, convert_to_numpy=True, show_progress_bar=False).astype(np.float32)
+        logger.warning("В логах нет запросов, используются векторы корпуса")
+    rng = np.random.default_rng(0)
+    return xb[rng.choice(len(xb), size=min(n_queries, len(xb)), replace=False)]
+
+def measure(index, xq: np.ndarray, gt: np.ndarray, k: int) -> Dict:
+    latencies = []
+    found = np.empty((len(xq), k), dtype=np.int64)
+    for i in range(len(xq)):
+        started = time.perf_counter()
+        _, ids = index.search(xq[i:i + 1], k)
+        latencies.append((time.perf_counter() - started) * 1000)
+        found[i] = ids[0]
+
+    recall = np.mean([len(set(found[i]) & set(gt[i])) / k for i in range(len(xq))])
+    return {
+        "recall_at_k": round(float(recall), 4),
+        "latency_p50_ms": round(float(np.percentile(latencies, 50)), 3),
+        "latency_p99_ms": round(float(np.percentile(latencies, 99)), 3),
+    }
+
+def runtime_settings(factory: str, nprobe: List[int], ef_search: List[int]) -> List[Dict]:
+    if factory.startswith("IVF"):
+        return [{"nprobe": n} for n in nprobe]
+    if factory.startswith("HNSW"):
+        return [{"efSearch": ef} for ef in ef_search]
+    return [{}]
+
+def run_report(factories: List[str], k: int, n_queries: int, query_source: str,
+               nprobe: List[int], ef_search: List[int]) -> List[Dict]:
+    xb = load_flat_vectors(FAISS_INDEX_FILE)
+    xq = load_queries(xb, query_source, n_queries)
+    dim = xb.shape[1]
+    print(f"Корпус: {len(xb)} векторов, dim={dim}; запросов: {len(xq)}")
+
+    flat = faiss.IndexFlatL2(dim)
+    flat.add(xb)
+    _, gt = flat.search(xq, k)
+
+    rows = [{"factory": "Flat", "params": {}, "size_mb": round(xb.nbytes / 2**20, 2), "build_s": 0.0,
+             **measure(flat, xq, gt, k)}]
+
+    params_space = faiss.ParameterSpace()
+    for factory in factories:
+        started = time.perf_counter()
+        try:
+            index = faiss.index_factory(dim, factory, faiss.METRIC_L2)
+            if not index.is_trained:
+                rng = np.random.default_rng(0)
+                index.train(xb[rng.choice(len(xb), size=min(TRAIN_SAMPLE_SIZE, len(xb)), replace=False)])
+            index.add(xb)
+        except RuntimeError as e:
+            logger.error(f"Не удалось построить {factory}: {e}")
+            continue
+        build_s = time.perf_counter() - started
+        size_mb = faiss.serialize_index(index).nbytes / 2**20
+
+        for params in runtime_settings(factory, nprobe, ef_search):
+            for name, value in params.items():
+                params_space.set_index_parameter(index, name, value)
+            rows.append({"factory": factory, "params": params, "size_mb": round(size_mb, 2),
+                         "build_s": round(build_s, 2), **measure(index, xq, gt, k)})
+    return rows
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Сравнение ANN-индексов FAISS: recall@k против задержки")
+    parser.add_argument("--factories", nargs="+", default=DEFAULT_FACTORIES, help="строки faiss.index_factory")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--queries", type=int, default=500, help="число запросов")
+    parser.add_argument("--query-source", choices=["corpus", "logs"], default="corpus")
+    parser.add_argument("--nprobe", type=int, nargs="+", default=DEFAULT_NPROBE)
+    parser.add_argument("--ef-search", type=int, nargs="+", default=DEFAULT_EF_SEARCH)
+    args = parser.parse_args()
+
+    if not FAISS_INDEX_FILE.exists():
+        logger.error(f"Индекс не найден: {FAISS_INDEX_FILE}")
+        sys.exit(1)
+
+    rows = run_report(args.factories, args.k, args.queries, args.query_source, args.nprobe, args.ef_search)
+
+    print(f"{'index':<16}{'params':<18}{'recall@' + str(args.k):>10}{'p50, мс':>10}{'p99, мс':>10}{'MB':>10}")
+    for row in rows:
+        params = ",".join(f"{k}={v}" for k, v in row["params"].items())
+        print(f"{row['factory']:<16}{params:<18}{row['recall_at_k']:>10.3f}{row['latency_p50_ms']:>10.3f}"
+              f"{row['latency_p99_ms']:>10.3f}{row['size_mb']:>10.2f}")
+
+    with open(REPORT_FILE, "w", encoding="utf-8") as f:
+        json.dump({"k": args.k, "queries": args.queries, "results": rows}, f, ensure_ascii=False, indent=2)
+    print(f"Отчёт сохранён: {REPORT_FILE}")
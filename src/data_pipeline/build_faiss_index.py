@@ -1,12 +1,24 @@
+import argparse
+import hashlib
 import json
+import os
 import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Set, Tuple
 import faiss
-from sentence_transformers import SentenceTransformer
+import numpy as np
 import nltk
 from nltk.tokenize import sent_tokenize
+from tqdm import tqdm
 import logging
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from metadata_store import build_offsets, offsets_path
+from dedup import find_near_duplicates
+from sparse_index import build_bm25
+from embedding_backends import EMBED_BACKEND, backend_id, load_embedder
 
 # Настройка логгера
 logger = logging.getLogger(__name__)
@@ -16,9 +28,16 @@ TEXT_DIR = Path("data/clean")
 OUTPUT_DIR = Path("data/index")
 METADATA_FILE = OUTPUT_DIR / "metadata.jsonl"
 FAISS_INDEX_FILE = OUTPUT_DIR / "faiss.index"
+STATE_FILE = OUTPUT_DIR / "build_state.json"
+OFFSETS_FILE = offsets_path(METADATA_FILE)
+BM25_FILE = OUTPUT_DIR / "bm25.npz"
 
 CHUNK_SIZE = 5  # предложений на чанк
 MODEL_NAME = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
+EMBED_BATCH_SIZE = 1024  # чанков на один вызов encode / index.add
+# Тип индекса в нотации faiss.index_factory: "Flat", "HNSW32", "IVF1024,PQ48", "IVF1024,SQ8" и т.п.
+INDEX_FACTORY = "Flat"
+TRAIN_SAMPLE_SIZE = 50_000  # чанков для обучения IVF/PQ
 
 # === БЕЗОПАСНОСТЬ: Валидация путей ===
 def validate_path(path: Path, base_dir: Path) -> bool:
@@ -31,8 +50,16 @@ def validate_path(path: Path, base_dir: Path) -> bool:
         return False
 
 # === LOAD MODEL ===
-print("Загрузка модели эмбеддингов...")
-model = SentenceTransformer(MODEL_NAME)
+# Модель загружается лениво: процессы чанкинга её не используют.
+# Бэкенд (torch | onnx) — переменная EMBED_BACKEND, общая с API
+_model = None
+
+def get_model():
+    global _model
+    if _model is None:
+        print(f"Загрузка модели эмбеддингов ({backend_id()})...")
+        _model = load_embedder(EMBED_BACKEND, MODEL_NAME)
+    return _model
 
 # === ЧАНКИНГ ===
 def chunk_text_semantic(text, chunk_size=CHUNK_SIZE):
@@ -44,57 +71,75 @@ def chunk_text_semantic(text, chunk_size=CHUNK_SIZE):
             chunks.append(chunk.strip())
     return chunks
 
-# === ПОДГОТОВКА ===
-index = None
-metadata = []
-dim = None
+# === ХЭШИ И СТАБИЛЬНЫЕ ID ===
+def file_hash(filepath: Path) -> str:
+    """Хэш содержимого текста и его .meta.json (смена URL/даты тоже считается изменением)"""
+    h = hashlib.sha256()
+    h.update(filepath.read_bytes())
+    meta_path = filepath.with_suffix(".meta.json")
+    if meta_path.exists():
+        h.update(meta_path.read_bytes())
+    return h.hexdigest()
+
+def chunk_id(file_name: str, chunk_text: str, occurrence: int = 0) -> int:
+    """Стабильный int64 ID чанка по хэшу содержимого (не зависит от позиции в индексе)"""
+    digest = hashlib.blake2b(f"{file_name}\0{occurrence}\0{chunk_text}".encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big") & 0x7FFF_FFFF_FFFF_FFFF
 
-def process_file(filepath: Path):
-    """Обрабатывает файл с валидацией пути и обработкой ошибок"""
+def load_changes_manifest(path: Path) -> Optional[Set[str]]:
+    """Имена .txt, которые краулер добавил или изменил (манифест build_knowledge_base.py)"""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        return set(manifest.get("added", [])) | set(manifest.get("changed", []))
+    except (OSError, json.JSONDecodeError) as e:
+        logger.warning(f"Не удалось прочитать манифест изменений {path}, проверяем все файлы: {e}")
+        return None
+
+def modified_since(filepath: Path, timestamp: Optional[float]) -> bool:
+    """Изменялся ли текст или его .meta.json после timestamp (None — считаем изменённым)"""
+    if timestamp is None:
+        return True
+    meta_path = filepath.with_suffix(".meta.json")
+    return any(p.exists() and p.stat().st_mtime >= timestamp for p in (filepath, meta_path))
+
+# === ЧТЕНИЕ ДОКУМЕНТОВ ===
+def process_file(filepath: Path) -> Optional[List[Dict]]:
+    """Читает файл и возвращает записи метаданных его чанков (с валидацией пути и обработкой ошибок)"""
     # БЕЗОПАСНОСТЬ: проверка пути
     if not validate_path(filepath, TEXT_DIR):
         logger.error(f"Попытка доступа к файлу вне базовой директории: {filepath}")
-        return
-    
-    print(f"Обработка: {filepath.name}")
+        return None
+
     try:
         with open(filepath, "r", encoding="utf-8") as f:
             lines = f.readlines()
     except FileNotFoundError:
         logger.error(f"Файл не найден: {filepath}")
-        return
+        return None
     except PermissionError:
         logger.error(f"Нет прав на чтение файла: {filepath}")
-        return
+        return None
     except UnicodeDecodeError as e:
         logger.error(f"Ошибка кодировки файла {filepath}: {e}")
-        return
+        return None
     except Exception as e:
         logger.error(f"Ошибка чтения файла {filepath}: {e}")
-        return
-    
+        return None
+
     if not lines:
         logger.warning(f"Пустой файл: {filepath}")
-        return
-        
+        return None
+
     url_line = lines[0].strip() if lines and lines[0].startswith("[URL]") else ""
     source_url = url_line.replace("[URL] ", "") if url_line else "unknown"
     text = "".join(lines[1:] if url_line else lines)
 
     chunks = chunk_text_semantic(text)
-    
+
     if not chunks:
         logger.warning(f"Не удалось создать чанки из файла: {filepath}")
-        return
-
-    embeddings = model.encode(chunks, show_progress_bar=False, convert_to_numpy=True)
-
-    global index, dim
-    if index is None:
-        dim = embeddings.shape[1]
-        index = faiss.IndexFlatL2(dim)
-
-    index.add(embeddings)
+        return None
 
     # Формируем метаданные
     meta_path = filepath.with_suffix(".meta.json")
@@ -109,55 +154,344 @@ def process_file(filepath: Path):
             timestamp = datetime.now().isoformat()
     else:
         timestamp = datetime.now().isoformat()
-    
+
     # БЕЗОПАСНОСТЬ: валидация пути к документу
     full_doc_link = f"/data/raw/{filepath.stem}"
 
+    records = []
+    seen: Dict[str, int] = {}
     for chunk_text in chunks:
-        metadata.append({
+        occurrence = seen.get(chunk_text, 0)
+        seen[chunk_text] = occurrence + 1
+        records.append({
+            "id": chunk_id(filepath.name, chunk_text, occurrence),
+            "file": filepath.name,
             "chunk_text": chunk_text,
             "source_url": source_url,
             "full_document_path": full_doc_link,
             "timestamp": timestamp
         })
+    return records
 
-# === MAIN ===
-if __name__ == "__main__":
-    nltk.download("punkt_tab")
-    
-    # БЕЗОПАСНОСТЬ: создание директорий с проверкой
+def chunk_files(paths: List[Path], workers: int) -> Iterator[tuple]:
+    """Параллельный чанкинг (sent_tokenize — чистый Python, поэтому процессы, а не потоки)"""
+    if workers <= 1 or len(paths) <= 1:
+        for path in paths:
+            yield path, process_file(path)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        yield from zip(paths, pool.map(process_file, paths, chunksize=8))
+
+# === ДЕДУПЛИКАЦИЯ ===
+def collapse_duplicates(records: List[Dict]) -> List[Dict]:
+    """Схлопывает почти-дубликаты в один чанк-представитель со списком всех URL-источников"""
+    started = time.perf_counter()
+    representative = find_near_duplicates([r["chunk_text"] for r in records])
+
+    groups: Dict[int, List[Dict]] = {}
+    for record, rep_pos in zip(records, representative):
+        groups.setdefault(rep_pos, []).append(record)
+
+    collapsed = []
+    for rep_pos, members in groups.items():
+        # Группы пересчитываются на каждой сборке (поля прошлой дедупликации уже сняты)
+        item = dict(records[rep_pos])
+        if len(members) > 1:
+            item["source_urls"] = list(dict.fromkeys(m["source_url"] for m in members))
+            item["duplicate_ids"] = [m["id"] for m in members if m["id"] != item["id"]]
+        collapsed.append(item)
+
+    removed = len(records) - len(collapsed)
+    elapsed = time.perf_counter() - started
+    print(f"Дедупликация: {len(records)} → {len(collapsed)} чанков, удалено почти-дубликатов: {removed} "
+          f"({removed / max(len(records), 1):.1%}) за {elapsed:.1f} с")
+    return collapsed
+
+# === ИНДЕКС ===
+def create_index(dim: int, factory: str = INDEX_FACTORY):
+    """Создаёт индекс по строке index_factory с поддержкой стабильных ID.
+
+    IVF-индексы хранят ID сами (add_with_ids/remove_ids), остальные оборачиваются в IDMap.
+    IDMap над IVF нельзя: IndexIDMap.remove_ids уплотняет id_map, рассчитывая на сдвиг
+    позиций во внутреннем индексе, как у Flat, а IVF позиции не сдвигает — после первого
+    удаления ID в выдаче указывали бы на чужие чанки.
+    """
+    index = faiss.index_factory(dim, factory, faiss.METRIC_L2)
+    if faiss.try_extract_index_ivf(index) is not None:
+        return index
+    return faiss.index_factory(dim, f"IDMap,{factory}", faiss.METRIC_L2)
+
+def supports_incremental(index) -> bool:
+    """Можно ли удалять и добавлять чанки по ID, не ломая соответствие ID → вектор"""
+    if isinstance(index, faiss.IndexIDMap):
+        return faiss.try_extract_index_ivf(faiss.downcast_index(index.index)) is None
+    return faiss.try_extract_index_ivf(index) is not None
+
+def train_index(index, records: List[Dict], sample_size: int = TRAIN_SAMPLE_SIZE) -> Tuple[np.ndarray, np.ndarray]:
+    """Обучает IVF/PQ/SQ на случайной выборке чанков.
+
+    Возвращает (позиции выборки в records, её эмбеддинги), чтобы не кодировать выборку повторно.
+    """
+    rng = np.random.default_rng(0)
+    sample_ids = np.sort(rng.choice(len(records), size=min(sample_size, len(records)), replace=False))
+    texts = [records[i]["chunk_text"] for i in sample_ids]
+    print(f"Обучение индекса на {len(texts)} чанках...")
+    vectors = get_model().encode(texts, batch_size=64, show_progress_bar=False, convert_to_numpy=True)
+    index.train(vectors)
+    return sample_ids, vectors
+
+# === ЭМБЕДДИНГ ===
+def embed_records(index, records: List[Dict], batch_size: int = EMBED_BATCH_SIZE, processes: int = 0):
+    """Кодирует чанки крупными батчами поперёк файлов и добавляет их в индекс пачками"""
+    model = get_model()
+    pending = records
+    if not index.is_trained:
+        # Векторы обучающей выборки сразу идут в индекс, остальные чанки кодируются ниже
+        sample_ids, sample_vectors = train_index(index, records)
+        index.add_with_ids(sample_vectors, np.array([records[i]["id"] for i in sample_ids], dtype=np.int64))
+        sampled = set(sample_ids.tolist())
+        pending = [r for i, r in enumerate(records) if i not in sampled]
+
+    pool = None
+    if processes > 1 and EMBED_BACKEND == "torch":
+        pool = model.start_multi_process_pool(target_devices=["cpu"] * processes)
+    elif processes > 1:
+        # ONNX Runtime и так использует все ядра внутри одного вызова
+        logger.warning("--embed-processes поддерживается только бэкендом torch, игнорируется")
+
+    started = time.perf_counter()
     try:
-        OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
-    except OSError as e:
-        logger.error(f"Ошибка создания директории {OUTPUT_DIR}: {e}")
+        with tqdm(total=len(records), initial=len(records) - len(pending), desc="Эмбеддинг", unit="chunk") as progress:
+            for start in range(0, len(pending), batch_size):
+                batch = pending[start:start + batch_size]
+                texts = [r["chunk_text"] for r in batch]
+                if pool is not None:
+                    embeddings = model.encode_multi_process(texts, pool, batch_size=64)
+                else:
+                    embeddings = model.encode(texts, batch_size=64, show_progress_bar=False, convert_to_numpy=True)
+                index.add_with_ids(embeddings, np.array([r["id"] for r in batch], dtype=np.int64))
+                progress.update(len(batch))
+    finally:
+        if pool is not None:
+            model.stop_multi_process_pool(pool)
+
+    elapsed = time.perf_counter() - started
+    if records:
+        print(f"Эмбеддинг: {len(records)} чанков за {elapsed:.1f} с ({len(records) / max(elapsed, 1e-9):.1f} чанков/с)")
+    return index
+
+# === СОСТОЯНИЕ ПРЕДЫДУЩЕЙ СБОРКИ ===
+def load_previous_build(index_factory: str = INDEX_FACTORY):
+    """Возвращает (state, index, metadata_by_id) или None, если инкрементальная сборка невозможна"""
+    if not (STATE_FILE.exists() and FAISS_INDEX_FILE.exists() and METADATA_FILE.exists()):
+        return None
+    try:
+        with open(STATE_FILE, "r", encoding="utf-8") as f:
+            state = json.load(f)
+        if (state.get("model") != MODEL_NAME or state.get("chunk_size") != CHUNK_SIZE
+                or state.get("index_factory", "Flat") != index_factory
+                or state.get("embed_backend", "torch") != backend_id()):
+            print("Изменились модель, бэкенд эмбеддингов, размер чанка или тип индекса — полная пересборка.")
+            return None
+        index = faiss.read_index(str(FAISS_INDEX_FILE))
+        with open(METADATA_FILE, "r", encoding="utf-8") as f:
+            metadata_by_id = {}
+            for line in f:
+                item = json.loads(line)
+                metadata_by_id[item["id"]] = item
+    except (OSError, json.JSONDecodeError, KeyError, RuntimeError) as e:
+        logger.warning(f"Не удалось загрузить предыдущую сборку, полная пересборка: {e}")
+        return None
+    # Сборки с IDMap над IVF (до исправления create_index) тоже отсюда уходят в полную пересборку
+    if not supports_incremental(index) or index.ntotal != len(metadata_by_id):
+        print("Предыдущий индекс несовместим с инкрементальной сборкой — полная пересборка.")
+        return None
+    return state, index, metadata_by_id
+
+def atomic_write(path: Path, write_fn, mode: str = "w"):
+    """Пишет во временный файл и атомарно подменяет целевой"""
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, mode, encoding="utf-8" if "b" not in mode else None) as f:
+        write_fn(f)
+    os.replace(tmp_path, path)
+
+def save_build(index, records: List[Dict], files_state: Dict, index_factory: str = INDEX_FACTORY, dedup: bool = True):
+    print("Сохраняем FAISS-индекс и метаданные...")
+
+    try:
+        tmp_index = FAISS_INDEX_FILE.with_name(FAISS_INDEX_FILE.name + ".tmp")
+        faiss.write_index(index, str(tmp_index))
+        os.replace(tmp_index, FAISS_INDEX_FILE)
+    except Exception as e:
+        logger.error(f"Ошибка сохранения индекса: {e}")
         sys.exit(1)
 
+    try:
+        # JSONL-блоб + таблица смещений для ленивого чтения по ID (см. metadata_store)
+        lines = [(json.dumps(item, ensure_ascii=False) + "\n").encode("utf-8") for item in records]
+        atomic_write(METADATA_FILE, lambda f: f.writelines(lines), mode="wb")
+        offsets = build_offsets([item["id"] for item in records], lines)
+        atomic_write(OFFSETS_FILE, lambda f: np.save(f, offsets), mode="wb")
+
+        # Разреженный BM25-индекс пересобирается целиком: это дёшево по сравнению с эмбеддингом
+        started = time.perf_counter()
+        build_bm25(((item["id"], item["chunk_text"]) for item in records), BM25_FILE)
+        print(f"BM25-индекс: {len(records)} чанков за {time.perf_counter() - started:.1f} с")
+
+        # Состояние пишется последним: по нему определяется завершённая сборка
+        state = {
+            "version": datetime.now().isoformat(),
+            "model": MODEL_NAME,
+            "embed_backend": backend_id(),
+            "chunk_size": CHUNK_SIZE,
+            "index_factory": index_factory,
+            "dedup": dedup,
+            "files": files_state,
+        }
+        atomic_write(STATE_FILE, lambda f: json.dump(state, f, ensure_ascii=False, indent=2))
+    except IOError as e:
+        logger.error(f"Ошибка сохранения метаданных: {e}")
+        sys.exit(1)
+
+# === СБОРКА ===
+def build(full: bool = False, workers: int = 1, embed_batch_size: int = EMBED_BATCH_SIZE, embed_processes: int = 0,
+          index_factory: str = INDEX_FACTORY, changes_file: Optional[Path] = None, dedup: bool = True):
     all_txt_files = sorted(TEXT_DIR.glob("*.txt"))
-    
+
     if not all_txt_files:
         logger.warning(f"Не найдено файлов для обработки в {TEXT_DIR}")
-    
+
+    previous = None if full else load_previous_build(index_factory)
+    if previous is None:
+        prev_files, index, prev_metadata = {}, None, {}
+    else:
+        state, index, prev_metadata = previous
+        prev_files = state.get("files", {})
+
+    # Манифест краулера избавляет от хэширования файлов, которые он не трогал
+    touched = load_changes_manifest(changes_file) if changes_file and previous is not None else None
+    if touched is not None:
+        # extract_documents.py перезаписывает .txt и без изменений на сайте (повтор после таймаута,
+        # --force), в манифест такие файлы не попадают — их выдаёт mtime новее прошлой сборки
+        try:
+            state_mtime = STATE_FILE.stat().st_mtime
+        except OSError:
+            state_mtime = None
+
+    # 1. Определяем актуальный набор чанков; неизменённые файлы не перечитываем
+    records_by_file: Dict[str, List[Dict]] = {}
+    digests: Dict[str, str] = {}
+    to_chunk: List[Path] = []
+    changed_files = 0
     for path in all_txt_files:
-        process_file(path)
+        prev = prev_files.get(path.name)
+        try:
+            if (touched is not None and prev and path.name not in touched
+                    and not modified_since(path, state_mtime)):
+                digest = prev["sha256"]
+            else:
+                digest = file_hash(path)
+        except OSError as e:
+            logger.error(f"Ошибка чтения файла {path}: {e}")
+            continue
+
+        digests[path.name] = digest
+        unchanged = prev and prev.get("sha256") == digest
+        if not unchanged:
+            changed_files += 1
+        # Файлы с почти-дубликатами перечитываются: их схлопнутых чанков нет в метаданных
+        if unchanged and all(cid in prev_metadata for cid in prev["chunks"]):
+            records_by_file[path.name] = [
+                {k: v for k, v in prev_metadata[cid].items() if k not in ("source_urls", "duplicate_ids")}
+                for cid in prev["chunks"]
+            ]
+        else:
+            to_chunk.append(path)
+
+    started = time.perf_counter()
+    for path, file_records in tqdm(chunk_files(to_chunk, workers), total=len(to_chunk), desc="Чанкинг", unit="file"):
+        if file_records:
+            records_by_file[path.name] = file_records
+    if to_chunk:
+        elapsed = time.perf_counter() - started
+        print(f"Чанкинг: {len(to_chunk)} файлов за {elapsed:.1f} с ({len(to_chunk) / max(elapsed, 1e-9):.1f} файлов/с)")
+
+    # Порядок записей — по именам файлов, как и раньше
+    records: List[Dict] = []
+    files_state: Dict[str, Dict] = {}
+    for name in sorted(records_by_file):
+        file_records = records_by_file[name]
+        records.extend(file_records)
+        files_state[name] = {"sha256": digests[name], "chunks": [r["id"] for r in file_records]}
+
+    removed_files = len(set(prev_files) - set(files_state))
+
+    if dedup:
+        records = collapse_duplicates(records)
+
+    # 2. Сравниваем с содержимым индекса: эмбеддим только новые чанки
+    desired_ids = {r["id"] for r in records}
+    present_ids = set(prev_metadata)
+    to_remove = present_ids - desired_ids
+    new_records = [r for r in records if r["id"] not in present_ids]
+
+    print(f"Файлов: {len(files_state)} (изменено/новых: {changed_files}, удалено: {removed_files}); "
+          f"чанков: {len(records)} (новых: {len(new_records)}, к удалению: {len(to_remove)})")
+
+    if index is not None and to_remove:
+        try:
+            index.remove_ids(np.fromiter(to_remove, dtype=np.int64, count=len(to_remove)))
+        except RuntimeError as e:
+            # Например, HNSW не поддерживает удаление — пересобираем индекс целиком
+            logger.warning(f"Индекс {index_factory} не поддерживает удаление ({e}), полная пересборка.")
+            index = None
+            new_records = records
+
+    if index is None and records:
+        index = create_index(get_model().get_sentence_embedding_dimension(), index_factory)
+
+    if new_records:
+        index = embed_records(index, new_records, batch_size=embed_batch_size, processes=embed_processes)
 
     if index is None or index.ntotal == 0:
         logger.error("Индекс пуст. Невозможно сохранить.")
         sys.exit(1)
 
-    print("Сохраняем FAISS-индекс и метаданные...")
-    
-    try:
-        faiss.write_index(index, str(FAISS_INDEX_FILE))
-    except Exception as e:
-        logger.error(f"Ошибка сохранения индекса: {e}")
-        sys.exit(1)
+    assert index.ntotal == len(records), "Несовпадение количества векторов и метаданных"
+
+    if previous is not None and changed_files == 0 and removed_files == 0 and state.get("dedup", False) == dedup:
+        print("Изменений нет, индекс актуален.")
+        return
+
+    save_build(index, records, files_state, index_factory, dedup)
 
+# === MAIN ===
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Сборка FAISS-индекса по data/clean")
+    parser.add_argument("--full", action="store_true", help="пересобрать индекс с нуля, игнорируя предыдущую сборку")
+    parser.add_argument("--index-factory", default=INDEX_FACTORY,
+                        help='тип индекса faiss.index_factory: "Flat", "HNSW32", "IVF1024,PQ48", "IVF1024,SQ8"')
+    parser.add_argument("--changes", type=Path, default=None,
+                        help="манифест изменений краулера (data/crawl_changes.json): хэшируются только перечисленные "
+                             "файлы и файлы, изменённые после прошлой сборки")
+    parser.add_argument("--no-dedup", action="store_true", help="не схлопывать почти-дубликаты чанков")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="процессов для чтения и чанкинга файлов")
+    parser.add_argument("--embed-batch-size", type=int, default=EMBED_BATCH_SIZE, help="чанков в одном батче эмбеддинга")
+    parser.add_argument("--embed-processes", type=int, default=0,
+                        help="процессов для эмбеддинга (start_multi_process_pool); 0 — в текущем процессе")
+    args = parser.parse_args()
+
+    nltk.download("punkt_tab")
+
+    # БЕЗОПАСНОСТЬ: создание директорий с проверкой
     try:
-        with open(METADATA_FILE, "w", encoding="utf-8") as f:
-            for item in metadata:
-                f.write(json.dumps(item, ensure_ascii=False) + "\n")
-    except IOError as e:
-        logger.error(f"Ошибка сохранения метаданных: {e}")
+        OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
+    except OSError as e:
+        logger.error(f"Ошибка создания директории {OUTPUT_DIR}: {e}")
         sys.exit(1)
 
+    build(full=args.full, workers=args.workers, embed_batch_size=args.embed_batch_size,
+          embed_processes=args.embed_processes, index_factory=args.index_factory, changes_file=args.changes,
+          dedup=not args.no_dedup)
+
     print(f"Завершено. Индекс: {FAISS_INDEX_FILE}, метаданные: {METADATA_FILE}")
@@ -1,14 +1,14 @@
+import argparse
+import asyncio
 import os
 import re
-import requests
+import hashlib
 import time
-import fitz  # PyMuPDF
-import docx
+import httpx
 import json
 from datetime import datetime
 from bs4 import BeautifulSoup
 from urllib.parse import urljoin, urlparse
-from tqdm import tqdm
 import logging
 from pathlib import Path
 
@@ -18,6 +18,9 @@ logger = logging.getLogger(__name__)
 BASE_URL = "https://sfn-am.ru"
 SAVE_DIR_RAW = "data/raw"
 SAVE_DIR_CLEAN = "data/clean"
+# Состояние обхода (ETag/Last-Modified/хэш по URL) и манифест изменений для сборщика индекса
+CRAWL_STATE_FILE = "data/crawl_state.json"
+CHANGES_MANIFEST_FILE = "data/crawl_changes.json"
 
 # БЕЗОПАСНОСТЬ: валидация базового URL
 def validate_base_url(url: str) -> bool:
@@ -56,6 +59,18 @@ HEADERS = {
     "Referer": "https://google.com",
 }
 
+# Параметры обхода: общий пул соединений, вежливость к хосту, повторы
+CRAWL_CONCURRENCY = int(os.getenv("CRAWL_CONCURRENCY", "8"))          # одновременно обрабатываемых страниц
+PER_HOST_CONCURRENCY = int(os.getenv("CRAWL_HOST_CONCURRENCY", "2"))   # одновременных запросов к одному хосту
+# Токен-бакет на хост: средняя частота запросов в секунду (0 — без ограничения, только
+# PER_HOST_CONCURRENCY) и допустимый всплеск, по умолчанию равный числу одновременных запросов
+PER_HOST_RATE = float(os.getenv("CRAWL_HOST_RATE", "10"))
+PER_HOST_BURST = int(os.getenv("CRAWL_HOST_BURST", str(PER_HOST_CONCURRENCY)))
+MAX_RETRIES = 3                   # повторов при 429/5xx и сетевых ошибках
+RETRY_BACKOFF = 2.0               # базовая задержка экспоненциального backoff, секунд
+REQUEST_TIMEOUT = 30
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
 # БЕЗОПАСНОСТЬ: создание директорий с обработкой ошибок
 try:
     Path(SAVE_DIR_RAW).mkdir(parents=True, exist_ok=True)
@@ -64,23 +79,6 @@ except OSError as e:
     logger.error(f"Ошибка создания директорий: {e}")
     raise
 
-def extract_text_from_pdf(filepath):
-    try:
-        doc = fitz.open(filepath)
-        text = "\n".join(page.get_text() for page in doc)
-        return text.strip()
-    except Exception as e:
-        print(f"[!] Ошибка при чтении PDF {filepath}: {e}")
-        return ""
-
-def extract_text_from_docx(filepath):
-    try:
-        doc = docx.Document(filepath)
-        return "\n".join([p.text for p in doc.paragraphs if p.text.strip()])
-    except Exception as e:
-        print(f"[!] Ошибка при чтении DOCX {filepath}: {e}")
-        return ""
-
 def sanitize_filename(path: str) -> str:
     """Преобразует URL-путь в безопасное имя файла"""
     # Заменяем / -> _
@@ -118,149 +116,364 @@ def get_internal_links(html, base_path):
             links.add(href)
     return links
 
-def crawl_section(section_path):
-    """Сканирует раздел сайта с валидацией путей и обработкой ошибок"""
+def is_safe_path(path: str) -> bool:
+    """Проверяет, что путь не содержит попыток выхода за пределы сайта"""
+    # Защита от path traversal
+    if ".." in path or "~" in path:
+        return False
+    # Проверка на абсолютные пути
+    if path.startswith("//") or path.startswith("\\"):
+        return False
+    return True
+
+class HostLimiter:
+    """Ограничивает число одновременных запросов к одному хосту и их среднюю частоту (токен-бакет).
+
+    Бакет вмещает burst токенов и пополняется со скоростью rate в секунду, так что
+    запросы не выстраиваются в очередь по одному, пока частота укладывается в rate.
+    """
+
+    def __init__(self, concurrency: int = PER_HOST_CONCURRENCY, rate: float = PER_HOST_RATE,
+                 burst: int = PER_HOST_BURST):
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._lock = asyncio.Lock()
+        self._rate = rate
+        self._burst = max(burst, 1)
+        self._tokens = float(self._burst)
+        self._updated = time.monotonic()
+
+    async def _take_token(self):
+        async with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self._burst, self._tokens + (now - self._updated) * self._rate)
+            self._updated = now
+            if self._tokens < 1:
+                await asyncio.sleep((1 - self._tokens) / self._rate)
+                self._tokens = 1.0
+                self._updated = time.monotonic()
+            self._tokens -= 1
+
+    async def __aenter__(self):
+        await self._semaphore.acquire()
+        if self._rate > 0:
+            try:
+                await self._take_token()
+            except BaseException:
+                self._semaphore.release()
+                raise
+        return self
+
+    async def __aexit__(self, *exc):
+        self._semaphore.release()
+
+class CrawlState:
+    """Хранит по каждому URL ETag, Last-Modified, хэш содержимого и созданные файлы"""
+
+    def __init__(self, path: str = CRAWL_STATE_FILE):
+        self.path = Path(path)
+        self.entries = {}
+        if self.path.exists():
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    self.entries = json.load(f)
+            except (OSError, json.JSONDecodeError) as e:
+                logger.warning(f"Не удалось прочитать состояние обхода {self.path}, начинаем с нуля: {e}")
+
+    def conditional_headers(self, url: str) -> dict:
+        entry = self.entries.get(url, {})
+        headers = {}
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def save(self):
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.entries, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
+
+async def fetch(client: httpx.AsyncClient, url: str, limiter: HostLimiter, headers: dict = None) -> httpx.Response:
+    """GET с повторами и экспоненциальным backoff (учитывает Retry-After); 304 возвращается как есть"""
+    for attempt in range(MAX_RETRIES + 1):
+        retry_after = None
+        try:
+            async with limiter:
+                response = await client.get(url, headers=headers)
+            if response.status_code == 304:
+                return response
+            if response.status_code not in RETRY_STATUSES:
+                response.raise_for_status()
+                return response
+            retry_after = response.headers.get("Retry-After")
+            error = httpx.HTTPStatusError(f"HTTP {response.status_code}", request=response.request, response=response)
+        except (httpx.TimeoutException, httpx.TransportError) as e:
+            error = e
+
+        if attempt == MAX_RETRIES:
+            raise error
+        delay = float(retry_after) if retry_after and retry_after.isdigit() else RETRY_BACKOFF * 2 ** attempt
+        logger.warning(f"Повтор {attempt + 1}/{MAX_RETRIES} для {url} через {delay:.1f} с: {error}")
+        await asyncio.sleep(delay)
+
+def document_kind(path: str, content_type: str) -> str:
+    if "application/pdf" in content_type or path.endswith(".pdf"):
+        return "pdf"
+    if "application/vnd.openxmlformats-officedocument.wordprocessingml.document" in content_type or path.endswith(".docx"):
+        return "docx"
+    return "html"
+
+def write_meta(page_name: str, full_url: str, raw_path: str):
+    meta = {
+        "url": full_url,
+        "path": raw_path,
+        "timestamp": datetime.now().isoformat()
+    }
+
+    try:
+        with open(f"{SAVE_DIR_CLEAN}/{page_name}.meta.json", "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False, indent=2)
+    except IOError as e:
+        logger.error(f"Ошибка записи метаданных {page_name}: {e}")
+
+def save_document(page_name: str, kind: str, full_url: str, response: httpx.Response) -> str:
+    """Сохраняет ответ (PDF/DOCX/HTML), для HTML — и очищенный текст; возвращает путь к сырому файлу"""
+    # Если PDF / DOCX: текст извлекается отдельной стадией (extract_documents.py)
+    if kind in ("pdf", "docx"):
+        filepath = f"{SAVE_DIR_RAW}/{page_name}.{kind}"
+        try:
+            # Содержимое изменилось (проверено по хэшу) — перезаписываем
+            with open(filepath, "wb") as f:
+                f.write(response.content)
+            print(f"Saved {kind.upper()}: {filepath}")
+        except IOError as e:
+            logger.error(f"Ошибка записи {kind.upper()} {filepath}: {e}")
+            return filepath
+        write_meta(page_name, full_url, filepath)
+        return filepath
+
+    # Сохраняем HTML
+    filepath_html = f"{SAVE_DIR_RAW}/{page_name}.html"
+    try:
+        with open(filepath_html, "w", encoding="utf-8") as f:
+            f.write(response.text)
+    except IOError as e:
+        logger.error(f"Ошибка записи HTML {filepath_html}: {e}")
+        return filepath_html
+
+    # Сохраняем очищенный текст
+    text = clean_text(response.text)
+    try:
+        with open(f"{SAVE_DIR_CLEAN}/{page_name}.txt", "w", encoding="utf-8") as f:
+            f.write(text)
+    except IOError as e:
+        logger.error(f"Ошибка записи текста {page_name}: {e}")
+        return filepath_html
+
+    # сохраняем метаинформацию
+    write_meta(page_name, full_url, filepath_html)
+    return filepath_html
+
+def read_saved_html(entry: dict) -> str:
+    """HTML из data/raw для страницы, не изменившейся с прошлого обхода (нужен для ссылок)"""
+    try:
+        with open(entry["raw"], "r", encoding="utf-8") as f:
+            return f.read()
+    except (OSError, KeyError) as e:
+        logger.warning(f"Не найден сохранённый HTML для {entry.get('raw')}: {e}")
+        return ""
+
+def remove_document(entry: dict):
+    """Удаляет файлы исчезнувшей со страницы/сайта страницы"""
+    page_name = entry["page_name"]
+    for path in (entry.get("raw"), f"{SAVE_DIR_CLEAN}/{page_name}.txt", f"{SAVE_DIR_CLEAN}/{page_name}.meta.json"):
+        if path and os.path.exists(path):
+            try:
+                os.remove(path)
+            except OSError as e:
+                logger.error(f"Не удалось удалить {path}: {e}")
+
+def write_changes_manifest(changes: dict, path: str = CHANGES_MANIFEST_FILE):
+    """Манифест для build_faiss_index.py --changes: какие .txt добавлены, изменены, удалены"""
+    manifest = {"generated_at": datetime.now().isoformat(), **{k: sorted(v) for k, v in changes.items()}}
+    try:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+    except IOError as e:
+        logger.error(f"Ошибка записи манифеста изменений {path}: {e}")
+
+async def crawl_site(sections=TARGET_PATHS, base_url: str = BASE_URL, concurrency: int = CRAWL_CONCURRENCY,
+                     transport: httpx.AsyncBaseTransport = None, state: CrawlState = None, prune: bool = False,
+                     host_rate: float = PER_HOST_RATE):
+    """Обходит разделы сайта очередью (без рекурсии) с общим пулом соединений.
+
+    Запросы условные (If-None-Match / If-Modified-Since); неизменённые документы
+    не перезаписываются и не разбираются заново. С prune=True документы, получившие 404/410,
+    удаляются; URL из состояния, до которых обход не дошёл, — только если обход прошёл без
+    временных ошибок: после таймаута или 5xx на странице раздела её дочерние страницы
+    не попадают в очередь, и без этой проверки были бы удалены вместе с индексом.
+    base_url и transport можно подменить, чтобы прогнать обход на локальной копии сайта.
+    host_rate — средняя частота запросов к одному хосту в секунду (0 — без ограничения).
+    Возвращает словарь изменений: added / changed / removed (имена .txt) и unchanged.
+    """
+    state = state if state is not None else CrawlState()
+    allowed_host = urlparse(base_url).hostname
     visited = set()
-    
-    # БЕЗОПАСНОСТЬ: валидация пути раздела
-    if not section_path.startswith("/"):
-        logger.error(f"Недопустимый путь раздела: {section_path}")
-        return
-
-    def is_safe_path(path: str) -> bool:
-        """Проверяет, что путь не содержит попыток выхода за пределы сайта"""
-        # Защита от path traversal
-        if ".." in path or "~" in path:
-            return False
-        # Проверка на абсолютные пути
-        if path.startswith("//") or path.startswith("\\"):
-            return False
-        return True
-
-    def crawl(path):
+    seen_urls = set()     # URL, по которым получен ответ 200/304
+    failed_urls = set()   # временные ошибки: такие URL не удаляем
+    gone_urls = set()     # 404/410 — документ удалён с сайта
+    changes = {"added": set(), "changed": set(), "removed": set(), "unchanged": set()}
+    frontier: asyncio.Queue = asyncio.Queue()
+    limiters = {}
+
+    def enqueue(path: str, section_path: str):
         if path in visited:
             return
         visited.add(path)
-        
+        frontier.put_nowait((path, section_path))
+
+    for section_path in sections:
+        # БЕЗОПАСНОСТЬ: валидация пути раздела
+        if not section_path.startswith("/"):
+            logger.error(f"Недопустимый путь раздела: {section_path}")
+            continue
+        enqueue(section_path, section_path)
+
+    async def process(client: httpx.AsyncClient, path: str, section_path: str):
         # БЕЗОПАСНОСТЬ: проверка пути перед запросом
         if not is_safe_path(path):
             logger.warning(f"Пропущен небезопасный путь: {path}")
             return
 
-        full_url = urljoin(BASE_URL, path)
-        
+        full_url = urljoin(base_url, path)
+
         # Дополнительная проверка URL
-        if not urlparse(full_url).hostname == "sfn-am.ru":
+        host = urlparse(full_url).hostname
+        if host != allowed_host:
             logger.warning(f"Пропущен внешний URL: {full_url}")
             return
-        
-        print(f"Fetching: {full_url}")
-
-        try:
-            session = requests.Session()
-            session.headers.update(HEADERS)
 
-            response = session.get(full_url, timeout=30)  # Добавлен таймаут
-            response.raise_for_status()
-        except requests.exceptions.Timeout:
-            logger.error(f"Таймаут при запросе {full_url}")
-            return
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Failed to fetch {full_url}: {e}")
-            return
-        except Exception as e:
-            logger.error(f"Неожиданная ошибка при запросе {full_url}: {e}")
-            return
-
-        content_type = response.headers.get("Content-Type", "")
-        
         # БЕЗОПАСНОСТЬ: санитизация имени файла
         page_name = sanitize_filename(path)
-        
+
         # Дополнительная проверка имени файла
         if not page_name or len(page_name) > 255:
             logger.error(f"Недопустимое имя файла для пути {path}")
             return
 
-        # Если PDF
-        if "application/pdf" in content_type or path.endswith(".pdf"):
-            filepath = f"{SAVE_DIR_RAW}/{page_name}.pdf"
-            try:
-                if not os.path.exists(filepath):
-                    with open(filepath, "wb") as f:
-                        f.write(response.content)
-                    print(f"Saved PDF: {filepath}")
-                text = extract_text_from_pdf(filepath)
-                if text:
-                    with open(f"{SAVE_DIR_CLEAN}/{page_name}.txt", "w", encoding="utf-8") as f:
-                        f.write(text)
-            except IOError as e:
-                logger.error(f"Ошибка записи PDF {filepath}: {e}")
-            except Exception as e:
-                logger.error(f"Ошибка обработки PDF {filepath}: {e}")
-            time.sleep(5)
+        print(f"Fetching: {full_url}")
+        limiter = limiters.setdefault(host, HostLimiter(rate=host_rate))
+        entry = state.entries.get(full_url)
+        try:
+            response = await fetch(client, full_url, limiter, headers=state.conditional_headers(full_url))
+        except httpx.TimeoutException:
+            logger.error(f"Таймаут при запросе {full_url}")
+            failed_urls.add(full_url)
             return
-
-        # Если DOCX
-        if "application/vnd.openxmlformats-officedocument.wordprocessingml.document" in content_type or path.endswith(".docx"):
-            filepath = f"{SAVE_DIR_RAW}/{page_name}.docx"
-            try:
-                if not os.path.exists(filepath):
-                    with open(filepath, "wb") as f:
-                        f.write(response.content)
-                    print(f"Saved DOCX: {filepath}")
-                text = extract_text_from_docx(filepath)
-                if text:
-                    with open(f"{SAVE_DIR_CLEAN}/{page_name}.txt", "w", encoding="utf-8") as f:
-                        f.write(text)
-            except IOError as e:
-                logger.error(f"Ошибка записи DOCX {filepath}: {e}")
-            except Exception as e:
-                logger.error(f"Ошибка обработки DOCX {filepath}: {e}")
-            time.sleep(5)
+        except httpx.HTTPStatusError as e:
+            logger.error(f"Failed to fetch {full_url}: {e}")
+            if e.response.status_code in (404, 410):
+                gone_urls.add(full_url)
+            else:
+                failed_urls.add(full_url)
+            return
+        except httpx.HTTPError as e:
+            logger.error(f"Failed to fetch {full_url}: {e}")
+            failed_urls.add(full_url)
             return
 
-        # Сохраняем HTML
-        filepath_html = f"{SAVE_DIR_RAW}/{page_name}.html"
-        try:
-            with open(filepath_html, "w", encoding="utf-8") as f:
-                f.write(response.text)
-        except IOError as e:
-            logger.error(f"Ошибка записи HTML {filepath_html}: {e}")
+        # БЕЗОПАСНОСТЬ: редирект не должен уводить за пределы сайта
+        if response.url.host != allowed_host:
+            logger.warning(f"Пропущен редирект на внешний URL: {response.url}")
             return
 
-        # Сохраняем очищенный текст
-        text = clean_text(response.text)
-        try:
-            with open(f"{SAVE_DIR_CLEAN}/{page_name}.txt", "w", encoding="utf-8") as f:
-                f.write(text)
-        except IOError as e:
-            logger.error(f"Ошибка записи текста {page_name}: {e}")
+        seen_urls.add(full_url)
+        txt_name = f"{page_name}.txt"
+
+        if response.status_code == 304 and entry:
+            changes["unchanged"].add(txt_name)
+            entry["last_seen"] = datetime.now().isoformat()
+            if entry.get("kind") == "html":
+                html = await asyncio.to_thread(read_saved_html, entry)
+                for link in get_internal_links(html, section_path):
+                    enqueue(link, section_path)
             return
 
-        # сохраняем метаинформацию
-        meta = {
-            "url": full_url,
-            "path": filepath_html,
-            "timestamp": datetime.now().isoformat()
+        kind = document_kind(path, response.headers.get("Content-Type", ""))
+        digest = hashlib.sha256(response.content).hexdigest()
+        if entry and entry.get("sha256") == digest and os.path.exists(entry.get("raw", "")):
+            changes["unchanged"].add(txt_name)
+        else:
+            # Запись файлов и очистка HTML — в отдельном потоке, чтобы не стопорить сеть
+            raw_path = await asyncio.to_thread(save_document, page_name, kind, full_url, response)
+            changes["changed" if entry else "added"].add(txt_name)
+            entry = {"page_name": page_name, "kind": kind, "raw": raw_path}
+
+        state.entries[full_url] = {
+            **entry,
+            "sha256": digest,
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "last_seen": datetime.now().isoformat(),
         }
 
-        try:
-            with open(f"{SAVE_DIR_CLEAN}/{page_name}.meta.json", "w", encoding="utf-8") as f:
-                json.dump(meta, f, ensure_ascii=False, indent=2)
-        except IOError as e:
-            logger.error(f"Ошибка записи метаданных {page_name}: {e}")
-
         # Находим вложенные ссылки
-        sublinks = get_internal_links(response.text, section_path)
-        for link in sublinks:
-            crawl(link)
+        if kind == "html":
+            for link in get_internal_links(response.text, section_path):
+                enqueue(link, section_path)
 
-    crawl(section_path)
+    async def worker(client: httpx.AsyncClient):
+        while True:
+            path, section_path = await frontier.get()
+            try:
+                await process(client, path, section_path)
+            except Exception as e:
+                logger.error(f"Неожиданная ошибка при обработке {path}: {e}")
+                failed_urls.add(urljoin(base_url, path))
+            finally:
+                frontier.task_done()
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(headers=HEADERS, timeout=REQUEST_TIMEOUT, limits=limits,
+                                 follow_redirects=True, transport=transport) as client:
+        workers = [asyncio.create_task(worker(client)) for _ in range(concurrency)]
+        await frontier.join()
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+
+    if prune:
+        missing = set(state.entries) - seen_urls - failed_urls
+        if failed_urls:
+            # Обход неполный: непосещённые URL могли быть просто недостижимы из упавших страниц
+            logger.warning(f"Обход завершился с ошибками ({len(failed_urls)} URL): удаляются только "
+                           f"документы с ответом 404/410, остальные {len(missing - gone_urls)} непосещённых сохранены")
+            missing &= gone_urls
+        for url in missing:
+            entry = state.entries.pop(url)
+            remove_document(entry)
+            changes["removed"].add(f"{entry['page_name']}.txt")
+
+    state.save()
+    return changes
+
+def crawl_section(section_path):
+    """Сканирует один раздел сайта"""
+    asyncio.run(crawl_site([section_path]))
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Обход сайта SFN и сохранение документов в data/")
+    parser.add_argument("--concurrency", type=int, default=CRAWL_CONCURRENCY,
+                        help="одновременно обрабатываемых страниц")
+    parser.add_argument("--host-rate", type=float, default=PER_HOST_RATE,
+                        help="средняя частота запросов к одному хосту в секунду (0 — без ограничения)")
+    args = parser.parse_args()
+
     logging.basicConfig(level=logging.INFO)
     print("Start parsing SFN site...")
-    for path in tqdm(TARGET_PATHS):
-        crawl_section(path)
-    print("Parsing complete.")
+    changes = asyncio.run(crawl_site(TARGET_PATHS, concurrency=args.concurrency, prune=True,
+                                     host_rate=args.host_rate))
+    write_changes_manifest(changes)
+    print(f"Parsing complete. Added: {len(changes['added'])}, changed: {len(changes['changed'])}, "
+          f"removed: {len(changes['removed'])}, unchanged: {len(changes['unchanged'])}")
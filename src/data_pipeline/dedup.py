@@ -0,0 +1,72 @@
+"""
+Поиск почти-дубликатов чанков через SimHash.
+
+Каждый чанк превращается в 64-битный SimHash по словесным шинглам. Два чанка
+считаются дубликатами, если их хэши отличаются не более чем на max_distance бит.
+Кандидаты ищутся по 4 полосам по 16 бит: при расстоянии <= 3 хотя бы одна полоса
+совпадает точно (принцип Дирихле), поэтому попарное сравнение всего корпуса не нужно.
+"""
+
+import hashlib
+import re
+from collections import defaultdict
+from typing import Dict, List
+
+import numpy as np
+
+SHINGLE_SIZE = 3
+MAX_HAMMING_DISTANCE = 3
+BANDS = 4
+BAND_BITS = 64 // BANDS
+
+_BIT_SHIFTS = np.arange(64, dtype=np.uint64)
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+def shingles(text: str, size: int = SHINGLE_SIZE) -> List[str]:
+    words = _WORD_RE.findall(text.lower().replace("ё", "е"))
+    if len(words) <= size:
+        return [" ".join(words)] if words else []
+    return [" ".join(words[i:i + size]) for i in range(len(words) - size + 1)]
+
+def simhash(text: str) -> int:
+    features = shingles(text)
+    if not features:
+        return 0
+    hashes = np.fromiter(
+        (int.from_bytes(hashlib.blake2b(f.encode("utf-8"), digest_size=8).digest(), "big") for f in features),
+        dtype=np.uint64,
+        count=len(features),
+    )
+    bits = (hashes[:, None] >> _BIT_SHIFTS) & np.uint64(1)
+    votes = bits.sum(axis=0).astype(np.int64) * 2 - len(features)
+    return int(sum(1 << int(i) for i in np.nonzero(votes > 0)[0]))
+
+def find_near_duplicates(texts: List[str], max_distance: int = MAX_HAMMING_DISTANCE) -> List[int]:
+    """Для каждого текста — индекс представителя его группы (первого встреченного почти-дубликата)"""
+    buckets: Dict[tuple, List[int]] = defaultdict(list)
+    hashes: List[int] = []
+    representative: List[int] = []
+    band_mask = (1 << BAND_BITS) - 1
+
+    for i, text in enumerate(texts):
+        h = simhash(text)
+        hashes.append(h)
+        bands = [(band, (h >> (band * BAND_BITS)) & band_mask) for band in range(BANDS)]
+
+        match = None
+        for key in bands:
+            for candidate in buckets.get(key, ()):
+                if bin(h ^ hashes[candidate]).count("1") <= max_distance:
+                    match = candidate
+                    break
+            if match is not None:
+                break
+
+        if match is None:
+            # Новый представитель: в полосы кладём только представителей, чтобы бакеты оставались маленькими
+            representative.append(i)
+            for key in bands:
+                buckets[key].append(i)
+        else:
+            representative.append(match)
+    return representative
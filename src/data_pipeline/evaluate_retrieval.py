@@ -0,0 +1,249 @@
+"""
+Офлайн-оценка качества и стоимости поиска на исторических запросах.
+
+Вопросы берутся из журнала (logs/queries.jsonl и ротированные queries-*.jsonl.gz) и, по желанию,
+из размеченного набора (JSONL: {"query": ..., "urls": [...]}). Релевантность — на уровне URL
+источника, поэтому сравниваются и сборки с разным CHUNK_SIZE. Для вопросов из журнала метками служат
+источники, которые вернул сервис («серебряная» разметка): она показывает согласие с текущей
+конфигурацией, а не истинное качество, поэтому решения лучше проверять на размеченном наборе.
+
+Каждая сборка — каталог с faiss.index, metadata.jsonl и (для гибридного поиска) bm25.npz, как
+data/index. Альтернативную сборку получают запуском build_faiss_index.py в другом рабочем каталоге
+(со ссылкой на data/clean); модель эмбеддингов берётся из build_state.json сборки.
+
+Для каждой пары (сборка, режим dense | hybrid) считаются recall@k и MRR, задержка поиска p50/p99,
+размер индекса и размер контекста промпта в токенах. Пары обрабатываются параллельно в отдельных
+процессах; для точных замеров задержки запускайте с --workers 1.
+
+    python src/data_pipeline/evaluate_retrieval.py --builds data/index ../exp-chunk3/data/index --k 1 3 5 10
+"""
+
+import argparse
+import gzip
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+# Настройка логгера
+logger = logging.getLogger(__name__)
+
+# === CONFIG ===
+QUERIES_LOG = Path("logs/queries.jsonl")
+REPORT_FILE = Path("data/index/retrieval_eval.json")
+MODEL_NAME = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
+DEFAULT_K = [1, 3, 5, 10]
+# Параметры гибридного поиска и упаковки контекста — те же переменные окружения, что у сервиса
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "20"))
+RRF_K = int(os.getenv("RRF_K", "60"))
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "1200"))
+PROMPT_MAX_SENTENCES_PER_CHUNK = int(os.getenv("PROMPT_MAX_SENTENCES_PER_CHUNK", "4"))
+
+# === ЗАПРОСЫ И РАЗМЕТКА ===
+def _log_files(log_file: Path) -> List[Path]:
+    """Текущий журнал и его ротированные архивы"""
+    files = sorted(log_file.parent.glob(f"{log_file.stem}-*{log_file.suffix}.gz"))
+    if log_file.exists():
+        files.append(log_file)
+    return files
+
+def _read_jsonl(path: Path) -> Iterator[Dict]:
+    opener = gzip.open if path.suffix == ".gz" else open
+    with opener(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                logger.warning(f"Пропущена повреждённая строка в {path}")
+
+def load_eval_set(log_file: Optional[Path], gold_file: Optional[Path], limit: int) -> List[Dict]:
+    """[{query, urls, label}] — размеченные вопросы (label=gold) вытесняют такие же вопросы из журнала"""
+    from answer_cache import normalize_query
+
+    items: Dict[str, Dict] = {}
+    if gold_file is not None:
+        for entry in _read_jsonl(gold_file):
+            urls = entry.get("urls") or entry.get("sources") or []
+            if entry.get("query") and urls:
+                items[normalize_query(entry["query"])] = {"query": entry["query"], "urls": urls, "label": "gold"}
+
+    if log_file is not None:
+        for path in _log_files(log_file):
+            for entry in _read_jsonl(path):
+                key = normalize_query(entry.get("query", ""))
+                # Повторы вопроса схлопываются: иначе частые вопросы доминировали бы в метриках
+                if entry.get("sources") and key and key not in items:
+                    items[key] = {"query": entry["query"], "urls": entry["sources"], "label": "silver"}
+
+    eval_set = list(items.values())
+    if limit and len(eval_set) > limit:
+        rng = np.random.default_rng(0)
+        eval_set = [eval_set[i] for i in sorted(rng.choice(len(eval_set), size=limit, replace=False))]
+    return eval_set
+
+# === ОЦЕНКА ОДНОЙ КОНФИГУРАЦИИ ===
+def _unique_urls(chunks: List[Dict]) -> List[str]:
+    return list(dict.fromkeys(chunk["source_url"] for chunk in chunks))
+
+def ranking_metrics(retrieved_urls: List[List[str]], relevant: List[List[str]], k: int) -> Dict:
+    recalls, reciprocal_ranks = [], []
+    for urls, gold in zip(retrieved_urls, relevant):
+        top, gold = urls[:k], set(gold)
+        recalls.append(len(gold.intersection(top)) / len(gold))
+        rank = next((i + 1 for i, url in enumerate(top) if url in gold), None)
+        reciprocal_ranks.append(1.0 / rank if rank else 0.0)
+    return {"recall": round(float(np.mean(recalls)), 4), "mrr": round(float(np.mean(reciprocal_ranks)), 4)}
+
+def _load_build_embedder(build_dir: Path):
+    """Модель эмбеддингов, которой собрана сборка (по build_state.json)"""
+    from embedding_backends import load_embedder
+
+    state_file = build_dir / "build_state.json"
+    state = json.loads(state_file.read_text(encoding="utf-8")) if state_file.exists() else {}
+    backend = state.get("embed_backend", "torch")
+    model_name = state.get("model", MODEL_NAME)
+    if backend.startswith("onnx:"):
+        return load_embedder("onnx", model_name, onnx_file=backend.split(":", 1)[1]), state
+    return load_embedder("torch", model_name), state
+
+def evaluate_config(build_dir: str, mode: str, eval_set: List[Dict], ks: List[int], threads: int) -> Dict:
+    """Прогон всех вопросов по одной сборке в одном режиме; выполняется в отдельном процессе"""
+    import faiss
+    from context_packer import ContextPacker
+    from index_manager import IndexManager
+    from sparse_index import reciprocal_rank_fusion
+
+    faiss.omp_set_num_threads(threads)
+    build_dir = Path(build_dir)
+    sparse_path = build_dir / "bm25.npz"
+    if mode == "hybrid" and not sparse_path.exists():
+        return {"build": str(build_dir), "mode": mode, "error": "нет bm25.npz"}
+
+    model, state = _load_build_embedder(build_dir)
+    snapshot = IndexManager(build_dir / "faiss.index", build_dir / "metadata.jsonl", use_mmap=False,
+                            sparse_path=sparse_path if mode == "hybrid" else None).current
+
+    def count_tokens(text: str) -> int:
+        return len(model.tokenizer.encode(text, add_special_tokens=False))
+
+    packer = ContextPacker(count_tokens, PROMPT_TOKEN_BUDGET, PROMPT_MAX_SENTENCES_PER_CHUNK)
+    queries = [item["query"] for item in eval_set]
+
+    started = time.perf_counter()
+    vectors = np.asarray(model.encode(queries, batch_size=32), dtype=np.float32)
+    embed_ms = (time.perf_counter() - started) * 1000 / max(len(queries), 1)
+
+    max_k = max(ks)
+    n = max(max_k, HYBRID_CANDIDATES) if mode == "hybrid" else max_k
+    results, latencies = [], []
+    for query, vector in zip(queries, vectors):
+        # Как search_chunks в сервисе, но последовательно: замеряется суммарная работа поиска
+        started = time.perf_counter()
+        _, indices = snapshot.index.search(vector.reshape(1, -1), n)
+        ids = [int(idx) for idx in indices[0] if idx >= 0]
+        if mode == "hybrid":
+            sparse_ids = [chunk_id for chunk_id, _ in snapshot.sparse.search(query, n)]
+            ids = reciprocal_rank_fusion([ids, sparse_ids], max_k, RRF_K)
+        chunks = [chunk for chunk in (snapshot.metadata.get(chunk_id) for chunk_id in ids[:max_k]) if chunk]
+        latencies.append((time.perf_counter() - started) * 1000)
+        results.append(chunks)
+
+    relevant = [item["urls"] for item in eval_set]
+    by_k = {}
+    for k in ks:
+        # k — число чанков в выдаче, как TOP_K; несколько чанков одного URL считаются одним попаданием
+        urls = [_unique_urls(chunks[:k]) for chunks in results]
+        raw_tokens = [count_tokens("\n".join(f"- {ch['chunk_text']}" for ch in chunks[:k])) for chunks in results]
+        packed_tokens = [packer.pack(query, chunks[:k]).tokens for query, chunks in zip(queries, results)]
+        by_k[str(k)] = {
+            **ranking_metrics(urls, relevant, k),
+            "context_tokens_mean": round(float(np.mean(raw_tokens)), 1),
+            "packed_tokens_mean": round(float(np.mean(packed_tokens)), 1),
+            "packed_tokens_p95": round(float(np.percentile(packed_tokens, 95)), 1),
+        }
+
+    index_files = [build_dir / name for name in ("faiss.index", "metadata.jsonl", "bm25.npz")]
+    return {
+        "build": str(build_dir),
+        "mode": mode,
+        "model": state.get("model", MODEL_NAME),
+        "embed_backend": state.get("embed_backend", "torch"),
+        "chunk_size": state.get("chunk_size"),
+        "index_factory": state.get("index_factory", "Flat"),
+        "chunks": snapshot.index.ntotal,
+        "index_size_mb": round(sum(p.stat().st_size for p in index_files if p.exists()) / 2**20, 2),
+        "embed_ms_per_query": round(embed_ms, 3),
+        "search_p50_ms": round(float(np.percentile(latencies, 50)), 3),
+        "search_p99_ms": round(float(np.percentile(latencies, 99)), 3),
+        "metrics": by_k,
+    }
+
+def run_evaluation(builds: List[str], modes: List[str], eval_set: List[Dict], ks: List[int],
+                   workers: int) -> List[Dict]:
+    configs: List[Tuple[str, str]] = [(build, mode) for build in builds for mode in modes]
+    workers = max(1, min(workers, len(configs)))
+    # Ядра делятся между процессами, чтобы потоки FAISS разных конфигураций не конкурировали
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    rows = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(evaluate_config, build, mode, eval_set, ks, threads): (build, mode)
+                   for build, mode in configs}
+        for future in as_completed(futures):
+            build, mode = futures[future]
+            try:
+                rows.append(future.result())
+            except Exception as e:
+                logger.error(f"Оценка {build} ({mode}) завершилась ошибкой: {e}")
+                rows.append({"build": build, "mode": mode, "error": str(e)})
+    order = {config: i for i, config in enumerate(configs)}
+    return sorted(rows, key=lambda row: order[(row["build"], row["mode"])])
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Офлайн-оценка recall@k/MRR, задержки и токенов для сборок индекса")
+    parser.add_argument("--builds", nargs="+", default=["data/index"], help="каталоги сборок индекса")
+    parser.add_argument("--modes", nargs="+", choices=["dense", "hybrid"], default=["dense", "hybrid"])
+    parser.add_argument("--k", type=int, nargs="+", default=DEFAULT_K)
+    parser.add_argument("--log", type=Path, default=QUERIES_LOG, help="журнал запросов (ротированные .gz рядом)")
+    parser.add_argument("--no-log", action="store_true", help="оценивать только по размеченному набору")
+    parser.add_argument("--gold", type=Path, default=None, help='JSONL {"query": ..., "urls": [...]}')
+    parser.add_argument("--limit", type=int, default=2000, help="максимум вопросов (0 — все)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="параллельных конфигураций")
+    parser.add_argument("--output", type=Path, default=REPORT_FILE)
+    args = parser.parse_args()
+
+    eval_set = load_eval_set(None if args.no_log else args.log, args.gold, args.limit)
+    if not eval_set:
+        logger.error("Нет вопросов для оценки: журнал пуст и размеченный набор не задан")
+        sys.exit(1)
+    n_gold = sum(item["label"] == "gold" for item in eval_set)
+    print(f"Вопросов: {len(eval_set)} (размеченных {n_gold}, из журнала {len(eval_set) - n_gold})")
+
+    rows = run_evaluation(args.builds, args.modes, eval_set, args.k, args.workers)
+
+    k_report = max(args.k)
+    print(f"{'build':<32}{'mode':<8}{'recall@' + str(k_report):>10}{'MRR':>8}{'p50, мс':>10}{'p99, мс':>10}"
+          f"{'MB':>10}{'токены':>8}")
+    for row in rows:
+        if "error" in row:
+            print(f"{row['build']:<32}{row['mode']:<8}  ошибка: {row['error']}")
+            continue
+        m = row["metrics"][str(k_report)]
+        print(f"{row['build'][-31:]:<32}{row['mode']:<8}{m['recall']:>10.3f}{m['mrr']:>8.3f}"
+              f"{row['search_p50_ms']:>10.3f}{row['search_p99_ms']:>10.3f}{row['index_size_mb']:>10.2f}"
+              f"{m['packed_tokens_mean']:>8.0f}")
+
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump({"queries": len(eval_set), "gold_queries": n_gold, "k": args.k, "results": rows},
+                  f, ensure_ascii=False, indent=2)
+    print(f"Отчёт сохранён: {args.output}")
@@ -0,0 +1,154 @@
+import argparse
+import logging
+import multiprocessing
+import os
+import time
+from multiprocessing.connection import wait
+from pathlib import Path
+from typing import Dict, List
+
+# Настройка логгера
+logger = logging.getLogger(__name__)
+
+# === CONFIG ===
+SAVE_DIR_RAW = Path("data/raw")
+SAVE_DIR_CLEAN = Path("data/clean")
+
+EXTRACT_WORKERS = os.cpu_count() or 1
+DOC_TIMEOUT = 120        # секунд на один документ
+DOC_MEMORY_LIMIT_MB = 1024  # лимит адресного пространства процесса-извлекателя
+
+EXTRACTORS = {".pdf", ".docx"}
+
+def _limit_memory(limit_mb: int):
+    """Ограничивает память дочернего процесса (только POSIX)"""
+    if limit_mb <= 0:
+        return
+    try:
+        import resource
+        limit = limit_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    except (ImportError, ValueError, OSError) as e:
+        logger.warning(f"Не удалось ограничить память процесса: {e}")
+
+def stream_pdf(src: Path, out) -> bool:
+    import fitz  # PyMuPDF
+
+    has_text = False
+    with fitz.open(src) as doc:
+        for page_no, page in enumerate(doc):
+            text = page.get_text()
+            if page_no:
+                out.write("\n")
+            out.write(text)
+            has_text = has_text or bool(text.strip())
+    return has_text
+
+def stream_docx(src: Path, out) -> bool:
+    import docx
+
+    has_text = False
+    document = docx.Document(src)
+    for paragraph in document.paragraphs:
+        if paragraph.text.strip():
+            if has_text:
+                out.write("\n")
+            out.write(paragraph.text)
+            has_text = True
+    return has_text
+
+def extract_document(src: Path, dst: Path, memory_limit_mb: int = DOC_MEMORY_LIMIT_MB):
+    """Точка входа дочернего процесса: постранично пишет текст во временный файл и подменяет dst"""
+    _limit_memory(memory_limit_mb)
+    tmp_path = dst.with_name(dst.name + ".part")
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as out:
+            has_text = stream_pdf(src, out) if src.suffix == ".pdf" else stream_docx(src, out)
+        if has_text:
+            os.replace(tmp_path, dst)
+        else:
+            print(f"[!] В документе нет текста: {src}")
+            tmp_path.unlink(missing_ok=True)
+    except MemoryError:
+        tmp_path.unlink(missing_ok=True)
+        print(f"[!] Превышен лимит памяти при чтении {src}")
+        os._exit(2)
+    except Exception as e:
+        tmp_path.unlink(missing_ok=True)
+        print(f"[!] Ошибка при чтении {src}: {e}")
+        os._exit(1)
+
+def pending_documents(force: bool = False) -> List[Path]:
+    """Сырые PDF/DOCX, для которых очищенный текст отсутствует или старше исходника"""
+    pending = []
+    if not SAVE_DIR_RAW.exists():
+        return pending
+    for src in sorted(SAVE_DIR_RAW.iterdir()):
+        if src.suffix not in EXTRACTORS:
+            continue
+        dst = SAVE_DIR_CLEAN / f"{src.stem}.txt"
+        if force or not dst.exists() or dst.stat().st_mtime < src.stat().st_mtime:
+            pending.append(src)
+    return pending
+
+def run_extraction(documents: List[Path], workers: int = EXTRACT_WORKERS, timeout: float = DOC_TIMEOUT,
+                   memory_limit_mb: int = DOC_MEMORY_LIMIT_MB) -> Dict[str, List[str]]:
+    """Извлекает текст в пуле процессов: по процессу на документ, с таймаутом и лимитом памяти.
+
+    Процесс на документ (а не ProcessPoolExecutor) нужен, чтобы зависший
+    или раздувшийся PDF можно было убить, не теряя остальной пул.
+    """
+    workers = max(1, workers)
+    queue = list(reversed(documents))
+    active = {}
+    result = {"ok": [], "failed": [], "timeout": []}
+    started = time.perf_counter()
+
+    while queue or active:
+        while queue and len(active) < workers:
+            src = queue.pop()
+            dst = SAVE_DIR_CLEAN / f"{src.stem}.txt"
+            proc = multiprocessing.Process(target=extract_document, args=(src, dst, memory_limit_mb), daemon=True)
+            proc.start()
+            active[proc.sentinel] = (proc, src, time.monotonic() + timeout)
+
+        nearest_deadline = min(deadline for _, _, deadline in active.values())
+        wait(list(active), timeout=max(0.0, nearest_deadline - time.monotonic()))
+
+        now = time.monotonic()
+        for sentinel, (proc, src, deadline) in list(active.items()):
+            if proc.is_alive() and now < deadline:
+                continue
+            if proc.is_alive():
+                proc.kill()
+                proc.join()
+                logger.error(f"Таймаут извлечения текста ({timeout:.0f} с): {src}")
+                result["timeout"].append(src.name)
+            elif proc.exitcode == 0:
+                result["ok"].append(src.name)
+            else:
+                logger.error(f"Извлечение текста завершилось с кодом {proc.exitcode}: {src}")
+                result["failed"].append(src.name)
+            proc.close()
+            del active[sentinel]
+
+    elapsed = time.perf_counter() - started
+    print(f"Извлечение: {len(documents)} документов за {elapsed:.1f} с "
+          f"(успешно: {len(result['ok'])}, ошибок: {len(result['failed'])}, таймаутов: {len(result['timeout'])})")
+    return result
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Извлечение текста из PDF/DOCX в data/clean")
+    parser.add_argument("--force", action="store_true", help="переизвлечь все документы")
+    parser.add_argument("--workers", type=int, default=EXTRACT_WORKERS)
+    parser.add_argument("--timeout", type=float, default=DOC_TIMEOUT, help="секунд на документ")
+    parser.add_argument("--memory-limit-mb", type=int, default=DOC_MEMORY_LIMIT_MB, help="лимит памяти на документ; 0 — без лимита")
+    args = parser.parse_args()
+
+    SAVE_DIR_CLEAN.mkdir(parents=True, exist_ok=True)
+    documents = pending_documents(force=args.force)
+    if not documents:
+        print("Нет новых документов для извлечения.")
+    else:
+        run_extraction(documents, workers=args.workers, timeout=args.timeout, memory_limit_mb=args.memory_limit_mb)
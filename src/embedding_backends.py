@@ -0,0 +1,216 @@
+"""
+Бэкенды эмбеддингов: PyTorch (sentence-transformers) и ONNX Runtime (fp32 или int8).
+
+Оба реализуют интерфейс, которым пользуются пайплайн и индексатор:
+encode(texts, batch_size=..., convert_to_numpy=True, show_progress_bar=False),
+get_sentence_embedding_dimension() и tokenizer. ONNX-бэкенд не импортирует torch.
+
+Модель экспортируется и квантуется один раз:
+    python src/embedding_backends.py export --quantize
+затем проверяются совпадение векторов с PyTorch и скорость:
+    python src/embedding_backends.py parity --onnx-file model_qint8.onnx
+    python src/embedding_backends.py bench
+"""
+
+import argparse
+import json
+import os
+import time
+from pathlib import Path
+from typing import List, Optional
+
+import numpy as np
+
+DEFAULT_MODEL_NAME = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
+# Бэкенд выбирается переменными окружения и в API, и в индексаторе
+EMBED_BACKEND = os.getenv("EMBED_BACKEND", "torch")  # torch | onnx
+EMBED_ONNX_DIR = Path(os.getenv("EMBED_ONNX_DIR", "models/embed-onnx"))
+EMBED_ONNX_FILE = os.getenv("EMBED_ONNX_FILE", "model_qint8.onnx")
+EMBED_ONNX_THREADS = int(os.getenv("EMBED_ONNX_THREADS", "0"))  # 0 — по числу ядер
+MAX_SEQ_LENGTH = 128  # как у paraphrase-multilingual-MiniLM-L12-v2
+
+class OnnxEmbedder:
+    """Трансформер в ONNX Runtime + mean pooling по маске внимания (как Pooling в sentence-transformers)"""
+
+    def __init__(self, model_dir: Path = EMBED_ONNX_DIR, file_name: str = EMBED_ONNX_FILE,
+                 max_length: int = MAX_SEQ_LENGTH, threads: int = EMBED_ONNX_THREADS):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        model_path = Path(model_dir) / file_name
+        if not model_path.exists():
+            raise FileNotFoundError(f"Нет ONNX-модели {model_path}: выполните python src/embedding_backends.py export")
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads > 0:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(str(model_path), options, providers=["CPUExecutionProvider"])
+        self._input_names = {i.name for i in self.session.get_inputs()}
+        self.tokenizer = AutoTokenizer.from_pretrained(str(model_dir))
+        self.max_length = max_length
+        with open(Path(model_dir) / "embedding_config.json", "r", encoding="utf-8") as f:
+            self._dim = json.load(f)["dimension"]
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self._dim
+
+    def _encode_batch(self, texts: List[str]) -> np.ndarray:
+        inputs = self.tokenizer(texts, padding=True, truncation=True, max_length=self.max_length, return_tensors="np")
+        feed = {name: inputs[name].astype(np.int64) for name in ("input_ids", "attention_mask", "token_type_ids")
+                if name in self._input_names and name in inputs}
+        token_embeddings = self.session.run(None, feed)[0]
+        mask = inputs["attention_mask"][..., None].astype(np.float32)
+        return (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+
+    def encode(self, texts, batch_size: int = 32, convert_to_numpy: bool = True,
+               show_progress_bar: bool = False) -> np.ndarray:
+        single = isinstance(texts, str)
+        texts = [texts] if single else list(texts)
+        if not texts:
+            return np.zeros((0, self._dim), dtype=np.float32)
+        vectors = np.vstack([self._encode_batch(texts[i:i + batch_size]) for i in range(0, len(texts), batch_size)])
+        vectors = vectors.astype(np.float32)
+        return vectors[0] if single else vectors
+
+def load_embedder(backend: str = EMBED_BACKEND, model_name: str = DEFAULT_MODEL_NAME,
+                  onnx_dir: Path = EMBED_ONNX_DIR, onnx_file: str = EMBED_ONNX_FILE):
+    """Модель эмбеддингов выбранного бэкенда"""
+    if backend == "onnx":
+        return OnnxEmbedder(onnx_dir, onnx_file)
+    if backend != "torch":
+        raise ValueError(f"Неизвестный бэкенд эмбеддингов: {backend}")
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(model_name, device="cpu")
+
+def backend_id(backend: str = EMBED_BACKEND, onnx_file: str = EMBED_ONNX_FILE) -> str:
+    """Идентификатор бэкенда для состояния сборки (без загрузки модели)"""
+    return f"onnx:{onnx_file}" if backend == "onnx" else "torch"
+
+# === ЭКСПОРТ, ПРОВЕРКА, БЕНЧМАРК ===
+SAMPLE_TEXTS = [
+    "Что такое инвестиционный пай?",
+    "Как вернуть средства из ЗПИФ?",
+    "Нужно ли проходить тест перед покупкой паёв?",
+    "Паи розничных фондов можно реализовать на вторичном рынке или погасить в управляющей компании.",
+    "Стоимость чистых активов фонда рассчитывается ежедневно и публикуется на сайте.",
+    "Квалифицированным инвесторам доступны закрытые паевые инвестиционные фонды недвижимости.",
+    "Налог на доход от погашения паёв удерживается управляющей компанией как налоговым агентом.",
+    "Правила доверительного управления фондом зарегистрированы Банком России.",
+]
+
+def _sample_texts(metadata_path: Optional[Path], limit: int) -> List[str]:
+    """Тексты чанков из метаданных индекса (если есть) или встроенные примеры"""
+    texts = []
+    if metadata_path and metadata_path.exists():
+        with open(metadata_path, "r", encoding="utf-8") as f:
+            for line in f:
+                texts.append(json.loads(line)["chunk_text"])
+                if len(texts) >= limit:
+                    break
+    return texts or SAMPLE_TEXTS
+
+def export_onnx(model_name: str, out_dir: Path, quantize: bool, opset: int = 17):
+    """Экспорт трансформера в ONNX (нужен torch) и, по желанию, динамическая int8-квантизация весов"""
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    out_dir.mkdir(parents=True, exist_ok=True)
+    st_model = SentenceTransformer(model_name, device="cpu")
+    transformer = st_model[0].auto_model.eval()
+    tokenizer = st_model.tokenizer
+    dummy = tokenizer(["пример текста"], return_tensors="pt")
+    input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in dummy]
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+
+    fp32_path = out_dir / "model.onnx"
+    with torch.no_grad():
+        torch.onnx.export(
+            transformer,
+            tuple(dummy[name] for name in input_names),
+            str(fp32_path),
+            input_names=input_names,
+            output_names=["last_hidden_state"],
+            dynamic_axes=dynamic_axes,
+            opset_version=opset,
+        )
+    tokenizer.save_pretrained(str(out_dir))
+    with open(out_dir / "embedding_config.json", "w", encoding="utf-8") as f:
+        json.dump({"model": model_name, "dimension": st_model.get_sentence_embedding_dimension()}, f)
+    print(f"ONNX-модель: {fp32_path}")
+
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        int8_path = out_dir / "model_qint8.onnx"
+        quantize_dynamic(str(fp32_path), str(int8_path), weight_type=QuantType.QInt8)
+        print(f"int8-модель: {int8_path}")
+
+def parity(model_name: str, onnx_dir: Path, onnx_file: str, texts: List[str], threshold: float) -> bool:
+    """Косинусная близость векторов ONNX к векторам PyTorch на одних и тех же текстах"""
+    reference = load_embedder("torch", model_name).encode(texts, batch_size=32)
+    candidate = OnnxEmbedder(onnx_dir, onnx_file).encode(texts, batch_size=32)
+    cos = (reference * candidate).sum(axis=1) / (
+        np.linalg.norm(reference, axis=1) * np.linalg.norm(candidate, axis=1) + 1e-12
+    )
+    ok = float(cos.min()) >= threshold
+    print(f"{onnx_file}: косинус с PyTorch на {len(texts)} текстах — "
+          f"средний {cos.mean():.4f}, минимальный {cos.min():.4f} (порог {threshold}) — {'OK' if ok else 'FAIL'}")
+    return ok
+
+def bench(model_name: str, onnx_dir: Path, texts: List[str], batch_sizes: List[int], repeats: int):
+    """Пропускная способность (текстов/с) каждого бэкенда: батч 1 — запросы API, крупные батчи — индексатор"""
+    backends = {"torch": lambda: load_embedder("torch", model_name)}
+    for file_name in ("model.onnx", "model_qint8.onnx"):
+        if (onnx_dir / file_name).exists():
+            backends[f"onnx:{file_name}"] = lambda f=file_name: OnnxEmbedder(onnx_dir, f)
+
+    results = {}
+    for name, factory in backends.items():
+        started = time.perf_counter()
+        embedder = factory()
+        load_s = time.perf_counter() - started
+        embedder.encode(texts[:8], batch_size=8)  # прогрев
+        results[name] = {"load_s": round(load_s, 2)}
+        for batch_size in batch_sizes:
+            started = time.perf_counter()
+            for _ in range(repeats):
+                embedder.encode(texts, batch_size=batch_size)
+            elapsed = time.perf_counter() - started
+            results[name][f"batch_{batch_size}_texts_per_s"] = round(len(texts) * repeats / elapsed, 1)
+        print(name, results[name])
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Экспорт, проверка и бенчмарк бэкендов эмбеддингов")
+    parser.add_argument("--model", default=DEFAULT_MODEL_NAME)
+    parser.add_argument("--onnx-dir", type=Path, default=EMBED_ONNX_DIR)
+    parser.add_argument("--metadata", type=Path, default=Path("data/index/metadata.jsonl"),
+                        help="тексты для проверки и бенчмарка берутся из метаданных индекса")
+    parser.add_argument("--samples", type=int, default=512)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = sub.add_parser("export", help="экспортировать модель в ONNX")
+    export_parser.add_argument("--quantize", action="store_true", help="дополнительно сохранить int8-модель")
+
+    parity_parser = sub.add_parser("parity", help="сравнить векторы ONNX и PyTorch")
+    parity_parser.add_argument("--onnx-file", default=EMBED_ONNX_FILE)
+    parity_parser.add_argument("--threshold", type=float, default=0.98, help="минимально допустимый косинус")
+
+    bench_parser = sub.add_parser("bench", help="пропускная способность бэкендов")
+    bench_parser.add_argument("--batch-sizes", default="1,32,64")
+    bench_parser.add_argument("--repeats", type=int, default=3)
+    bench_parser.add_argument("--output", type=Path, default=None, help="сохранить результаты в JSON")
+    args = parser.parse_args()
+
+    if args.command == "export":
+        export_onnx(args.model, args.onnx_dir, args.quantize)
+    elif args.command == "parity":
+        texts = _sample_texts(args.metadata, args.samples)
+        raise SystemExit(0 if parity(args.model, args.onnx_dir, args.onnx_file, texts, args.threshold) else 1)
+    else:
+        texts = _sample_texts(args.metadata, args.samples)
+        results = bench(args.model, args.onnx_dir, texts,
+                        [int(b) for b in args.batch_sizes.split(",")], args.repeats)
+        if args.output:
+            with open(args.output, "w", encoding="utf-8") as f:
+                json.dump(results, f, ensure_ascii=False, indent=2)
@@ -0,0 +1,171 @@
+import logging
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+import faiss
+
+from metadata_store import MetadataStore, offsets_path
+from sparse_index import BM25Index
+
+logger = logging.getLogger(__name__)
+
+def read_index(path: Path, use_mmap: bool = True):
+    """Читает индекс, по возможности отображая его в память (страницы общие для воркеров).
+
+    IO_FLAG_MMAP_IFC (faiss >= 1.9) отображает коды плоских индексов, но для IVF faiss отвечает
+    "mmap only supported for File objects" — тогда пробуем один IO_FLAG_MMAP (списки IVF
+    отображаются через OnDiskInvertedLists), и только затем читаем индекс целиком.
+    """
+    if use_mmap:
+        attempts = []
+        if hasattr(faiss, "IO_FLAG_MMAP_IFC"):
+            attempts.append(faiss.IO_FLAG_MMAP | faiss.IO_FLAG_MMAP_IFC)
+        attempts.append(faiss.IO_FLAG_MMAP)
+        for flags in attempts:
+            try:
+                return faiss.read_index(str(path), flags)
+            except RuntimeError as e:
+                error = e
+        logger.warning(f"Индекс {path} не поддерживает mmap и загружается в память целиком: {error}")
+    else:
+        logger.warning(f"Индекс {path} загружается в память целиком (mmap отключён)")
+    return faiss.read_index(str(path))
+
+def apply_search_params(index, nprobe: int = 0, ef_search: int = 0):
+    """Выставляет параметры поиска; для неподходящего типа индекса параметр игнорируется"""
+    params = faiss.ParameterSpace()
+    for name, value in (("nprobe", nprobe), ("efSearch", ef_search)):
+        if value <= 0:
+            continue
+        try:
+            params.set_index_parameter(index, name, value)
+        except RuntimeError:
+            logger.warning(f"Параметр {name} не поддерживается индексом {type(index).__name__}")
+
+@dataclass(frozen=True)
+class IndexSnapshot:
+    """Согласованные индекс, метаданные и (если есть) BM25 одной сборки"""
+    index: object
+    metadata: MetadataStore
+    version: str
+    sparse: Optional[BM25Index] = None
+
+class IndexManager:
+    """Держит текущую версию индекса и подменяет её без перезапуска процесса.
+
+    Запрос берёт snapshot один раз в начале и работает с ним до конца, поэтому
+    подмена ссылки на новый snapshot не затрагивает запросы «в полёте»: старая
+    версия освобождается сборщиком мусора, когда последний из них завершится.
+    """
+
+    def __init__(self, index_path: Path, metadata_path: Path, use_mmap: bool = True,
+                 nprobe: int = 0, ef_search: int = 0, sparse_path: Optional[Path] = None,
+                 state_path: Optional[Path] = None):
+        self.index_path = Path(index_path)
+        self.metadata_path = Path(metadata_path)
+        # build_state.json индексатор пишет последним — его смена означает завершённую сборку
+        self.state_path = Path(state_path) if state_path else self.index_path.with_name("build_state.json")
+        self.sparse_path = Path(sparse_path) if sparse_path else None
+        self.use_mmap = use_mmap
+        self.nprobe = nprobe
+        self.ef_search = ef_search
+        self._reload_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._watcher: Optional[threading.Thread] = None
+        self._current = self._load(self.version_on_disk())
+
+    @property
+    def current(self) -> IndexSnapshot:
+        return self._current
+
+    def version_on_disk(self) -> str:
+        """Версия сборки — по build_state.json, который индексатор записывает после всех остальных файлов.
+
+        Файлы сборки подменяются по одному (индекс, метаданные, смещения, BM25), поэтому их собственные
+        mtime меняются и посреди записи: загрузка в этот момент смешала бы новый JSONL со старой
+        таблицей смещений. Без build_state.json (сборка старым индексатором) — по mtime файлов.
+        """
+        if self.state_path.exists():
+            state_stat = self.state_path.stat()
+            return f"state:{state_stat.st_mtime_ns}:{state_stat.st_size}"
+        index_stat = self.index_path.stat()
+        metadata_stat = self.metadata_path.stat()
+        version = f"{index_stat.st_mtime_ns}:{index_stat.st_size}:{metadata_stat.st_mtime_ns}"
+        if self.sparse_path and self.sparse_path.exists():
+            version += f":{self.sparse_path.stat().st_mtime_ns}"
+        return version
+
+    def _build_files(self):
+        files = [self.index_path, self.metadata_path, offsets_path(self.metadata_path)]
+        if self.sparse_path:
+            files.append(self.sparse_path)
+        return [path for path in files if path.exists()]
+
+    def _files_fingerprint(self):
+        return [(path.stat().st_mtime_ns, path.stat().st_size) for path in self._build_files()]
+
+    def _check_build_complete(self):
+        """Файл новее build_state.json — индексатор ещё пишет следующую сборку (в т.ч. при reload(force=True))"""
+        if not self.state_path.exists():
+            return
+        state_mtime = self.state_path.stat().st_mtime_ns
+        for path in self._build_files():
+            if path.stat().st_mtime_ns > state_mtime:
+                raise RuntimeError(f"идёт запись новой сборки ({path.name} новее {self.state_path.name})")
+
+    def _load(self, version: str) -> IndexSnapshot:
+        index = read_index(self.index_path, self.use_mmap)
+        apply_search_params(index, self.nprobe, self.ef_search)
+        metadata = MetadataStore(self.metadata_path)
+        if len(metadata) != index.ntotal:
+            metadata.close()
+            raise ValueError(f"Несовпадение количества чанков и метаданных: {index.ntotal} != {len(metadata)}")
+
+        sparse = None
+        if self.sparse_path and self.sparse_path.exists():
+            sparse = BM25Index(self.sparse_path)
+            if len(sparse) != index.ntotal:
+                metadata.close()
+                raise ValueError(f"Несовпадение количества чанков в BM25 и FAISS: {len(sparse)} != {index.ntotal}")
+        return IndexSnapshot(index=index, metadata=metadata, version=version, sparse=sparse)
+
+    def reload(self, force: bool = False) -> bool:
+        """Загружает новую сборку и атомарно подменяет текущую. True — если версия сменилась"""
+        with self._reload_lock:
+            version = self.version_on_disk()
+            if version == self._current.version and not force:
+                return False
+            self._check_build_complete()
+            files_before = self._files_fingerprint()
+            snapshot = self._load(version)
+            if self._files_fingerprint() != files_before:
+                # Пока читали файлы, началась запись следующей сборки — загрузим её на следующей проверке
+                snapshot.metadata.close()
+                raise RuntimeError("файлы сборки изменились во время загрузки")
+            self._current = snapshot
+            logger.info(f"Индекс перезагружен: версия {version}, чанков {snapshot.index.ntotal}")
+            return True
+
+    def start_watching(self, interval: float):
+        """Фоновая проверка каталога индекса раз в interval секунд"""
+        if self._watcher is not None or interval <= 0:
+            return
+        self._stop.clear()
+        self._watcher = threading.Thread(target=self._watch, args=(interval,), name="index-watcher", daemon=True)
+        self._watcher.start()
+
+    def stop_watching(self):
+        self._stop.set()
+        if self._watcher is not None:
+            self._watcher.join(timeout=5)
+            self._watcher = None
+
+    def _watch(self, interval: float):
+        while not self._stop.wait(interval):
+            try:
+                self.reload()
+            except Exception as e:
+                # Например, сборка ещё пишет файлы — оставляем старую версию и пробуем позже
+                logger.warning(f"Не удалось перезагрузить индекс, остаётся версия {self._current.version}: {e}")
@@ -1,114 +1,531 @@
 import os
+import json
 import time
+import ssl
+import uuid
+import random
+import asyncio
+import logging
+import threading
 import requests
-from typing import Optional
+import httpx
+from requests.adapters import HTTPAdapter
+from typing import AsyncIterator, Iterable, Optional
 from dotenv import load_dotenv
+from utils.metrics import LLM_PAYLOAD_SIZE, LLM_RETRIES, stage_timer
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 # Переменные можно загрузить из .env
 GIGACHAT_AUTH_KEY = os.getenv("GIGACHAT_AUTH_KEY")  # строка вида: Basic <base64(client_id:secret)>
 assert GIGACHAT_AUTH_KEY, "Не задан GIGACHAT_AUTH_KEY"
 
-OAUTH_URL = "https://ngw.devices.sberbank.ru:9443/api/v2/oauth"
-GIGACHAT_API_URL = "https://gigachat.devices.sberbank.ru/api/v1/chat/completions"
+# Адреса переопределяются, например, для локального mock-сервера GigaChat/OAuth в тестах
+OAUTH_URL = os.getenv("GIGACHAT_OAUTH_URL", "https://ngw.devices.sberbank.ru:9443/api/v2/oauth")
+GIGACHAT_API_URL = os.getenv("GIGACHAT_API_URL", "https://gigachat.devices.sberbank.ru/api/v1/chat/completions")
+GIGACHAT_SCOPE = os.getenv("GIGACHAT_SCOPE", "GIGACHAT_API_PERS")
+GIGACHAT_MODEL = os.getenv("GIGACHAT_MODEL", "GigaChat:latest")
+# Путь к CA-бандлу (сертификаты Минцифры); по умолчанию — системные
+GIGACHAT_CA_BUNDLE = os.getenv("GIGACHAT_CA_BUNDLE")
+
+# Параметры пула соединений
+HTTP_TIMEOUT = 30
+HTTP_MAX_CONNECTIONS = int(os.getenv("GIGACHAT_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("GIGACHAT_MAX_KEEPALIVE", "20"))
+# Не больше стольких одновременных запросов к GigaChat из процесса
+MAX_CONCURRENCY = int(os.getenv("GIGACHAT_MAX_CONCURRENCY", "16"))
+# Повторы на 429/5xx и сетевых ошибках: экспоненциальная задержка с jitter
+MAX_RETRIES = int(os.getenv("GIGACHAT_MAX_RETRIES", "3"))
+BACKOFF_BASE = float(os.getenv("GIGACHAT_BACKOFF_BASE", "0.5"))  # секунды
+BACKOFF_MAX = float(os.getenv("GIGACHAT_BACKOFF_MAX", "8"))
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# Circuit breaker: после BREAKER_THRESHOLD неудач подряд запросы сразу получают ошибку BREAKER_RESET секунд
+BREAKER_THRESHOLD = int(os.getenv("GIGACHAT_BREAKER_THRESHOLD", "5"))
+BREAKER_RESET = float(os.getenv("GIGACHAT_BREAKER_RESET", "30"))
+# Токен обновляется в фоне за столько секунд до истечения
+TOKEN_REFRESH_MARGIN = float(os.getenv("GIGACHAT_TOKEN_REFRESH_MARGIN", "120"))
+TOKEN_MIN_TTL = 30  # токен, которому осталось меньше, считается истёкшим
 
 # Разрешённые домены для запросов (безопасность)
-ALLOWED_HOSTS = {
-    "ngw.devices.sberbank.ru",
-    "gigachat.devices.sberbank.ru"
-}
+ALLOWED_HOSTS = set(filter(None, os.getenv(
+    "GIGACHAT_ALLOWED_HOSTS", "ngw.devices.sberbank.ru,gigachat.devices.sberbank.ru"
+).split(",")))
 
-def validate_url(url: str) -> bool:
+def validate_url(url: str, allowed_hosts: Iterable[str] = ALLOWED_HOSTS) -> bool:
     """Проверяет, что URL принадлежит разрешённым хостам"""
     from urllib.parse import urlparse
     parsed = urlparse(url)
-    return parsed.hostname in ALLOWED_HOSTS
+    return parsed.hostname in set(allowed_hosts)
+
+# Ответы-заглушки при ошибках: их нельзя кэшировать как настоящие ответы
+ERROR_ANSWERS = {
+    "Ошибка авторизации в GigaChat.",
+    "Ошибка: недопустимый API URL",
+    "Ошибка безопасности соединения.",
+    "Ошибка генерации ответа от модели.",
+    "Сервис генерации временно недоступен.",
+    "Произошла непредвиденная ошибка.",
+}
 
-# Кэш токена
-access_token = None
-token_expiry = 0  # unixtime
+def is_error_answer(answer: str) -> bool:
+    return answer.strip() in ERROR_ANSWERS
 
-def get_access_token() -> str:
-    global access_token, token_expiry
+class GigaChatError(Exception):
+    """Ошибка обращения к GigaChat; answer — текст для пользователя (из ERROR_ANSWERS)"""
 
-    # Проверка: если токен ещё жив, возвращаем
-    if access_token and time.time() < token_expiry - 30:
-        return access_token
+    def __init__(self, answer: str, detail: str = ""):
+        super().__init__(detail or answer)
+        self.answer = answer
 
-    # Валидация URL перед запросом
-    if not validate_url(OAUTH_URL):
-        print(f"[!] Ошибка: недопустимый OAuth URL")
-        return None
+class StreamInterrupted(GigaChatError):
+    """Поток ответа оборвался после первых фрагментов: полученный текст неполный"""
+
+class CircuitBreaker:
+    """Размыкается после threshold неудач подряд; через reset_timeout пропускает один пробный запрос.
+
+    Пробный запрос, отменённый до результата, освобождает слот через release_trial(); если и этого
+    не произошло, слот считается потерянным через reset_timeout и пропускается следующий запрос.
+    """
+
+    def __init__(self, threshold: int = BREAKER_THRESHOLD, reset_timeout: float = BREAKER_RESET):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._trial_in_flight = False
+        self._trial_started = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            return "half-open" if time.monotonic() >= self._opened_at + self.reset_timeout else "open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            now = time.monotonic()
+            if now < self._opened_at + self.reset_timeout:
+                return False
+            if self._trial_in_flight and now < self._trial_started + self.reset_timeout:
+                return False
+            self._trial_in_flight = True
+            self._trial_started = now
+            return True
+
+    def release_trial(self):
+        """Пробный запрос отменён без результата — следующий запрос может стать пробным"""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial_in_flight or self._failures >= self.threshold:
+                if self._opened_at is None or self._trial_in_flight:
+                    logger.warning(f"GigaChat недоступен, запросы приостановлены на {self.reset_timeout:.0f} с")
+                self._opened_at = time.monotonic()
+                self._trial_in_flight = False
+
+def backoff_delay(attempt: int, base: float = BACKOFF_BASE, cap: float = BACKOFF_MAX,
+                  retry_after: Optional[str] = None) -> float:
+    """Задержка перед повтором: Retry-After, если сервер его прислал, иначе full jitter"""
+    if retry_after:
+        try:
+            return min(cap, float(retry_after))
+        except ValueError:
+            pass
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+def _is_retryable(exc: Exception) -> bool:
+    if isinstance(exc, (httpx.TransportError, requests.ConnectionError, requests.Timeout)):
+        return True
+    response = getattr(exc, "response", None)
+    return response is not None and response.status_code in RETRY_STATUSES
+
+class GigaChatClient:
+    """Клиент GigaChat с пулом соединений, общим токеном и защитой от сбоев.
+
+    * токен обновляется одним запросом (single-flight) и заранее, в фоне — запросы не ждут OAuth;
+    * 429/5xx и сетевые ошибки повторяются с экспоненциальной задержкой и jitter;
+    * число одновременных запросов ограничено, а при серии сбоев circuit breaker
+      сразу возвращает ошибку, не нагружая GigaChat и не держа пользователей в ожидании.
+
+    Асинхронные методы используются API, синхронные (через requests.Session) — CLI и скриптами.
+    """
+
+    def __init__(self, auth_key: str = GIGACHAT_AUTH_KEY, oauth_url: str = OAUTH_URL,
+                 api_url: str = GIGACHAT_API_URL, allowed_hosts: Iterable[str] = ALLOWED_HOSTS,
+                 scope: str = GIGACHAT_SCOPE, model: str = GIGACHAT_MODEL,
+                 max_concurrency: int = MAX_CONCURRENCY, max_retries: int = MAX_RETRIES,
+                 breaker: Optional[CircuitBreaker] = None, refresh_margin: float = TOKEN_REFRESH_MARGIN,
+                 verify=GIGACHAT_CA_BUNDLE or True):
+        self.auth_key = auth_key
+        self.oauth_url = oauth_url
+        self.api_url = api_url
+        self.allowed_hosts = set(allowed_hosts)
+        self.scope = scope
+        self.model = model
+        self.max_retries = max_retries
+        self.breaker = breaker or CircuitBreaker()
+        self.refresh_margin = refresh_margin
+        # БЕЗОПАСНОСТЬ: проверка SSL включена (True или путь к CA-бандлу)
+        self.verify = verify
+
+        self._token: Optional[str] = None
+        self._token_expiry = 0.0  # unixtime
+        self._async_token_lock = asyncio.Lock()
+        self._sync_token_lock = threading.Lock()
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._sync_semaphore = threading.BoundedSemaphore(max_concurrency)
+        self._http: Optional[httpx.AsyncClient] = None
+        self._session: Optional[requests.Session] = None
+        self._refresher: Optional[asyncio.Task] = None
+
+    # === Соединения ===
+    @property
+    def http(self) -> httpx.AsyncClient:
+        """Общий httpx.AsyncClient с пулом keep-alive соединений"""
+        if self._http is None or self._http.is_closed:
+            self._http = httpx.AsyncClient(
+                verify=self.verify,
+                timeout=HTTP_TIMEOUT,
+                limits=httpx.Limits(
+                    max_connections=HTTP_MAX_CONNECTIONS,
+                    max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+                ),
+            )
+        return self._http
+
+    @property
+    def session(self) -> requests.Session:
+        if self._session is None:
+            self._session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=2, pool_maxsize=HTTP_MAX_KEEPALIVE)
+            self._session.mount("https://", adapter)
+            self._session.mount("http://", adapter)
+        return self._session
+
+    async def aclose(self):
+        """Останавливает фоновое обновление токена и закрывает пулы соединений"""
+        if self._refresher is not None:
+            self._refresher.cancel()
+            try:
+                await self._refresher
+            except asyncio.CancelledError:
+                pass
+            self._refresher = None
+        if self._http is not None and not self._http.is_closed:
+            await self._http.aclose()
+        self._http = None
+        if self._session is not None:
+            self._session.close()
+            self._session = None
+
+    # === Токен ===
+    def _token_is_valid(self) -> bool:
+        return bool(self._token) and time.time() < self._token_expiry - TOKEN_MIN_TTL
+
+    def _oauth_request(self) -> dict:
+        if not validate_url(self.oauth_url, self.allowed_hosts):
+            raise GigaChatError("Ошибка авторизации в GigaChat.", "недопустимый OAuth URL")
+        return {
+            "headers": {
+                "Content-Type": "application/x-www-form-urlencoded",
+                "Accept": "application/json",
+                # Уникальный идентификатор каждого запроса токена
+                "RqUID": str(uuid.uuid4()),
+                "Authorization": self.auth_key,
+            },
+            "data": {"scope": self.scope},
+        }
+
+    def _store_token(self, resp_json: dict) -> str:
+        self._token = resp_json["access_token"]
+        # expires_at — в миллисекундах unixtime; expires_in — в секундах (обычно 1800)
+        if "expires_at" in resp_json:
+            self._token_expiry = int(resp_json["expires_at"]) / 1000
+        else:
+            self._token_expiry = time.time() + int(resp_json.get("expires_in", 1800))
+        return self._token
+
+    async def get_token(self, force: bool = False) -> str:
+        """Single-flight: пока один запрос получает токен, остальные ждут его результат"""
+        stale = self._token
+        if not force and self._token_is_valid():
+            return self._token
+        async with self._async_token_lock:
+            # Пока ждали блокировку, токен мог обновить другой запрос
+            if self._token_is_valid() and (not force or self._token != stale):
+                return self._token
+            with stage_timer("oauth"):
+                response = await self._send_async("POST", self.oauth_url, **self._oauth_request())
+            token = self._store_token(response.json())
+        self._ensure_refresher()
+        return token
+
+    def get_token_sync(self, force: bool = False) -> str:
+        stale = self._token
+        if not force and self._token_is_valid():
+            return self._token
+        with self._sync_token_lock:
+            if self._token_is_valid() and (not force or self._token != stale):
+                return self._token
+            with stage_timer("oauth"):
+                response = self._send_sync("POST", self.oauth_url, **self._oauth_request())
+            return self._store_token(response.json())
 
-    headers = {
-        "Content-Type": "application/x-www-form-urlencoded",
-        "Accept": "application/json",
-        "RqUID": 'cb4becfd-9369-42eb-9f2d-0e9c46a01f5f',
-        "Authorization": GIGACHAT_AUTH_KEY
-    }
-    data = {"scope": "GIGACHAT_API_PERS"}
+    def _ensure_refresher(self):
+        if self._refresher is None or self._refresher.done():
+            self._refresher = asyncio.get_running_loop().create_task(self._refresh_loop())
 
+    async def _refresh_loop(self):
+        """Обновляет токен за refresh_margin секунд до истечения"""
+        while True:
+            await asyncio.sleep(max(5.0, self._token_expiry - self.refresh_margin - time.time()))
+            try:
+                await self.get_token(force=True)
+            except Exception as e:
+                # Не страшно: запрос обновит токен сам, когда старый истечёт
+                logger.warning(f"Не удалось заранее обновить токен GigaChat: {e}")
+
+    # === Повторы и circuit breaker ===
+    def _check_breaker(self):
+        if not self.breaker.allow():
+            raise GigaChatError("Сервис генерации временно недоступен.", "circuit breaker разомкнут")
+
+    def _retry_or_raise(self, exc: Exception, attempt: int) -> float:
+        """Учитывает неудачу; возвращает задержку перед повтором или пробрасывает исключение"""
+        retryable = _is_retryable(exc)
+        if retryable:
+            self.breaker.record_failure()
+        else:
+            # Ответ 4xx: сервис жив, ошибка в самом запросе
+            self.breaker.record_success()
+        if not retryable or attempt >= self.max_retries:
+            raise exc
+        response = getattr(exc, "response", None)
+        reason = str(response.status_code) if response is not None else "network"
+        LLM_RETRIES.labels(reason=reason).inc()
+        return backoff_delay(attempt, retry_after=response.headers.get("Retry-After") if response is not None else None)
+
+    async def _send_async(self, method: str, url: str, **kwargs) -> httpx.Response:
+        for attempt in range(self.max_retries + 1):
+            self._check_breaker()
+            try:
+                async with self._semaphore:
+                    response = await self.http.request(method, url, **kwargs)
+                response.raise_for_status()
+                self.breaker.record_success()
+                return response
+            except httpx.HTTPError as e:
+                delay = self._retry_or_raise(e, attempt)
+            except BaseException:
+                # Отмена (клиент отключился, wait_for, остановка) — исход неизвестен, пробный слот свободен
+                self.breaker.release_trial()
+                raise
+            await asyncio.sleep(delay)
+
+    def _send_sync(self, method: str, url: str, **kwargs) -> requests.Response:
+        for attempt in range(self.max_retries + 1):
+            self._check_breaker()
+            try:
+                with self._sync_semaphore:
+                    response = self.session.request(method, url, verify=self.verify, timeout=HTTP_TIMEOUT, **kwargs)
+                response.raise_for_status()
+                self.breaker.record_success()
+                return response
+            except requests.RequestException as e:
+                delay = self._retry_or_raise(e, attempt)
+            except BaseException:
+                self.breaker.release_trial()
+                raise
+            time.sleep(delay)
+
+    # === Генерация ===
+    def _build_payload(self, query: str, context: str, stream: bool = False) -> dict:
+        messages = [
+            {"role": "system", "content": 'Ты сотрудник ООО "СФН", помощник по инвестициям.'
+                                          'Отвечай достаточно подробно, точно, немного формально, по делу, не забывая упоминать о преимуществах твоей компании.'},
+            {"role": "user", "content": f"Контекст:\n{context}\n\nВопрос: {query}"}
+        ]
+
+        return {
+            "model": self.model,
+            "messages": messages,
+            "temperature": 0.3,
+            "max_tokens": 1000,
+            "stream": stream
+        }
+
+    def _api_headers(self, token: str, stream: bool = False) -> dict:
+        if not validate_url(self.api_url, self.allowed_hosts):
+            raise GigaChatError("Ошибка: недопустимый API URL")
+        headers = {
+            "Authorization": f"Bearer {token}",
+            "Content-Type": "application/json",
+        }
+        if stream:
+            headers["Accept"] = "text/event-stream"
+        return headers
+
+    async def complete(self, query: str, context: str) -> str:
+        """Ответ модели; при 401 токен обновляется и запрос повторяется один раз"""
+        payload = self._build_payload(query, context)
+        for refreshed in (False, True):
+            token = await self.get_token(force=refreshed)
+            try:
+                response = await self._send_async("POST", self.api_url, headers=self._api_headers(token), json=payload)
+                break
+            except httpx.HTTPStatusError as e:
+                if e.response.status_code != 401 or refreshed:
+                    raise
+        LLM_PAYLOAD_SIZE.labels(direction="request").observe(len(response.request.content))
+        LLM_PAYLOAD_SIZE.labels(direction="response").observe(len(response.content))
+        return response.json()["choices"][0]["message"]["content"].strip()
+
+    def complete_sync(self, query: str, context: str) -> str:
+        payload = self._build_payload(query, context)
+        for refreshed in (False, True):
+            token = self.get_token_sync(force=refreshed)
+            try:
+                response = self._send_sync("POST", self.api_url, headers=self._api_headers(token), json=payload)
+                break
+            except requests.HTTPError as e:
+                if e.response.status_code != 401 or refreshed:
+                    raise
+        LLM_PAYLOAD_SIZE.labels(direction="request").observe(len(response.request.body or b""))
+        LLM_PAYLOAD_SIZE.labels(direction="response").observe(len(response.content))
+        return response.json()["choices"][0]["message"]["content"].strip()
+
+    async def stream(self, query: str, context: str) -> AsyncIterator[str]:
+        """Потоковая генерация (stream: true): фрагменты ответа по мере прихода по SSE.
+
+        Повторяется только установка соединения: после первого фрагмента ответ не перезапрашивается,
+        а ошибка пробрасывается — иначе уже отданный текст пришёл бы повторно.
+        """
+        payload = self._build_payload(query, context, stream=True)
+        token = await self.get_token()
+        refreshed = produced = False
+        attempt = 0
+        while True:
+            self._check_breaker()
+            try:
+                async with self._semaphore:
+                    async with self.http.stream(
+                        "POST", self.api_url, headers=self._api_headers(token, stream=True), json=payload
+                    ) as response:
+                        LLM_PAYLOAD_SIZE.labels(direction="request").observe(len(response.request.content))
+                        # 401 — токен отозван раньше срока: сервис жив, обновляем токен ниже и повторяем запрос
+                        if response.status_code == 401 and not refreshed:
+                            self.breaker.record_success()
+                        else:
+                            response.raise_for_status()
+                            self.breaker.record_success()
+                            async for line in response.aiter_lines():
+                                if not line.startswith("data:"):
+                                    continue
+                                data = line[len("data:"):].strip()
+                                if data == "[DONE]":
+                                    return
+                                delta = json.loads(data)["choices"][0].get("delta", {}).get("content")
+                                if delta:
+                                    produced = True
+                                    yield delta
+                            return
+            except httpx.HTTPError as e:
+                if produced:
+                    if _is_retryable(e):
+                        self.breaker.record_failure()
+                    raise
+                delay = self._retry_or_raise(e, attempt)
+                attempt += 1
+                await asyncio.sleep(delay)
+                continue
+            except BaseException:
+                # Отмена или GeneratorExit (потребитель бросил поток) — пробный слот не должен остаться занятым
+                self.breaker.release_trial()
+                raise
+            # Токен обновляется вне семафора: OAuth-запросу тоже нужен слот, и при max_concurrency
+            # одновременных 401 все слоты были бы заняты ожидающими обновления
+            refreshed = True
+            token = await self.get_token(force=True)
+
+def _error_answer(e: Exception) -> str:
+    """Текст ошибки для пользователя (из ERROR_ANSWERS) с записью причины в лог"""
+    if isinstance(e, GigaChatError):
+        logger.error(f"GigaChat: {e}")
+        return e.answer
+    if isinstance(e, requests.exceptions.SSLError) or isinstance(e.__context__, ssl.SSLError):
+        logger.error(f"Ошибка SSL сертификата: {e}")
+        return "Ошибка безопасности соединения."
+    if isinstance(e, (httpx.HTTPError, requests.RequestException)):
+        logger.error(f"Ошибка запроса к GigaChat: {e}")
+        return "Ошибка генерации ответа от модели."
+    logger.exception(f"Неожиданная ошибка: {e}")
+    return "Произошла непредвиденная ошибка."
+
+# === Общий клиент процесса и функции-обёртки ===
+_client: Optional[GigaChatClient] = None
+
+def get_client() -> GigaChatClient:
+    global _client
+    if _client is None:
+        _client = GigaChatClient()
+    return _client
+
+async def close_async_client():
+    """Закрывает пул соединений (вызывается при остановке приложения)"""
+    if _client is not None:
+        await _client.aclose()
+
+def get_access_token() -> Optional[str]:
     try:
-        # БЕЗОПАСНОСТЬ: включена проверка SSL
-        response = requests.request("POST", OAUTH_URL, headers=headers, data=data, verify=True, timeout=30)
-        response.raise_for_status()
-        resp_json = response.json()
-
-        access_token = resp_json["access_token"]
-        expires_in = int(resp_json.get("expires_in", 1800))  # обычно 1800 сек
-        token_expiry = time.time() + expires_in
-
-        return access_token
-    except requests.exceptions.SSLError as e:
-        print(f"[!] Ошибка SSL сертификата: {e}")
-        return None
-    except requests.exceptions.RequestException as e:
-        print(f"[!] Ошибка получения токена: {e}")
+        return get_client().get_token_sync()
+    except Exception as e:
+        _error_answer(e)
         return None
+
+async def get_access_token_async() -> Optional[str]:
+    try:
+        return await get_client().get_token()
     except Exception as e:
-        print(f"[!] Неожиданная ошибка: {e}")
+        _error_answer(e)
         return None
 
 def generate_answer_with_gigachat(query: str, context: str) -> str:
-    token = get_access_token()
-    if not token:
-        return "Ошибка авторизации в GigaChat."
-
-    # Валидация URL перед запросом
-    if not validate_url(GIGACHAT_API_URL):
-        return "Ошибка: недопустимый API URL"
-
-    headers = {
-        "Authorization": f"Bearer {token}",
-        "Content-Type": "application/json",
-    }
-
-    messages = [
-        {"role": "system", "content": 'Ты сотрудник ООО "СФН", помощник по инвестициям.'
-                                      'Отвечай достаточно подробно, точно, немного формально, по делу, не забывая упоминать о преимуществах твоей компании.'},
-        {"role": "user", "content": f"Контекст:\n{context}\n\nВопрос: {query}"}
-    ]
-
-    payload = {
-        "model": "GigaChat:latest",
-        "messages": messages,
-        "temperature": 0.3,
-        "max_tokens": 1000
-    }
+    try:
+        return get_client().complete_sync(query, context)
+    except Exception as e:
+        return _error_answer(e)
 
+async def generate_answer_with_gigachat_async(query: str, context: str) -> str:
+    """Асинхронный аналог generate_answer_with_gigachat, не блокирует event loop"""
     try:
-        # БЕЗОПАСНОСТЬ: включена проверка SSL
-        response = requests.post(GIGACHAT_API_URL, headers=headers, json=payload, verify=True, timeout=30)
-        response.raise_for_status()
-        result = response.json()
-        return result["choices"][0]["message"]["content"].strip()
-    except requests.exceptions.SSLError as e:
-        print(f"[!] Ошибка SSL сертификата: {e}")
-        return "Ошибка безопасности соединения."
-    except requests.exceptions.RequestException as e:
-        print(f"[!] Ошибка запроса к GigaChat: {e}")
-        return "Ошибка генерации ответа от модели."
+        return await get_client().complete(query, context)
     except Exception as e:
-        print(f"[!] Неожиданная ошибка: {e}")
-        return "Произошла непредвиденная ошибка."
+        return _error_answer(e)
 
+async def stream_answer_with_gigachat_async(query: str, context: str) -> AsyncIterator[str]:
+    """Потоковая генерация. При ошибке до первого фрагмента отдаёт одну из ERROR_ANSWERS,
+    после — бросает StreamInterrupted: обрывок ответа нельзя принимать за полный"""
+    produced = False
+    try:
+        async for delta in get_client().stream(query, context):
+            produced = True
+            yield delta
+    except Exception as e:
+        answer = _error_answer(e)
+        if produced:
+            raise StreamInterrupted(answer, f"поток ответа оборвался: {e}") from e
+        yield answer
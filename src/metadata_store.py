@@ -0,0 +1,86 @@
+"""
+Компактное хранение метаданных чанков.
+
+metadata.jsonl остаётся UTF-8 блобом (одна JSON-запись на строку), рядом лежит
+таблица смещений metadata.offsets.npy: int64-массив (n, 3) из строк [id, offset, length],
+отсортированный по id. Оба файла отображаются в память (mmap), поэтому воркеры делят
+страницы через page cache, а JSON разбирается только для найденных top-k чанков.
+"""
+
+import json
+import logging
+import mmap
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+def offsets_path(metadata_path: Path) -> Path:
+    return metadata_path.with_name(metadata_path.stem + ".offsets.npy")
+
+def build_offsets(ids: List[int], lines: List[bytes]) -> np.ndarray:
+    """Таблица [id, offset, length] для строк в порядке записи в файл"""
+    table = np.empty((len(lines), 3), dtype=np.int64)
+    offset = 0
+    for row, (chunk_id, line) in enumerate(zip(ids, lines)):
+        table[row] = (chunk_id, offset, len(line))
+        offset += len(line)
+    return table[np.argsort(table[:, 0], kind="stable")]
+
+class MetadataStore:
+    """Ленивый доступ к записям metadata.jsonl по ID чанка"""
+
+    def __init__(self, metadata_path: Path):
+        self.path = Path(metadata_path)
+        self._file = open(self.path, "rb")
+        size = self.path.stat().st_size
+        self._data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+
+        table_path = offsets_path(self.path)
+        if table_path.exists():
+            self._table = np.load(table_path, mmap_mode="r")
+        else:
+            logger.warning(f"Нет таблицы смещений {table_path}, строим её сканированием {self.path}")
+            self._table = self._scan()
+
+        self._ids = self._table[:, 0]
+        if len(self._table) and int((self._table[:, 1] + self._table[:, 2]).max()) > size:
+            raise ValueError(f"Таблица смещений не соответствует {self.path}")
+
+    def _scan(self) -> np.ndarray:
+        """Медленный путь для метаданных старого формата: ID — из записи или позиция строки"""
+        ids, lines = [], []
+        for position, line in enumerate(iter(self._data.readline, b"") if self._data else []):
+            ids.append(json.loads(line).get("id", position))
+            lines.append(line)
+        return build_offsets(ids, lines)
+
+    def __len__(self) -> int:
+        return len(self._table)
+
+    def __contains__(self, chunk_id: int) -> bool:
+        return self._position(chunk_id) is not None
+
+    def _position(self, chunk_id: int) -> Optional[int]:
+        pos = int(np.searchsorted(self._ids, chunk_id))
+        if pos < len(self._ids) and int(self._ids[pos]) == chunk_id:
+            return pos
+        return None
+
+    def get(self, chunk_id: int) -> Optional[Dict]:
+        pos = self._position(chunk_id)
+        if pos is None:
+            return None
+        _, offset, length = (int(v) for v in self._table[pos])
+        return json.loads(self._data[offset:offset + length])
+
+    def __iter__(self) -> Iterator[Dict]:
+        for chunk_id in self._ids:
+            yield self.get(int(chunk_id))
+
+    def close(self):
+        if isinstance(self._data, mmap.mmap):
+            self._data.close()
+        self._file.close()
@@ -1,56 +1,415 @@
-import faiss
-import json
+import asyncio
+import os
+import logging
+import time
 import numpy as np
-from sentence_transformers import SentenceTransformer
-from typing import List, Dict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, List, Dict, Optional, Tuple
 from pathlib import Path
-from llm_client_gigachat import generate_answer_with_gigachat
+from answer_cache import AnswerCache, normalize_query
+from embedding_batcher import EmbeddingBatcher
+from embedding_backends import EMBED_BACKEND, load_embedder
+from index_manager import IndexManager, IndexSnapshot
+from sparse_index import reciprocal_rank_fusion
+from reranker import Reranker
+from context_packer import ContextPacker, format_sources
+from single_flight import SingleFlight
+from utils.metrics import (
+    CACHE_LOOKUPS, COALESCED_REQUESTS, INDEX_CHUNKS, LLM_ERRORS, PROMPT_TOKENS, observe_stage, stage_timer,
+)
+from llm_client_gigachat import (
+    generate_answer_with_gigachat,
+    generate_answer_with_gigachat_async,
+    stream_answer_with_gigachat_async,
+    close_async_client,
+    is_error_answer,
+    StreamInterrupted,
+)
+
+logger = logging.getLogger(__name__)
 
 # === CONFIG ===
 INDEX_PATH = Path("data/index/faiss.index")
 METADATA_PATH = Path("data/index/metadata.jsonl")
+BM25_PATH = Path("data/index/bm25.npz")
 EMBED_MODEL_NAME = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
 TOP_K = 5
+# Число потоков для поиска в FAISS (index.search отпускает GIL)
+RAG_EXECUTOR_WORKERS = int(os.getenv("RAG_EXECUTOR_WORKERS", "4"))
+# Микробатчинг эмбеддингов запросов
+EMBED_BATCH_MAX_SIZE = int(os.getenv("EMBED_BATCH_MAX_SIZE", "32"))
+EMBED_BATCH_MAX_WAIT_MS = float(os.getenv("EMBED_BATCH_MAX_WAIT_MS", "5"))
+# Отображать индекс в память вместо чтения в RAM (общие страницы между воркерами)
+INDEX_MMAP = os.getenv("INDEX_MMAP", "1") == "1"
+# Параметры поиска для ANN-индексов (IVF — nprobe, HNSW — efSearch); 0 — значение по умолчанию
+FAISS_NPROBE = int(os.getenv("FAISS_NPROBE", "0"))
+FAISS_EF_SEARCH = int(os.getenv("FAISS_EF_SEARCH", "0"))
+# Период проверки каталога индекса на новую сборку, секунды (0 — только ручная перезагрузка)
+INDEX_WATCH_INTERVAL = float(os.getenv("INDEX_WATCH_INTERVAL", "0"))
+# Гибридный поиск: BM25 + векторный, слияние через reciprocal rank fusion
+HYBRID_SEARCH = os.getenv("HYBRID_SEARCH", "1") == "1"
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "20"))  # кандидатов из каждого поиска
+RRF_K = int(os.getenv("RRF_K", "60"))
+# Реранкинг cross-encoder'ом (опционально): из RERANK_CANDIDATES кандидатов в промпт попадают
+# лучшие TOP_K, укладывающиеся в RERANK_TOKEN_BUDGET; при превышении RERANK_BUDGET_MS — порядок поиска
+RERANK_ENABLED = os.getenv("RERANK_ENABLED", "0") == "1"
+RERANK_MODEL_NAME = os.getenv("RERANK_MODEL", "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1")
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "50"))
+RERANK_BATCH_SIZE = int(os.getenv("RERANK_BATCH_SIZE", "16"))
+RERANK_BUDGET_MS = float(os.getenv("RERANK_BUDGET_MS", "300"))
+RERANK_TOKEN_BUDGET = int(os.getenv("RERANK_TOKEN_BUDGET", "1500"))
+RERANK_BACKEND = os.getenv("RERANK_BACKEND", "torch")  # torch | onnx
+RERANK_QUANTIZE = os.getenv("RERANK_QUANTIZE", "0") == "1"
+RERANK_ONNX_FILE = os.getenv("RERANK_ONNX_FILE", "")
+# Упаковка контекста: из до PROMPT_MAX_CHUNKS чанков берутся релевантные вопросу предложения
+# без повторов, пока контекст укладывается в PROMPT_TOKEN_BUDGET токенов
+PROMPT_PACKING = os.getenv("PROMPT_PACKING", "1") == "1"
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "1200"))
+PROMPT_MAX_CHUNKS = int(os.getenv("PROMPT_MAX_CHUNKS", "10"))
+PROMPT_MAX_SENTENCES_PER_CHUNK = int(os.getenv("PROMPT_MAX_SENTENCES_PER_CHUNK", "4"))
+# Одновременные одинаковые вопросы (после нормализации, в одной версии индекса) выполняются один раз
+SINGLE_FLIGHT_ENABLED = os.getenv("SINGLE_FLIGHT_ENABLED", "1") == "1"
+# Кэш ответов
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "1") == "1"
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "1000"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "3600"))  # секунды
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.95"))  # косинусная близость
 
 # === ЗАГРУЗКА МОДЕЛИ И ИНДЕКСА ===
-model = SentenceTransformer(EMBED_MODEL_NAME)
-index = faiss.read_index(str(INDEX_PATH))
+# Бэкенд (torch | onnx) — переменная EMBED_BACKEND; должен совпадать с тем, которым собран индекс
+model = load_embedder(EMBED_BACKEND, EMBED_MODEL_NAME)
+
+# Индекс и метаданные (ключ — стабильный ID чанка, чтение ленивое через mmap)
+# живут в IndexManager и подменяются целиком при появлении новой сборки
+index_manager = IndexManager(
+    INDEX_PATH,
+    METADATA_PATH,
+    use_mmap=INDEX_MMAP,
+    nprobe=FAISS_NPROBE,
+    ef_search=FAISS_EF_SEARCH,
+    sparse_path=BM25_PATH if HYBRID_SEARCH else None,
+)
+
+embedder = EmbeddingBatcher(model, max_batch_size=EMBED_BATCH_MAX_SIZE, max_wait_ms=EMBED_BATCH_MAX_WAIT_MS)
+
+reranker = Reranker(
+    RERANK_MODEL_NAME,
+    batch_size=RERANK_BATCH_SIZE,
+    backend=RERANK_BACKEND,
+    quantize=RERANK_QUANTIZE,
+    onnx_file=RERANK_ONNX_FILE,
+) if RERANK_ENABLED else None
+
+def count_tokens(text: str) -> int:
+    """Число токенов по токенизатору модели эмбеддингов (локальная оценка размера промпта)"""
+    return len(model.tokenizer.encode(text, add_special_tokens=False))
+
+context_packer = ContextPacker(
+    count_tokens,
+    token_budget=PROMPT_TOKEN_BUDGET,
+    max_sentences_per_chunk=PROMPT_MAX_SENTENCES_PER_CHUNK,
+) if PROMPT_PACKING else None
 
-with open(METADATA_PATH, "r", encoding="utf-8") as f:
-    metadata = [json.loads(line) for line in f]
+# Ограниченный пул для CPU-нагрузки, чтобы не блокировать event loop
+executor = ThreadPoolExecutor(max_workers=RAG_EXECUTOR_WORKERS, thread_name_prefix="rag")
 
-assert len(metadata) == index.ntotal, "Несовпадение количества чанков и метаданных"
+answer_cache = AnswerCache(
+    dim=model.get_sentence_embedding_dimension(),
+    max_entries=ANSWER_CACHE_SIZE,
+    ttl_seconds=ANSWER_CACHE_TTL,
+    similarity_threshold=ANSWER_CACHE_SIMILARITY,
+) if ANSWER_CACHE_ENABLED else None
 
 # === ПОИСК ===
-def retrieve_relevant_chunks(query: str, top_k: int = TOP_K) -> List[Dict]:
-    query_vec = model.encode([query], convert_to_numpy=True)
-    distances, indices = index.search(query_vec, top_k)
+def _timed(fn, *args) -> Tuple[object, float]:
+    started = time.perf_counter()
+    result = fn(*args)
+    return result, (time.perf_counter() - started) * 1000
+
+def dense_search(snapshot: IndexSnapshot, query_vec: np.ndarray, n: int) -> List[int]:
+    distances, indices = snapshot.index.search(query_vec.reshape(1, -1), n)
+    return [int(idx) for idx in indices[0] if idx >= 0]
+
+def sparse_search(snapshot: IndexSnapshot, query: str, n: int) -> List[int]:
+    return [chunk_id for chunk_id, _ in snapshot.sparse.search(query, n)]
+
+def _use_sparse(snapshot: IndexSnapshot, query: Optional[str]) -> bool:
+    return query is not None and snapshot.sparse is not None
+
+def _fuse(snapshot: IndexSnapshot, dense_ids: List[int], sparse_ids: Optional[List[int]], top_k: int,
+          timings: Optional[Dict]) -> List[Dict]:
+    started = time.perf_counter()
+    if sparse_ids is None:
+        ids = dense_ids[:top_k]
+    else:
+        ids = reciprocal_rank_fusion([dense_ids, sparse_ids], top_k, RRF_K)
 
     chunks = []
-    for idx in indices[0]:
-        if idx < len(metadata):
-            chunks.append(metadata[idx])
+    for chunk_id in ids:
+        chunk = snapshot.metadata.get(chunk_id)
+        if chunk is not None:
+            chunks.append(chunk)
+    if timings is not None:
+        timings["fuse"] = (time.perf_counter() - started) * 1000
     return chunks
 
-def build_prompt(query: str, chunks: List[Dict]) -> str:
-    context = "\n".join([f"- {ch['chunk_text']}" for ch in chunks])
-    return query, context
+def search_chunks(query_vec: np.ndarray, top_k: int = TOP_K, snapshot: IndexSnapshot = None,
+                  query: Optional[str] = None, timings: Optional[Dict] = None) -> List[Dict]:
+    """Векторный поиск; если передан текст запроса и есть BM25 — параллельно с ним и RRF-слиянием"""
+    snapshot = snapshot or index_manager.current
+    if not _use_sparse(snapshot, query):
+        dense_ids, dense_ms = _timed(dense_search, snapshot, query_vec, top_k)
+        sparse_ids, sparse_ms = None, 0.0
+    else:
+        n = max(top_k, HYBRID_CANDIDATES)
+        sparse_future = executor.submit(_timed, sparse_search, snapshot, query, n)
+        dense_ids, dense_ms = _timed(dense_search, snapshot, query_vec, n)
+        sparse_ids, sparse_ms = sparse_future.result()
 
-def answer_query(query: str) -> Dict:
-    chunks = retrieve_relevant_chunks(query)
-    query, context = build_prompt(query, chunks)
-    output = generate_answer_with_gigachat(query, context)
+    if timings is not None:
+        timings.update(dense=dense_ms, sparse=sparse_ms)
+    return _fuse(snapshot, dense_ids, sparse_ids, top_k, timings)
 
+async def search_chunks_async(query: str, query_vec: np.ndarray, top_k: int = TOP_K,
+                              snapshot: IndexSnapshot = None, timings: Optional[Dict] = None) -> List[Dict]:
+    """Асинхронный search_chunks: FAISS и BM25 выполняются одновременно в пуле потоков"""
+    snapshot = snapshot or index_manager.current
+    loop = asyncio.get_running_loop()
+    if not _use_sparse(snapshot, query):
+        dense_ids, dense_ms = await loop.run_in_executor(executor, _timed, dense_search, snapshot, query_vec, top_k)
+        sparse_ids, sparse_ms = None, 0.0
+    else:
+        n = max(top_k, HYBRID_CANDIDATES)
+        (dense_ids, dense_ms), (sparse_ids, sparse_ms) = await asyncio.gather(
+            loop.run_in_executor(executor, _timed, dense_search, snapshot, query_vec, n),
+            loop.run_in_executor(executor, _timed, sparse_search, snapshot, query, n),
+        )
+
+    if timings is not None:
+        timings.update(dense=dense_ms, sparse=sparse_ms)
+    return _fuse(snapshot, dense_ids, sparse_ids, top_k, timings)
+
+def select_chunks(query: str, candidates: List[Dict], timings: Optional[Dict] = None) -> List[Dict]:
+    """Отбор чанков для промпта: реранкинг (если включён) с бюджетом времени и токенов"""
+    ranked = candidates
+    if reranker is not None:
+        started = time.perf_counter()
+        ranked, _ = reranker.rerank(query, candidates, RERANK_BUDGET_MS)
+        if timings is not None:
+            timings["rerank"] = (time.perf_counter() - started) * 1000
+    if context_packer is not None:
+        # Бюджет токенов соблюдает упаковщик контекста
+        return ranked[:PROMPT_MAX_CHUNKS]
+    if reranker is not None:
+        return reranker.select_within_budget(ranked, TOP_K, RERANK_TOKEN_BUDGET)
+    return ranked[:TOP_K]
+
+def _candidates_k() -> int:
+    k = TOP_K
+    if context_packer is not None:
+        k = max(k, PROMPT_MAX_CHUNKS)
+    if reranker is not None:
+        k = max(k, RERANK_CANDIDATES)
+    return k
+
+def _log_timings(timings: Dict):
+    logger.info("Этапы поиска, мс: " + ", ".join(f"{stage}={ms:.1f}" for stage, ms in timings.items()))
+    for stage, ms in timings.items():
+        observe_stage(stage, ms / 1000)
+
+def retrieve_relevant_chunks(query: str, top_k: int = TOP_K) -> List[Dict]:
+    query_vec = embedder.encode(query)
+    return search_chunks(query_vec, top_k, query=query)
+
+async def retrieve_relevant_chunks_async(query: str, top_k: int = TOP_K) -> List[Dict]:
+    """Эмбеддинг идёт через батчер, поиск в FAISS и BM25 — в пуле потоков"""
+    query_vec = await embedder.encode_async(query)
+    return await search_chunks_async(query, query_vec, top_k)
+
+def build_prompt(query: str, chunks: List[Dict]) -> Tuple[str, str, List[Dict]]:
+    """Вопрос, контекст и чанки, реально попавшие в контекст (по ним формируются источники)"""
+    if context_packer is None:
+        context = "\n".join([f"- {ch['chunk_text']}" for ch in chunks])
+        return query, context, chunks
+    with stage_timer("prompt"):
+        packed = context_packer.pack(query, chunks)
+    PROMPT_TOKENS.observe(count_tokens(query) + packed.tokens)
+    logger.info(f"Промпт: {count_tokens(query) + packed.tokens} токенов "
+                f"(контекст {packed.tokens}/{PROMPT_TOKEN_BUDGET}), чанков {len(packed.chunks)}/{len(chunks)}")
+    return query, packed.context, packed.chunks
+
+def format_result(output: str, chunks: List[Dict]) -> Dict:
     return {
         "answer": output.strip(),
-        "sources": [
-            {
-                "url": chunk["source_url"],
-                "timestamp": chunk["timestamp"]
-            } for chunk in chunks
-        ]
+        "sources": format_sources(chunks)
     }
 
+def _cache_result(query: str, query_vec: np.ndarray, output: str, result: Dict, version: str):
+    if is_error_answer(output):
+        LLM_ERRORS.inc()
+        return
+    if answer_cache is not None:
+        answer_cache.put(query, query_vec, result, version)
+
+def _lookup_exact(query: str, version: str) -> Optional[Dict]:
+    if answer_cache is None:
+        return None
+    cached = answer_cache.get_exact(query, version)
+    if cached is not None:
+        CACHE_LOOKUPS.labels(result="exact_hit").inc()
+    return cached
+
+def _lookup_semantic(query_vec: np.ndarray, version: str) -> Optional[Dict]:
+    if answer_cache is None:
+        return None
+    cached = answer_cache.get_semantic(query_vec, version)
+    CACHE_LOOKUPS.labels(result="semantic_hit" if cached is not None else "miss").inc()
+    return cached
+
+def answer_query(query: str) -> Dict:
+    # Один snapshot на весь запрос: перезагрузка индекса его не затронет
+    snapshot = index_manager.current
+    INDEX_CHUNKS.set(snapshot.index.ntotal)
+    cached = _lookup_exact(query, snapshot.version)
+    if cached is not None:
+        return cached
+
+    timings = {}
+    started = time.perf_counter()
+    query_vec = embedder.encode(query)
+    timings["embed"] = (time.perf_counter() - started) * 1000
+    cached = _lookup_semantic(query_vec, snapshot.version)
+    if cached is not None:
+        return cached
+
+    candidates = search_chunks(query_vec, _candidates_k(), snapshot, query=query, timings=timings)
+    chunks = select_chunks(query, candidates, timings)
+    _log_timings(timings)
+    prompt_query, context, chunks = build_prompt(query, chunks)
+    with stage_timer("llm"):
+        output = generate_answer_with_gigachat(prompt_query, context)
+    result = format_result(output, chunks)
+    _cache_result(query, query_vec, output, result, snapshot.version)
+    return result
+
+@dataclass
+class PreparedPrompt:
+    """Всё, что нужно для вызова LLM и последующего кэширования ответа"""
+    version: str
+    query_vec: np.ndarray
+    query: str
+    context: str
+    chunks: List[Dict]
+
+async def _prepare_async(query: str) -> Tuple[Optional[Dict], Optional[PreparedPrompt]]:
+    """Кэш, эмбеддинг, поиск и сборка промпта. Возвращает (ответ из кэша, None) или (None, промпт)"""
+    snapshot = index_manager.current
+    INDEX_CHUNKS.set(snapshot.index.ntotal)
+    cached = _lookup_exact(query, snapshot.version)
+    if cached is not None:
+        return cached, None
+
+    timings = {}
+    started = time.perf_counter()
+    query_vec = await embedder.encode_async(query)
+    timings["embed"] = (time.perf_counter() - started) * 1000
+    cached = _lookup_semantic(query_vec, snapshot.version)
+    if cached is not None:
+        return cached, None
+
+    candidates = await search_chunks_async(query, query_vec, _candidates_k(), snapshot, timings)
+    loop = asyncio.get_running_loop()
+    chunks = await loop.run_in_executor(executor, select_chunks, query, candidates, timings)
+    _log_timings(timings)
+    prompt_query, context, chunks = await loop.run_in_executor(executor, build_prompt, query, chunks)
+    return None, PreparedPrompt(snapshot.version, query_vec, prompt_query, context, chunks)
+
+single_flight = SingleFlight(
+    on_coalesced=lambda mode: COALESCED_REQUESTS.labels(mode=mode).inc()
+) if SINGLE_FLIGHT_ENABLED else None
+
+def _flight_key(query: str) -> Tuple[str, str]:
+    return normalize_query(query), index_manager.current.version
+
+async def answer_query_async(query: str) -> Dict:
+    """Неблокирующая версия answer_query для async-обработчиков"""
+    if single_flight is None:
+        return await _answer_query_async(query)
+    return await single_flight.do(_flight_key(query), lambda: _answer_query_async(query))
+
+async def stream_answer_query_async(query: str) -> AsyncIterator[Tuple[str, Any]]:
+    """Потоковый ответ: события ("sources", [...]), затем ("token", str)..., и ("done", result).
+
+    Источники известны до обращения к LLM, поэтому отправляются первыми. Одинаковые вопросы,
+    пришедшие во время генерации, подключаются к тому же потоку и получают его с начала.
+    """
+    events = (
+        _stream_answer_query_async(query) if single_flight is None
+        else single_flight.stream(_flight_key(query), lambda: _stream_answer_query_async(query))
+    )
+    async for event in events:
+        yield event
+
+async def _answer_query_async(query: str) -> Dict:
+    cached, prepared = await _prepare_async(query)
+    if cached is not None:
+        return cached
+
+    with stage_timer("llm"):
+        output = await generate_answer_with_gigachat_async(prepared.query, prepared.context)
+    result = format_result(output, prepared.chunks)
+    _cache_result(query, prepared.query_vec, output, result, prepared.version)
+    return result
+
+async def _stream_answer_query_async(query: str) -> AsyncIterator[Tuple[str, Any]]:
+    cached, prepared = await _prepare_async(query)
+    if cached is not None:
+        yield "sources", cached["sources"]
+        yield "token", cached["answer"]
+        yield "done", cached
+        return
+
+    yield "sources", format_result("", prepared.chunks)["sources"]
+    started = time.perf_counter()
+    parts = []
+    complete = True
+    try:
+        async for delta in stream_answer_with_gigachat_async(prepared.query, prepared.context):
+            if not parts:
+                first_token = time.perf_counter() - started
+                observe_stage("llm_first_token", first_token)
+                logger.info(f"Время до первого токена LLM: {first_token * 1000:.1f} мс")
+            parts.append(delta)
+            yield "token", delta
+    except StreamInterrupted:
+        # Пользователь получает то, что успело прийти, но обрывок не кэшируется
+        complete = False
+
+    observe_stage("llm", time.perf_counter() - started)
+    output = "".join(parts)
+    result = format_result(output, prepared.chunks)
+    if complete:
+        _cache_result(query, prepared.query_vec, output, result, prepared.version)
+    else:
+        LLM_ERRORS.inc()
+    yield "done", result
+
+async def reload_index(force: bool = False) -> bool:
+    """Перезагрузка индекса в пуле потоков (чтение файлов не блокирует event loop)"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, index_manager.reload, force)
+
+def start_background_tasks():
+    index_manager.start_watching(INDEX_WATCH_INTERVAL)
+
+async def shutdown():
+    """Освобождает батчер, пул потоков и HTTP-соединения"""
+    index_manager.stop_watching()
+    await close_async_client()
+    embedder.close()
+    executor.shutdown(wait=False)
+
 if __name__ == "__main__":
     q = "Что такое инвестиционный пай?"
     result = answer_query(q)
@@ -58,4 +417,4 @@ if __name__ == "__main__":
     print("Ответ:", result["answer"])
     print("Источники:")
     for src in result["sources"]:
-        print(f" - {src['url']}")
\ No newline at end of file
+        print(f" - {src['url']}")
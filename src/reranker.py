@@ -0,0 +1,73 @@
+import logging
+import time
+from typing import Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+class Reranker:
+    """Переранжирование кандидатов CPU cross-encoder'ом с жёстким бюджетом времени.
+
+    Пары (вопрос, чанк) оцениваются небольшими батчами; если бюджет исчерпан
+    до конца оценки, возвращается исходный порядок FAISS/RRF, чтобы хвост
+    задержки оставался ограниченным.
+    """
+
+    def __init__(self, model_name: str, batch_size: int = 16, max_length: int = 256,
+                 backend: str = "torch", quantize: bool = False, onnx_file: str = ""):
+        # Импорт здесь: без реранкинга API не загружает sentence-transformers/torch
+        from sentence_transformers import CrossEncoder
+
+        self.batch_size = batch_size
+        if backend == "onnx":
+            # ONNX Runtime backend (sentence-transformers >= 4); int8-модель выбирается через onnx_file,
+            # например "onnx/model_qint8_avx512_vnni.onnx"
+            model_kwargs = {"file_name": onnx_file} if onnx_file else {}
+            self.model = CrossEncoder(model_name, max_length=max_length, device="cpu",
+                                      backend="onnx", model_kwargs=model_kwargs)
+        else:
+            self.model = CrossEncoder(model_name, max_length=max_length, device="cpu")
+            if quantize:
+                import torch
+                # Динамическая int8-квантизация линейных слоёв
+                self.model.model = torch.quantization.quantize_dynamic(
+                    self.model.model, {torch.nn.Linear}, dtype=torch.qint8
+                )
+        self.tokenizer = self.model.tokenizer
+
+    def count_tokens(self, text: str) -> int:
+        return len(self.tokenizer.encode(text, add_special_tokens=False))
+
+    def rerank(self, query: str, chunks: List[Dict], budget_ms: float) -> Tuple[List[Dict], bool]:
+        """Возвращает (чанки по убыванию релевантности, уложились ли в бюджет)"""
+        if not chunks:
+            return chunks, True
+        deadline = time.perf_counter() + budget_ms / 1000
+        scores: List[float] = []
+        for start in range(0, len(chunks), self.batch_size):
+            if time.perf_counter() > deadline:
+                logger.warning(f"Реранкинг не уложился в {budget_ms:.0f} мс "
+                               f"({len(scores)}/{len(chunks)} пар), используется порядок поиска")
+                return chunks, False
+            batch = chunks[start:start + self.batch_size]
+            pairs = [(query, chunk["chunk_text"]) for chunk in batch]
+            scores.extend(float(s) for s in self.model.predict(pairs, batch_size=len(pairs), show_progress_bar=False))
+
+        if time.perf_counter() > deadline:
+            logger.warning(f"Реранкинг не уложился в {budget_ms:.0f} мс, используется порядок поиска")
+            return chunks, False
+
+        order = sorted(range(len(chunks)), key=lambda i: scores[i], reverse=True)
+        return [chunks[i] for i in order], True
+
+    def select_within_budget(self, chunks: List[Dict], max_chunks: int, token_budget: int) -> List[Dict]:
+        """Лучшие чанки по порядку, пока их суммарная длина укладывается в token_budget"""
+        selected, used = [], 0
+        for chunk in chunks:
+            if len(selected) >= max_chunks:
+                break
+            tokens = self.count_tokens(chunk["chunk_text"])
+            if selected and used + tokens > token_budget:
+                continue
+            selected.append(chunk)
+            used += tokens
+        return selected
@@ -0,0 +1,83 @@
+import asyncio
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Hashable, List, Optional
+
+class _Broadcast:
+    """Буфер событий потока: каждый подписчик проигрывает его с начала и ждёт новые события"""
+
+    def __init__(self):
+        self.events: List[Any] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self._changed = asyncio.Event()
+
+    def notify(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def iterate(self) -> AsyncIterator[Any]:
+        i = 0
+        while True:
+            while i < len(self.events):
+                yield self.events[i]
+                i += 1
+            if self.done:
+                if self.error is not None:
+                    raise self.error
+                return
+            await self._changed.wait()
+
+class SingleFlight:
+    """Объединяет одновременные одинаковые запросы: работа выполняется один раз, результат получают все.
+
+    Работа идёт в отдельной задаче, поэтому отмена запроса, который её запустил (клиент
+    отключился), не прерывает ожидание остальных. Ключ освобождается сразу по завершении —
+    это не кэш, а только дедупликация запросов «в полёте».
+    """
+
+    def __init__(self, on_coalesced: Optional[Callable[[str], None]] = None):
+        self._calls: Dict[Hashable, asyncio.Task] = {}
+        self._streams: Dict[Hashable, _Broadcast] = {}
+        self._pumps = set()  # ссылки на фоновые задачи, чтобы их не собрал GC
+        self._on_coalesced = on_coalesced
+
+    def _coalesced(self, mode: str):
+        if self._on_coalesced is not None:
+            self._on_coalesced(mode)
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda _: self._calls.pop(key, None))
+        else:
+            self._coalesced("call")
+        return await asyncio.shield(task)
+
+    async def stream(self, key: Hashable, fn: Callable[[], AsyncIterator[Any]]) -> AsyncIterator[Any]:
+        broadcast = self._streams.get(key)
+        if broadcast is None:
+            broadcast = _Broadcast()
+            self._streams[key] = broadcast
+            pump = asyncio.ensure_future(self._pump(key, broadcast, fn))
+            self._pumps.add(pump)
+            pump.add_done_callback(self._pumps.discard)
+        else:
+            self._coalesced("stream")
+        async for event in broadcast.iterate():
+            yield event
+
+    async def _pump(self, key: Hashable, broadcast: _Broadcast, fn: Callable[[], AsyncIterator[Any]]):
+        try:
+            async for event in fn():
+                broadcast.events.append(event)
+                broadcast.notify()
+        except Exception as e:
+            broadcast.error = e
+        finally:
+            broadcast.done = True
+            broadcast.notify()
+            self._streams.pop(key, None)
+
+    def in_flight(self) -> int:
+        return len(self._calls) + len(self._streams)
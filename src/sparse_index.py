@@ -0,0 +1,143 @@
+"""
+Разреженный BM25-индекс с русским стеммингом.
+
+Постинги хранятся в CSR-виде (один файл .npz рядом с faiss.index):
+  terms_blob    — отсортированный словарь основ одной строкой UTF-8 (uint8);
+  terms_blob_offsets — границы основ в terms_blob в байтах (len = V + 1). Строковый массив
+                  numpy фиксированной ширины раздувался бы до длины самого длинного токена;
+  term_offsets  — начало постинг-листа каждого терма (len = V + 1);
+  postings_doc  — номера документов (int32), postings_tf — частоты (uint16);
+  doc_ids       — стабильные ID чанков (как в IndexIDMap), doc_len — длины документов.
+"""
+
+import os
+import re
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, Iterable, List, Tuple
+
+import numpy as np
+from nltk.stem.snowball import SnowballStemmer
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+_stemmer = SnowballStemmer("russian")
+
+@lru_cache(maxsize=200_000)
+def _stem(word: str) -> str:
+    return _stemmer.stem(word)
+
+def tokenize(text: str) -> List[str]:
+    """Слова в нижнем регистре, приведённые к основе. Числа и коды (номера ЗПИФ, формы) не стеммируются"""
+    tokens = []
+    for word in _WORD_RE.findall(text.lower().replace("ё", "е")):
+        tokens.append(word if any(ch.isdigit() for ch in word) else _stem(word))
+    return tokens
+
+def build_bm25(records: Iterable[Tuple[int, str]], path: Path):
+    """Строит индекс по парам (chunk_id, text) и атомарно записывает его в path"""
+    doc_ids, doc_len = [], []
+    postings: Dict[str, List[Tuple[int, int]]] = {}
+    for doc_no, (chunk_id, text) in enumerate(records):
+        tokens = tokenize(text)
+        doc_ids.append(chunk_id)
+        doc_len.append(len(tokens))
+        counts: Dict[str, int] = {}
+        for token in tokens:
+            counts[token] = counts.get(token, 0) + 1
+        for token, tf in counts.items():
+            postings.setdefault(token, []).append((doc_no, min(tf, 65535)))
+
+    terms = sorted(postings)
+    encoded = [term.encode("utf-8") for term in terms]
+    terms_blob_offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+    np.cumsum([len(term) for term in encoded], out=terms_blob_offsets[1:])
+    term_offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+    for i, term in enumerate(terms):
+        term_offsets[i + 1] = term_offsets[i] + len(postings[term])
+    postings_doc = np.empty(int(term_offsets[-1]), dtype=np.int32)
+    postings_tf = np.empty(int(term_offsets[-1]), dtype=np.uint16)
+    for i, term in enumerate(terms):
+        start, end = term_offsets[i], term_offsets[i + 1]
+        docs, tfs = zip(*postings[term])
+        postings_doc[start:end] = docs
+        postings_tf[start:end] = tfs
+
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "wb") as f:
+        np.savez(
+            f,
+            terms_blob=np.frombuffer(b"".join(encoded), dtype=np.uint8),
+            terms_blob_offsets=terms_blob_offsets,
+            term_offsets=term_offsets,
+            postings_doc=postings_doc,
+            postings_tf=postings_tf,
+            doc_ids=np.array(doc_ids, dtype=np.int64),
+            doc_len=np.array(doc_len, dtype=np.int32),
+        )
+    os.replace(tmp_path, path)
+
+def _load_terms(data) -> List[str]:
+    """Словарь из .npz; индексы старого формата хранят его строковым массивом terms"""
+    if "terms_blob" not in data:
+        return data["terms"].tolist()
+    blob = data["terms_blob"].tobytes()
+    offsets = data["terms_blob_offsets"].tolist()
+    return [blob[start:end].decode("utf-8") for start, end in zip(offsets, offsets[1:])]
+
+class BM25Index:
+    """Поиск по BM25: счёт накапливается только по постингам терминов запроса"""
+
+    def __init__(self, path: Path, k1: float = BM25_K1, b: float = BM25_B):
+        with np.load(path) as data:
+            terms = _load_terms(data)
+            self._term_offsets = data["term_offsets"]
+            self._postings_doc = data["postings_doc"]
+            self._postings_tf = data["postings_tf"].astype(np.float32)
+            self.doc_ids = data["doc_ids"]
+            doc_len = data["doc_len"].astype(np.float32)
+        self._vocab = {term: i for i, term in enumerate(terms)}
+        self.k1 = k1
+        n_docs = len(self.doc_ids)
+        avgdl = float(doc_len.mean()) if n_docs else 1.0
+        # Нормировка длины документа считается один раз при загрузке
+        self._norm = (k1 * (1 - b + b * doc_len / max(avgdl, 1e-9))).astype(np.float32)
+        df = np.diff(self._term_offsets).astype(np.float32)
+        self._idf = np.log(1 + (n_docs - df + 0.5) / (df + 0.5)).astype(np.float32)
+
+    def __len__(self) -> int:
+        return len(self.doc_ids)
+
+    def search(self, query: str, top_k: int) -> List[Tuple[int, float]]:
+        """Список (chunk_id, score) по убыванию релевантности"""
+        term_ids = {self._vocab[t] for t in tokenize(query) if t in self._vocab}
+        if not term_ids:
+            return []
+
+        docs_parts, score_parts = [], []
+        for term_id in term_ids:
+            start, end = self._term_offsets[term_id], self._term_offsets[term_id + 1]
+            docs = self._postings_doc[start:end]
+            tf = self._postings_tf[start:end]
+            docs_parts.append(docs)
+            score_parts.append(self._idf[term_id] * tf * (self.k1 + 1) / (tf + self._norm[docs]))
+
+        docs = np.concatenate(docs_parts)
+        unique_docs, inverse = np.unique(docs, return_inverse=True)
+        totals = np.zeros(len(unique_docs), dtype=np.float32)
+        np.add.at(totals, inverse, np.concatenate(score_parts))
+
+        k = min(top_k, len(unique_docs))
+        best = np.argpartition(-totals, k - 1)[:k]
+        best = best[np.argsort(-totals[best])]
+        return [(int(self.doc_ids[unique_docs[i]]), float(totals[i])) for i in best]
+
+def reciprocal_rank_fusion(rankings: List[List[int]], top_k: int, k: int = 60) -> List[int]:
+    """RRF: score(d) = sum 1 / (k + rank(d)) по всем спискам"""
+    fused: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking):
+            fused[doc_id] = fused.get(doc_id, 0.0) + 1.0 / (k + rank + 1)
+    return [doc_id for doc_id, _ in sorted(fused.items(), key=lambda item: item[1], reverse=True)[:top_k]]
@@ -1,23 +1,122 @@
 import os
 import sys
+import json
+import time
+import asyncio
 import logging
-import requests
+import httpx
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Any, Callable, Dict, Optional, Tuple
 from dotenv import load_dotenv
 from telegram import Update
-from telegram.ext import ApplicationBuilder, ContextTypes, MessageHandler, filters, CommandHandler
+from telegram.error import RetryAfter, TelegramError
+from telegram.ext import AIORateLimiter, ApplicationBuilder, ContextTypes, MessageHandler, filters, CommandHandler
 from telegram.helpers import escape_markdown
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
-from utils.logger import log_interaction
+from utils.logger import log_interaction, close_interaction_log
 from utils.filters import is_valid_query
 
 load_dotenv()
 
 TELEGRAM_TOKEN = os.getenv("TELEGRAM_TOKEN")
+# Адрес Bot API (например, локальный фейковый сервер для тестов); по умолчанию — api.telegram.org
+TELEGRAM_API_BASE_URL = os.getenv("TELEGRAM_API_BASE_URL")
 API_ENDPOINT = os.getenv("API_ENDPOINT", "http://localhost:8000/ask")
+API_STREAM_ENDPOINT = os.getenv("API_STREAM_ENDPOINT", API_ENDPOINT.rstrip("/") + "/stream")
+# Telegram ограничивает частоту правок сообщения: обновляем черновик не чаще раза в STREAM_EDIT_INTERVAL секунд
+STREAM_EDIT_INTERVAL = float(os.getenv("STREAM_EDIT_INTERVAL", "1.0"))
+API_TIMEOUT = httpx.Timeout(30, read=60)
+TELEGRAM_MESSAGE_LIMIT = 4096
+PLACEHOLDER_TEXT = "⏳ Ищу ответ…"
+BUSY_TEXT = "⏳ Сейчас много вопросов, ищу ответ… (в очереди: {waiting})"
+
+# Пул keep-alive соединений к API
+API_MAX_CONNECTIONS = int(os.getenv("BOT_API_MAX_CONNECTIONS", "32"))
+# Сколько апдейтов Telegram обрабатывается параллельно
+BOT_CONCURRENT_UPDATES = int(os.getenv("BOT_CONCURRENT_UPDATES", "64"))
+# Одновременных запросов к API, остальные ждут в очереди длиной до BOT_MAX_QUEUE
+BOT_MAX_CONCURRENT_REQUESTS = int(os.getenv("BOT_MAX_CONCURRENT_REQUESTS", "16"))
+BOT_MAX_QUEUE = int(os.getenv("BOT_MAX_QUEUE", "200"))
+# С какой длины очереди показывать пользователю, что ответ задержится
+BOT_BUSY_QUEUE_THRESHOLD = int(os.getenv("BOT_BUSY_QUEUE_THRESHOLD", "5"))
+# Вопросов одного пользователя в обработке одновременно
+BOT_PER_USER_INFLIGHT = int(os.getenv("BOT_PER_USER_INFLIGHT", "1"))
+# Общий лимит запросов к Bot API (AIORateLimiter): правки черновиков многих чатов не упираются в 429
+BOT_RATE_LIMITER = os.getenv("BOT_RATE_LIMITER", "1") == "1"
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+class QueueFull(Exception):
+    pass
+
+class RequestLimiter:
+    """Глобальный лимит одновременных запросов к API с ограниченной очередью и лимит на пользователя"""
+
+    def __init__(self, max_concurrent: int, max_queue: int, per_user: int):
+        self.max_queue = max_queue
+        self.per_user = per_user
+        self.waiting = 0
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+        self._inflight: Dict[int, int] = defaultdict(int)
+
+    def is_busy(self) -> bool:
+        return self._semaphore.locked()
+
+    def try_acquire_user(self, user_id: int) -> bool:
+        if self._inflight[user_id] >= self.per_user:
+            return False
+        self._inflight[user_id] += 1
+        return True
+
+    def release_user(self, user_id: int):
+        self._inflight[user_id] -= 1
+        if self._inflight[user_id] <= 0:
+            del self._inflight[user_id]
+
+    @asynccontextmanager
+    async def slot(self):
+        """Ждёт свободный слот; если очередь уже полна — QueueFull"""
+        if self.is_busy() and self.waiting >= self.max_queue:
+            raise QueueFull()
+        self.waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        try:
+            yield
+        finally:
+            self._semaphore.release()
+
+limiter = RequestLimiter(BOT_MAX_CONCURRENT_REQUESTS, BOT_MAX_QUEUE, BOT_PER_USER_INFLIGHT)
+
+# Общий клиент API с пулом keep-alive соединений
+_api_client: Optional[httpx.AsyncClient] = None
+
+def get_api_client() -> httpx.AsyncClient:
+    """Возвращает общий httpx.AsyncClient, создавая его при первом обращении"""
+    global _api_client
+    if _api_client is None or _api_client.is_closed:
+        _api_client = httpx.AsyncClient(
+            timeout=API_TIMEOUT,
+            limits=httpx.Limits(max_connections=API_MAX_CONNECTIONS, max_keepalive_connections=API_MAX_CONNECTIONS),
+        )
+    return _api_client
+
+async def close_api_client(app=None):
+    """Закрывает пул соединений"""
+    global _api_client
+    if _api_client is not None and not _api_client.is_closed:
+        await _api_client.aclose()
+    _api_client = None
+
+async def on_shutdown(app):
+    await close_api_client()
+    # Дописываем журнал запросов из очереди
+    close_interaction_log()
+
 async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     welcome_text = (
         "*Добро пожаловать в SFN Chatbot!*\n\n"
@@ -32,6 +131,25 @@ async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     safe_welcome_text = escape_markdown(welcome_text, version=2)
     await update.message.reply_markdown_v2(safe_welcome_text)
 
+async def iter_sse(response: httpx.Response):
+    """Разбирает поток Server-Sent Events на пары (event, data)"""
+    event, data = "message", []
+    async for line in response.aiter_lines():
+        if not line:
+            if data:
+                yield event, json.loads("\n".join(data))
+            event, data = "message", []
+        elif line.startswith("event:"):
+            event = line[len("event:"):].strip()
+        elif line.startswith("data:"):
+            data.append(line[len("data:"):].strip())
+
+def format_reply(answer: str, sources: list) -> str:
+    escaped_answer = escape_markdown(answer, version=2)
+    escaped_sources = [escape_markdown(s["url"], version=2) for s in sources]
+    source_text = "\n".join([f"🔗 {s}" for s in escaped_sources]) if sources else ""
+    return f"*Ответ:*\n{escaped_answer}\n\n*Источники:*\n{source_text}"
+
 # === Обработка запроса ===
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.message.text.strip()
@@ -44,38 +162,119 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("Пожалуйста, сформулируйте более конкретный вопрос.")
         return
 
+    user_id = update.effective_user.id
+    if not limiter.try_acquire_user(user_id):
+        await update.message.reply_text("Я ещё отвечаю на ваш предыдущий вопрос, подождите немного.")
+        return
+
     try:
-        response = requests.get(API_ENDPOINT, params={"query": query}, timeout=30)
+        # Черновик сразу, дальше — правки по мере генерации ответа
+        busy = limiter.is_busy() and limiter.waiting >= BOT_BUSY_QUEUE_THRESHOLD
+        placeholder = await update.message.reply_text(
+            BUSY_TEXT.format(waiting=limiter.waiting + 1) if busy else PLACEHOLDER_TEXT
+        )
+        try:
+            async with limiter.slot():
+                await answer_into_message(query, placeholder, user_id)
+        except QueueFull:
+            logger.warning(f"Очередь запросов переполнена ({limiter.waiting}), вопрос отклонён")
+            await placeholder.edit_text("Сейчас слишком много вопросов. Попробуйте через минуту.")
+    finally:
+        limiter.release_user(user_id)
+
+async def api_answer_events(query: str) -> AsyncIterator[Tuple[str, Any]]:
+    """События ответа (sources/token/done/error) из /ask/stream по HTTP"""
+    async with get_api_client().stream("GET", API_STREAM_ENDPOINT, params={"query": query}) as response:
         response.raise_for_status()
-        data = response.json()
+        async for event, data in iter_sse(response):
+            yield event, data
+
+# Источник ответов: по умолчанию HTTP API; в режиме вебхука внутри FastAPI — пайплайн того же процесса
+answer_source: Callable[[str], AsyncIterator[Tuple[str, Any]]] = api_answer_events
+
+async def edit_draft(placeholder, text: str) -> float:
+    """Промежуточная правка черновика — без гарантии: ошибка Telegram не должна терять сам ответ.
+
+    Возвращает, сколько секунд подождать до следующей правки (RetryAfter), иначе 0.
+    """
+    try:
+        await placeholder.edit_text(text)
+    except RetryAfter as e:
+        # retry_after — число секунд или timedelta, в зависимости от версии python-telegram-bot
+        pause = e.retry_after.total_seconds() if hasattr(e.retry_after, "total_seconds") else float(e.retry_after)
+        logger.warning(f"Telegram ограничил частоту правок, пауза {pause:.0f} с")
+        return pause
+    except TelegramError as e:
+        logger.warning(f"Не удалось обновить черновик ответа: {e}")
+    return 0.0
 
-        answer = data.get("answer", "Нет ответа.")
-        sources = data.get("sources", [])
-        escaped_answer = escape_markdown(answer, version=2)
-        escaped_sources = [escape_markdown(s["url"], version=2) for s in sources]
-        source_text = "\n".join([f"🔗 {s}" for s in escaped_sources]) if sources else ""
+async def answer_into_message(query: str, placeholder, user_id: int):
+    """Получает ответ потоком и постепенно дописывает его в сообщение-черновик"""
+    try:
+        answer, sources, result = "", [], None
+        shown, next_edit = placeholder.text, 0.0
+        async for event, data in answer_source(query):
+            if event == "sources":
+                sources = data
+            elif event == "token":
+                answer += data
+                draft = answer[:TELEGRAM_MESSAGE_LIMIT]
+                if draft.strip() and draft != shown and time.monotonic() >= next_edit:
+                    pause = await edit_draft(placeholder, draft)
+                    shown, next_edit = draft, time.monotonic() + max(STREAM_EDIT_INTERVAL, pause)
+            elif event == "done":
+                result = data
+            elif event == "error":
+                raise RuntimeError(data.get("detail", "ошибка API"))
 
-        reply = f"*Ответ:*\n{escaped_answer}\n\n*Источники:*\n{source_text}"
+        if result is None:
+            raise RuntimeError("Поток ответа прервался")
+        answer, sources = result["answer"] or "Нет ответа.", result["sources"]
         log_interaction(
             query=query,
             answer=answer,
             sources=[s["url"] for s in sources],
             source="telegram",
-            user_id=update.effective_user.id
+            user_id=user_id
         )
-        await update.message.reply_markdown_v2(reply)
+        await placeholder.edit_text(format_reply(answer, sources), parse_mode="MarkdownV2")
     except Exception as e:
         logger.exception("Ошибка при обработке запроса")
-        await update.message.reply_text("Произошла ошибка при получении ответа. Попробуйте позже.")
+        try:
+            await placeholder.edit_text("Произошла ошибка при получении ответа. Попробуйте позже.")
+        except TelegramError as edit_error:
+            logger.error(f"Не удалось сообщить пользователю об ошибке: {edit_error}")
+
+def build_application(token: str, polling: bool = True):
+    """Собирает приложение бота; polling=False — без Updater, апдейты приходят через вебхук"""
+    builder = (
+        ApplicationBuilder()
+        .token(token)
+        # concurrent_updates: медленный ответ одному пользователю не задерживает остальных
+        .concurrent_updates(BOT_CONCURRENT_UPDATES)
+        .post_shutdown(on_shutdown)
+    )
+    if TELEGRAM_API_BASE_URL:
+        base_url = TELEGRAM_API_BASE_URL.rstrip("/")
+        builder = builder.base_url(f"{base_url}/bot").base_file_url(f"{base_url}/file/bot")
+    if not polling:
+        builder = builder.updater(None)
+    if BOT_RATE_LIMITER:
+        try:
+            # Ждёт и повторяет запрос при RetryAfter вместо ошибки
+            builder = builder.rate_limiter(AIORateLimiter(max_retries=2))
+        except RuntimeError as e:
+            logger.warning(f"AIORateLimiter недоступен (pip install \"python-telegram-bot[rate-limiter]\"): {e}")
+    app = builder.build()
+    app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
+    app.add_handler(CommandHandler("start", start_command))
+    return app
 
-# === Запуск бота ===
+# === Запуск бота (long polling, для разработки) ===
 if __name__ == "__main__":
     if not TELEGRAM_TOKEN:
         raise RuntimeError("Не найден TELEGRAM_TOKEN в .env")
 
-    app = ApplicationBuilder().token(TELEGRAM_TOKEN).build()
-    app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
-
+    app = build_application(TELEGRAM_TOKEN)
     logger.info("Telegram-бот запущен")
-    app.add_handler(CommandHandler("start", start_command))
     app.run_polling()
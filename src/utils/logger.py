@@ -1,11 +1,213 @@
 import os
 import json
+import gzip
+import time
+import queue
+import atexit
+import shutil
+import logging
+import threading
+from contextlib import contextmanager
 from pathlib import Path
 from datetime import datetime
+from typing import List, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: блокировка между процессами недоступна, один процесс-писатель
+    fcntl = None
+
+logger = logging.getLogger(__name__)
 
 LOG_FILE = Path("logs/queries.jsonl")
 LOG_FILE.parent.mkdir(parents=True, exist_ok=True)
 
+# Запись идёт в фоновом потоке: log_interaction только кладёт запись в очередь
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+LOG_BATCH_SIZE = int(os.getenv("LOG_BATCH_SIZE", "256"))
+LOG_FLUSH_INTERVAL = float(os.getenv("LOG_FLUSH_INTERVAL", "1.0"))  # секунды
+# При переполнении очереди: drop — запись отбрасывается (задержка запроса не растёт),
+# block — запрос ждёт места в очереди (не теряем записи ценой задержки)
+LOG_OVERFLOW_POLICY = os.getenv("LOG_OVERFLOW_POLICY", "drop")
+# Ротация: по размеру и/или по возрасту файла; старые файлы сжимаются в .jsonl.gz
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", str(100 * 1024 * 1024)))
+LOG_ROTATE_INTERVAL = float(os.getenv("LOG_ROTATE_INTERVAL", str(24 * 3600)))  # секунды, 0 — не по времени
+LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", "30"))  # 0 — хранить все архивы
+
+def _first_entry_time(path: Path) -> float:
+    """Время первой записи файла — от него отсчитывается возраст для ротации"""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return datetime.fromisoformat(json.loads(f.readline())["timestamp"]).timestamp()
+    except (OSError, ValueError, KeyError):
+        return time.time()
+
+class InteractionLogWriter:
+    """Фоновая пакетная запись JSONL с ограниченной очередью и ротацией.
+
+    В файл могут писать несколько процессов (воркеры uvicorn, бот): запись пачки и ротация
+    выполняются под файловой блокировкой <файл>.lock, а перед записью писатель проверяет,
+    что путь всё ещё указывает на открытый им файл (как WatchedFileHandler), и переоткрывает
+    его, если ротацию сделал другой процесс.
+    """
+
+    def __init__(self, path: Path, queue_size: int = LOG_QUEUE_SIZE, batch_size: int = LOG_BATCH_SIZE,
+                 flush_interval: float = LOG_FLUSH_INTERVAL, overflow_policy: str = LOG_OVERFLOW_POLICY,
+                 max_bytes: int = LOG_MAX_BYTES, rotate_interval: float = LOG_ROTATE_INTERVAL,
+                 backup_count: int = LOG_BACKUP_COUNT):
+        if overflow_policy not in ("drop", "block"):
+            raise ValueError(f"Неизвестная политика переполнения: {overflow_policy}")
+        self.path = Path(path)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.overflow_policy = overflow_policy
+        self.max_bytes = max_bytes
+        self.rotate_interval = rotate_interval
+        self.backup_count = backup_count
+        self.dropped = 0
+        self._queue: "queue.Queue[Optional[str]]" = queue.Queue(maxsize=queue_size)
+        self._closed = False
+        self._file = None
+        self._lock_file = None
+        self._opened_at = 0.0
+        self._thread = threading.Thread(target=self._run, name="interaction-log-writer", daemon=True)
+        self._thread.start()
+
+    def write(self, entry: dict):
+        if self._closed:
+            return
+        line = json.dumps(entry, ensure_ascii=False) + "\n"
+        if self.overflow_policy == "block":
+            self._queue.put(line)
+            return
+        try:
+            self._queue.put_nowait(line)
+        except queue.Full:
+            self.dropped += 1
+            if self.dropped == 1 or self.dropped % 1000 == 0:
+                logger.warning(f"Очередь журнала переполнена, отброшено записей: {self.dropped}")
+
+    def close(self, timeout: float = 10.0):
+        """Дописывает всё, что в очереди, и закрывает файл"""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+    def _open(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        exists = self.path.exists() and self.path.stat().st_size > 0
+        self._opened_at = _first_entry_time(self.path) if exists else time.time()
+        self._file = open(self.path, "a", encoding="utf-8")
+
+    @contextmanager
+    def _locked(self):
+        if fcntl is None:
+            yield
+            return
+        if self._lock_file is None:
+            self._lock_file = open(self.path.with_name(self.path.name + ".lock"), "a")
+        fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+
+    def _reopen_if_rotated(self):
+        """Файл переименован другим процессом — пишем в новый, а не в уходящий в архив"""
+        if self._file.closed:  # предыдущая ротация прервалась ошибкой
+            self._open()
+            return
+        try:
+            st = os.stat(self.path)
+            on_disk = (st.st_dev, st.st_ino)
+        except FileNotFoundError:
+            on_disk = None
+        opened = os.fstat(self._file.fileno())
+        if on_disk != (opened.st_dev, opened.st_ino):
+            self._file.close()
+            self._open()
+
+    def _should_rotate(self) -> bool:
+        # Размер по самому файлу, а не tell(): в него пишут и другие процессы
+        size = os.fstat(self._file.fileno()).st_size
+        if size == 0:
+            return False
+        if self.max_bytes > 0 and size >= self.max_bytes:
+            return True
+        return self.rotate_interval > 0 and time.time() - self._opened_at >= self.rotate_interval
+
+    def _rotate(self):
+        self._file.close()
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+        rotated = self.path.with_name(f"{self.path.stem}-{stamp}{self.path.suffix}")
+        os.replace(self.path, rotated)
+        with open(rotated, "rb") as src, gzip.open(rotated.with_name(rotated.name + ".gz"), "wb") as dst:
+            shutil.copyfileobj(src, dst)
+        rotated.unlink()
+        self._prune_backups()
+        self._open()
+
+    def _prune_backups(self):
+        if self.backup_count <= 0:
+            return
+        backups = sorted(self.path.parent.glob(f"{self.path.stem}-*{self.path.suffix}.gz"))
+        for old in backups[:-self.backup_count]:
+            old.unlink(missing_ok=True)
+
+    def _run(self):
+        self._open()
+        stop = False
+        while not stop:
+            batch: List[str] = []
+            try:
+                item = self._queue.get(timeout=self.flush_interval)
+                while True:
+                    if item is None:
+                        stop = True
+                        break
+                    batch.append(item)
+                    if len(batch) >= self.batch_size:
+                        break
+                    item = self._queue.get_nowait()
+            except queue.Empty:
+                pass
+            try:
+                with self._locked():
+                    self._reopen_if_rotated()
+                    if batch:
+                        self._file.write("".join(batch))
+                        self._file.flush()
+                    if self._should_rotate():
+                        self._rotate()
+            except OSError as e:
+                logger.error(f"Не удалось записать журнал запросов ({len(batch)} записей потеряно): {e}")
+        self._file.close()
+        if self._lock_file is not None:
+            self._lock_file.close()
+
+_writer: Optional[InteractionLogWriter] = None
+_writer_lock = threading.Lock()
+
+def get_log_writer() -> InteractionLogWriter:
+    """Возвращает общий фоновый писатель журнала, запуская его при первом обращении"""
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = InteractionLogWriter(LOG_FILE)
+                atexit.register(close_interaction_log)
+    return _writer
+
+def close_interaction_log():
+    """Сбрасывает очередь на диск (вызывается при остановке API и бота)"""
+    global _writer
+    with _writer_lock:
+        if _writer is not None:
+            _writer.close()
+            _writer = None
+
 def log_interaction(query: str, answer: str, sources: list, source: str = "api", user_id: str = None):
     log_entry = {
         "timestamp": datetime.now().isoformat(),
@@ -15,5 +217,4 @@ def log_interaction(query: str, answer: str, sources: list, source: str = "api",
         "source": source,
         "user_id": user_id
     }
-    with open(LOG_FILE, "a", encoding="utf-8") as f:
-        f.write(json.dumps(log_entry, ensure_ascii=False) + "\n")
\ No newline at end of file
+    get_log_writer().write(log_entry)
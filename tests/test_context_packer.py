@@ -0,0 +1,27 @@
+"""
+Проверки списка источников ответа.
+
+    python -m pytest tests
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src")))
+
+from context_packer import format_sources  # noqa: E402
+
+def test_sources_include_all_urls_of_collapsed_group():
+    chunks = [
+        {"source_url": "https://sfn-am.ru/a", "source_urls": ["https://sfn-am.ru/a", "https://sfn-am.ru/b"],
+         "timestamp": "t1"},
+        {"source_url": "https://sfn-am.ru/c", "timestamp": "t2"},
+        {"source_url": "https://sfn-am.ru/b", "source_urls": ["https://sfn-am.ru/b", "https://sfn-am.ru/c"],
+         "timestamp": "t3"},
+    ]
+
+    assert format_sources(chunks) == [
+        {"url": "https://sfn-am.ru/a", "timestamp": "t1"},
+        {"url": "https://sfn-am.ru/b", "timestamp": "t1"},
+        {"url": "https://sfn-am.ru/c", "timestamp": "t2"},
+    ]
@@ -0,0 +1,276 @@
+"""
+Проверки клиента GigaChat против локального mock-сервера GigaChat/OAuth (httpx.MockTransport).
+
+    python -m pytest tests
+"""
+
+import asyncio
+import json
+import os
+import sys
+import time
+
+import httpx
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src")))
+os.environ.setdefault("GIGACHAT_AUTH_KEY", "Basic test")
+
+import llm_client_gigachat as gigachat  # noqa: E402
+from llm_client_gigachat import CircuitBreaker, GigaChatClient, GigaChatError  # noqa: E402
+
+OAUTH_URL = "https://oauth.test/api/v2/oauth"
+API_URL = "https://gigachat.test/api/v1/chat/completions"
+
+class MockGigaChat:
+    """Mock-сервер: выдаёт токены и отвечает на chat/completions по сценарию теста"""
+
+    def __init__(self, completions):
+        self.completions = completions  # (request, token) -> httpx.Response
+        self.oauth_calls = 0
+        self.api_calls = 0
+        self.tokens = []
+
+    async def handler(self, request: httpx.Request) -> httpx.Response:
+        if str(request.url) == OAUTH_URL:
+            self.oauth_calls += 1
+            await asyncio.sleep(0.01)
+            token = f"token-{self.oauth_calls}"
+            self.tokens.append(token)
+            return httpx.Response(200, json={"access_token": token, "expires_at": int((time.time() + 1800) * 1000)})
+        self.api_calls += 1
+        token = request.headers["Authorization"].removeprefix("Bearer ")
+        return await self.completions(request, token)
+
+class _Stream(httpx.AsyncByteStream):
+    """Тело SSE-ответа; error — исключение после отправки всех частей"""
+
+    def __init__(self, parts, error=None):
+        self.parts = parts
+        self.error = error
+
+    async def __aiter__(self):
+        for part in self.parts:
+            yield part
+        if self.error is not None:
+            raise self.error
+
+def _sse(*deltas, done=True):
+    lines = [f"data: {json.dumps({'choices': [{'delta': {'content': d}}]})}\n\n".encode() for d in deltas]
+    return lines + ([b"data: [DONE]\n\n"] if done else [])
+
+def _answer(text):
+    return httpx.Response(200, json={"choices": [{"message": {"role": "assistant", "content": text}}]})
+
+def _client(server: MockGigaChat, **kwargs) -> GigaChatClient:
+    client = GigaChatClient(auth_key="Basic test", oauth_url=OAUTH_URL, api_url=API_URL,
+                            allowed_hosts={"oauth.test", "gigachat.test"}, **kwargs)
+    client._http = httpx.AsyncClient(transport=httpx.MockTransport(server.handler))
+    return client
+
+async def _collect(client: GigaChatClient):
+    return [delta async for delta in client.stream("вопрос", "контекст")]
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(gigachat, "backoff_delay", lambda *args, **kwargs: 0)
+
+def test_token_single_flight():
+    async def completions(request, token):
+        return _answer("ок")
+
+    server = MockGigaChat(completions)
+
+    async def run():
+        client = _client(server)
+        try:
+            return await asyncio.gather(*(client.complete("вопрос", "контекст") for _ in range(10)))
+        finally:
+            await client.aclose()
+
+    assert asyncio.run(run()) == ["ок"] * 10
+    assert server.oauth_calls == 1
+
+def test_retry_on_503():
+    async def completions(request, token):
+        return httpx.Response(503) if server.api_calls < 3 else _answer("ок")
+
+    server = MockGigaChat(completions)
+
+    async def run():
+        client = _client(server, max_retries=3)
+        try:
+            return await client.complete("вопрос", "контекст")
+        finally:
+            await client.aclose()
+
+    assert asyncio.run(run()) == "ок"
+    assert server.api_calls == 3
+
+def test_breaker_opens_after_failures():
+    async def completions(request, token):
+        return httpx.Response(503)
+
+    server = MockGigaChat(completions)
+
+    async def run():
+        client = _client(server, max_retries=1, breaker=CircuitBreaker(threshold=4, reset_timeout=60))
+        try:
+            for _ in range(2):
+                with pytest.raises(httpx.HTTPStatusError):
+                    await client.complete("вопрос", "контекст")
+            assert client.breaker.state == "open"
+            calls = server.api_calls
+            with pytest.raises(GigaChatError):
+                await client.complete("вопрос", "контекст")
+            assert server.api_calls == calls  # разомкнутый breaker не пускает запрос к сервису
+        finally:
+            await client.aclose()
+
+    asyncio.run(run())
+
+def test_stream_refreshes_token_without_deadlock():
+    """401 у max_concurrency потоков одновременно: обновление токена не должно ждать занятых ими слотов"""
+
+    async def completions(request, token):
+        if token == server.tokens[0]:
+            return httpx.Response(401)
+        return httpx.Response(200, stream=_Stream(_sse("Привет", "!")))
+
+    server = MockGigaChat(completions)
+
+    async def run():
+        client = _client(server, max_concurrency=2)
+        try:
+            await client.get_token()
+            return await asyncio.wait_for(asyncio.gather(_collect(client), _collect(client)), timeout=5)
+        finally:
+            await client.aclose()
+
+    assert asyncio.run(run()) == [["Привет", "!"], ["Привет", "!"]]
+    assert server.oauth_calls == 2
+
+def test_stream_not_retried_after_first_delta():
+    async def completions(request, token):
+        return httpx.Response(200, stream=_Stream(_sse("Hello ", done=False), error=httpx.ReadError("обрыв")))
+
+    server = MockGigaChat(completions)
+    received = []
+
+    async def run():
+        client = _client(server, max_retries=2)
+        try:
+            async for delta in client.stream("вопрос", "контекст"):
+                received.append(delta)
+        finally:
+            await client.aclose()
+
+    with pytest.raises(httpx.ReadError):
+        asyncio.run(run())
+    assert received == ["Hello "]
+    assert server.api_calls == 1
+
+def test_stream_retries_connection_errors_before_first_delta():
+    async def completions(request, token):
+        if server.api_calls == 1:
+            raise httpx.ConnectError("нет соединения")
+        return httpx.Response(200, stream=_Stream(_sse("ок")))
+
+    server = MockGigaChat(completions)
+
+    async def run():
+        client = _client(server, max_retries=2)
+        try:
+            return await _collect(client)
+        finally:
+            await client.aclose()
+
+    assert asyncio.run(run()) == ["ок"]
+    assert server.api_calls == 2
+
+def test_stream_wrapper_signals_interrupted_answer(monkeypatch):
+    async def completions(request, token):
+        return httpx.Response(200, stream=_Stream(_sse("Hello ", done=False), error=httpx.ReadError("обрыв")))
+
+    server = MockGigaChat(completions)
+    client = _client(server, max_retries=0)
+    monkeypatch.setattr(gigachat, "_client", client)
+    received = []
+
+    async def run():
+        try:
+            async for delta in gigachat.stream_answer_with_gigachat_async("вопрос", "контекст"):
+                received.append(delta)
+        finally:
+            await client.aclose()
+
+    with pytest.raises(gigachat.StreamInterrupted):
+        asyncio.run(run())
+    assert received == ["Hello "]
+
+def test_breaker_recovers_after_cancelled_trial():
+    """Пробный запрос в half-open отменён (wait_for) — breaker не должен остаться разомкнутым навсегда"""
+    mode = {"value": "fail"}
+
+    async def completions(request, token):
+        if mode["value"] == "fail":
+            return httpx.Response(503)
+        if mode["value"] == "hang":
+            await asyncio.sleep(5)
+        return _answer("ок")
+
+    server = MockGigaChat(completions)
+
+    async def run():
+        client = _client(server, max_retries=0, breaker=CircuitBreaker(threshold=1, reset_timeout=0.05))
+        try:
+            with pytest.raises(httpx.HTTPStatusError):
+                await client.complete("вопрос", "контекст")
+            await asyncio.sleep(0.06)
+            mode["value"] = "hang"
+            with pytest.raises(asyncio.TimeoutError):
+                await asyncio.wait_for(client.complete("вопрос", "контекст"), timeout=0.05)
+            mode["value"] = "ok"
+            return await client.complete("вопрос", "контекст")
+        finally:
+            await client.aclose()
+
+    assert asyncio.run(run()) == "ок"
+
+def test_breaker_recovers_after_cancelled_stream_trial():
+    mode = {"value": "fail"}
+
+    async def completions(request, token):
+        if mode["value"] == "fail":
+            return httpx.Response(503)
+        if mode["value"] == "hang":
+            await asyncio.sleep(5)
+        return httpx.Response(200, stream=_Stream(_sse("раз", "два")))
+
+    server = MockGigaChat(completions)
+
+    async def run():
+        client = _client(server, max_retries=0, breaker=CircuitBreaker(threshold=1, reset_timeout=0.05))
+        try:
+            with pytest.raises(httpx.HTTPStatusError):
+                await _collect(client)
+            await asyncio.sleep(0.06)
+            mode["value"] = "hang"
+            # Пробный поток отменён до ответа сервиса (клиент отключился)
+            with pytest.raises(asyncio.TimeoutError):
+                await asyncio.wait_for(_collect(client), timeout=0.05)
+            mode["value"] = "ok"
+            return await _collect(client)
+        finally:
+            await client.aclose()
+
+    assert asyncio.run(run()) == ["раз", "два"]
+
+def test_stale_trial_expires():
+    breaker = CircuitBreaker(threshold=1, reset_timeout=0.05)
+    breaker.record_failure()
+    time.sleep(0.06)
+    assert breaker.allow()          # пробный запрос, результат которого так и не записан
+    assert not breaker.allow()
+    time.sleep(0.06)
+    assert breaker.allow()